@@ -0,0 +1,202 @@
+# batch_coalescer.py
+"""
+同一工作流只改种子的连续提交合并为一个批次：短时间窗口内，结构和参数完全相同、
+只有种子（和 batch_size）不同的提交，合并成一次 batch_size 更大的 /prompt，
+省去每个 prompt 的图加载与调度开销。执行结果按批次下标拆分回各自的提交者。
+
+ComfyUI 对整个批次的 latent 只用一个种子生成噪声，批次中第 i 张图与单独用任何种子
+提交的结果都不相同，因此只合并种子全部为随机（-1）的提交；指定了种子的提交单独提交，
+保证可复现。每个成员的 task_submitted / executed 消息附带其批次下标。
+"""
+import copy
+import json
+import time
+import hashlib
+import logging
+from threading import Thread, Lock
+
+logger = logging.getLogger(__name__)
+
+# 参与合并时忽略的种子输入名
+SEED_INPUTS = ("seed", "noise_seed")
+# 插件用 -1 表示随机种子
+RANDOM_SEED = -1
+
+
+def batch_signature(workflow):
+    """(signature, batch_size) for a workflow that can be batched, else None.
+
+    Eligible workflows have exactly one node with an integer batch_size input (the latent source);
+    the signature covers everything except literal seeds and that batch_size."""
+    latent_nodes = [
+        node_id for node_id, node in workflow.items()
+        if isinstance(node, dict) and isinstance(node.get("inputs", {}).get("batch_size"), int)
+    ]
+    if len(latent_nodes) != 1:
+        return None
+    batch_size = workflow[latent_nodes[0]]["inputs"]["batch_size"]
+    stripped = {}
+    for node_id, node in workflow.items():
+        inputs = dict(node.get("inputs", {}))
+        for name in SEED_INPUTS:
+            # 连线输入（[node_id, index]）属于图结构，保留参与比较
+            if isinstance(inputs.get(name), (int, float)):
+                inputs[name] = None
+        if node_id == latent_nodes[0]:
+            inputs["batch_size"] = None
+        stripped[node_id] = {**node, "inputs": inputs}
+    digest = hashlib.sha1(json.dumps(stripped, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return digest.hexdigest(), batch_size
+
+
+def batch_seeds(workflow):
+    """Literal seed values of a workflow, in node order."""
+    return tuple(
+        node["inputs"][name]
+        for node_id, node in sorted(workflow.items())
+        if isinstance(node, dict)
+        for name in SEED_INPUTS
+        if isinstance(node.get("inputs", {}).get(name), (int, float)) and not isinstance(node["inputs"][name], bool)
+    )
+
+
+def seeds_random(seeds):
+    """True if every literal seed asks for a random one, i.e. the commit does not expect a reproducible image."""
+    return bool(seeds) and all(seed == RANDOM_SEED for seed in seeds)
+
+
+def merge_batch(workflow, total):
+    """Copy of workflow with its batch_size input raised to total."""
+    merged = copy.deepcopy(workflow)
+    for node in merged.values():
+        if isinstance(node, dict) and isinstance(node.get("inputs", {}).get("batch_size"), int):
+            node["inputs"]["batch_size"] = total
+    return merged
+
+
+def split_output(output, start, count, total):
+    """Slice a node's output (e.g. {"images": [...]}) down to one member's share of the batch."""
+    if not isinstance(output, dict):
+        return output
+    return {
+        key: value[start:start + count] if isinstance(value, list) and len(value) == total else value
+        for key, value in output.items()
+    }
+
+
+def split_message(message, members, total=None):
+    """Rewrite one ComfyUI message about a batch into one message per member [prompt_id, client_id, start, count].
+
+    total is the batch size of the prompt; members detached after submission still occupy their positions."""
+    if total is None:
+        total = max(start + count for _prompt_id, _client_id, start, count in members)
+    for prompt_id, _client_id, start, count in members:
+        data = dict(message.get("data") or {}, prompt_id=prompt_id)
+        if message.get("type") == "executed":
+            data["batch_index"] = start
+            if "output" in data:
+                data["output"] = split_output(data["output"], start, count, total)
+        yield {**message, "data": data}
+
+
+class CoalescedCommit:
+    __slots__ = (
+        "prompt_id", "client_id", "workflow_id", "workflow", "batch_size", "total_nodes", "priority", "seeds", "probe",
+    )
+
+    def __init__(self, prompt_id, client_id, workflow_id, workflow, batch_size, total_nodes, priority=1, probe=False):
+        self.prompt_id = prompt_id
+        self.client_id = client_id
+        self.workflow_id = workflow_id
+        self.workflow = workflow
+        self.batch_size = batch_size
+        self.total_nodes = total_nodes
+        self.priority = priority
+        self.seeds = batch_seeds(workflow)
+        # 该提交持有后端熔断器的 half_open 探测名额
+        self.probe = probe
+
+
+class BatchCoalescer:
+    def __init__(self, flush, window=0.5, max_batch=8):
+        # flush(backend, commits) 在窗口结束或批次满时调用，commits 按到达顺序排列
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self.groups = {}
+        self.lock = Lock()
+        self.commits = 0
+        self.batches = 0
+        self.coalesced = 0
+
+    def add(self, backend, signature, commit):
+        key = (backend, signature)
+        ready = []
+        with self.lock:
+            self.commits += 1
+            group = self.groups.get(key)
+            if not seeds_random(commit.seeds):
+                # 指定了种子：合并后拿到的图与单独提交不同，单独提交
+                ready.append([commit])
+                commit = None
+            elif group is not None and sum(c.batch_size for c in group) + commit.batch_size > self.max_batch:
+                # 放不下：已有分组先提交，新提交另起一组
+                ready.append(self.groups.pop(key))
+                group = None
+            if commit is not None:
+                if group is None:
+                    group = self.groups[key] = [commit]
+                    Thread(target=self._expire, args=(key, group), daemon=True).start()
+                else:
+                    group.append(commit)
+                if sum(c.batch_size for c in group) >= self.max_batch:
+                    ready.append(self.groups.pop(key))
+        for group in ready:
+            self._flush(backend, group)
+
+    def remove(self, prompt_id):
+        """Drop a commit still inside its coalescing window; returns False if it was already flushed."""
+        with self.lock:
+            for key, group in self.groups.items():
+                for commit in group:
+                    if commit.prompt_id == prompt_id:
+                        group.remove(commit)
+                        self.commits -= 1
+                        if not group:
+                            # 窗口到期的协程发现分组已不在字典中，不会再提交
+                            del self.groups[key]
+                        return True
+        return False
+
+    def _expire(self, key, group):
+        time.sleep(self.window)
+        with self.lock:
+            if self.groups.get(key) is not group:
+                return
+            del self.groups[key]
+        self._flush(key[0], group)
+
+    def _flush(self, backend, group):
+        with self.lock:
+            self.batches += 1
+            if len(group) > 1:
+                self.coalesced += len(group)
+        try:
+            self.flush(backend, group)
+        except Exception as e:
+            logger.error(f"❌ 批次提交失败: {e}")
+
+    def pending(self):
+        with self.lock:
+            return sum(len(group) for group in self.groups.values())
+
+    def stats(self):
+        """Throughput gain: how many /prompt runs merging saved."""
+        flushed = self.commits - self.pending()
+        return {
+            "coalesce_commits": self.commits,
+            "coalesce_batched_commits": self.coalesced,
+            "coalesce_prompts": self.batches,
+            "coalesce_saved_prompts": max(0, flushed - self.batches),
+            "coalesce_ratio": round(flushed / self.batches, 2) if self.batches else None,
+        }
@@ -0,0 +1,82 @@
+# circuit_breaker.py
+"""
+后端熔断器：连续失败达到阈值后熔断（open），期间请求直接改走云端；
+冷却时间过后放行一个探测请求（half_open），成功则恢复（closed），失败则继续熔断。
+探测请求可能在到达后端前被取消或丢弃，超过 recovery_timeout 仍无结果的探测按失败处理。
+"""
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# allow_request() 放行的是 half_open 探测请求时的返回值（仍为真值）
+PROBE = "probe"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, recovery_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.probe_started_at = 0.0
+        self.lock = Lock()
+
+    def allow_request(self):
+        """True if a request may go to the backend; in half_open only one probe at a time is let through.
+
+        The probe is granted as PROBE, so the caller knows it owns the slot and must release_probe()
+        if it drops the request before it reaches the backend."""
+        with self.lock:
+            now = time.time()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self.opened_at < self.recovery_timeout:
+                    return False
+                self.state = HALF_OPEN
+                logger.info(f"🔌 [{self.name}] 熔断冷却结束，放行探测请求")
+            if self.probe_in_flight:
+                if now - self.probe_started_at < self.recovery_timeout:
+                    return False
+                logger.warning(f"⚠️ [{self.name}] 探测请求超时无结果，按失败处理")
+                self.probe_in_flight = False
+                self.state = OPEN
+                self.opened_at = now
+                return False
+            self.probe_in_flight = True
+            self.probe_started_at = now
+            return PROBE
+
+    def release_probe(self):
+        """The probe granted by allow_request() was dropped before reaching the backend; only its owner calls this."""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"✅ [{self.name}] 后端已恢复，关闭熔断")
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"⚠️ [{self.name}] 连续失败 {self.failures} 次，触发熔断")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def snapshot(self):
+        return {"state": self.state, "failures": self.failures, "opened_at": self.opened_at}
@@ -0,0 +1,225 @@
+# cloud_proxy.py
+"""
+云端透传反向代理：按路由表把 /auth/*、/psPlus/* 等请求转发到云端，
+使用长连接池与 DNS 缓存（只作用于代理自己的连接池，不改动全局 socket.getaddrinfo），
+响应体流式回传，每条路由单独设置超时。
+新增云端接口只需在路由表中加一行；需要在转发后做本地处理（如登录、登出后清除缓存）的路由
+可用 on_forward 注册回调。
+本地实现的路径即使方法不匹配也不会被通配路由转发到云端，而是返回 405。
+"""
+import time
+import socket
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from flask import request, Response, jsonify, stream_with_context
+from werkzeug.exceptions import HTTPException, MethodNotAllowed
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# 不应透传的逐跳头
+HOP_BY_HOP_HEADERS = {
+    'host', 'content-length', 'connection', 'keep-alive', 'proxy-authenticate',
+    'proxy-authorization', 'te', 'trailer', 'transfer-encoding', 'upgrade'
+}
+
+ENDPOINT_PREFIX = "cloud_proxy_"
+
+# rule: Flask 路由; timeout: 读超时（秒）
+# error / error_status: 云端不可达时返回给插件的内容，默认 502
+CLOUD_ROUTES = [
+    {
+        "rule": "/auth/login",
+        "methods": ["POST"],
+        "timeout": 10,
+        "error": {"code": 1, "msg": "request to cloud failed"},
+        "error_status": 500,
+    },
+    {
+        "rule": "/auth/logout",
+        "methods": ["POST"],
+        "timeout": 10,
+        "error": {"code": 500, "msg": "代理登出失败"},
+        "error_status": 500,
+    },
+    {
+        "rule": "/auth/<path:subpath>",
+        "methods": ["GET", "POST", "PUT", "DELETE"],
+        "timeout": 10,
+    },
+    {
+        "rule": "/psPlus/<path:subpath>",
+        "methods": ["GET", "POST", "PUT", "DELETE"],
+        "timeout": 30,
+    },
+]
+
+
+class DNSCache:
+    """Resolved addresses per (host, port), kept for ttl seconds."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+
+    def resolve(self, host, port):
+        item = self.entries.get((host, port))
+        if item and item[0] > time.time():
+            return item[1]
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[(host, port)] = (time.time() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        self.entries.pop((host, port), None)
+
+
+class _CachedDNSConnection:
+    """Connection mixin that connects to cached addresses; Host header, SNI and certificate checks still use the host name."""
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.resolve(host, self.port)
+        except OSError:
+            # 解析失败交给 urllib3 按原逻辑报错
+            return super()._new_conn()
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                error = e
+            finally:
+                self._dns_host = host
+        # 缓存的地址都连不上，下次重新解析
+        self.dns_cache.forget(host, self.port)
+        raise error
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections resolve host names through a DNSCache."""
+
+    def __init__(self, dns_cache, **kwargs):
+        # HTTPAdapter.__init__ 会调用 init_poolmanager，需先设置
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {"dns_cache": self.dns_cache}
+        http_conn = type("CachedDNSHTTPConnection", (_CachedDNSConnection, HTTPConnection), attrs)
+        https_conn = type("CachedDNSHTTPSConnection", (_CachedDNSConnection, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CachedDNSHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+            "https": type("CachedDNSHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+        }
+
+
+class CloudProxy:
+    def __init__(self, base_url, routes=CLOUD_ROUTES, connect_timeout=3, pool_size=20, dns_ttl=300):
+        self.base_url = base_url.rstrip('/')
+        self.routes = routes
+        self.connect_timeout = connect_timeout
+        # rule -> 转发完成后调用的回调
+        self.hooks = {}
+        self.session = requests.Session()
+        if dns_ttl:
+            adapter = CachedDNSAdapter(DNSCache(dns_ttl), pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        else:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def on_forward(self, rule, callback):
+        """Call callback() after each request matched by the route with this rule has been forwarded (or failed)."""
+        self.hooks.setdefault(rule, []).append(callback)
+
+    def run_hooks(self, route):
+        for callback in self.hooks.get(route["rule"], ()):
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"⚠️ [云端转发] {route['rule']} 回调失败: {e}")
+
+    def forward(self, route):
+        """Forward the current Flask request and stream the upstream response back."""
+        url = f"{self.base_url}{request.path}"
+        headers = {
+            key: value for key, value in request.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS
+        }
+        started = time.time()
+        try:
+            upstream = self.session.request(
+                request.method,
+                url,
+                # 同名参数可能出现多次，逐个保留
+                params=list(request.args.items(multi=True)),
+                data=request.get_data(),
+                headers=headers,
+                timeout=(self.connect_timeout, route.get("timeout", 30)),
+                stream=True,
+                allow_redirects=False,
+            )
+        except requests.RequestException as e:
+            logger.error(f"❌ [云端转发] {request.method} {request.path} 失败: {e}")
+            error = route.get("error", {"code": 502, "msg": "cloud request failed"})
+            return jsonify(error), route.get("error_status", 502)
+        finally:
+            self.run_hooks(route)
+
+        duration = round((time.time() - started) * 1000, 1)
+        logger.info(
+            f"☁️ [云端转发] {request.method} {request.path} → {upstream.status_code} ({duration:.0f}ms)",
+            extra={"route": request.path, "method": request.method, "status": upstream.status_code, "duration": duration}
+        )
+        # 响应体按原始字节转发，上游的 Content-Length 仍然准确
+        response_headers = [
+            (key, value) for key, value in upstream.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS or key.lower() == 'content-length'
+        ]
+
+        def generate():
+            try:
+                # 不解压，原样转发 Content-Encoding
+                for chunk in upstream.raw.stream(CHUNK_SIZE, decode_content=False):
+                    yield chunk
+            finally:
+                upstream.close()
+
+        return Response(stream_with_context(generate()), status=upstream.status_code, headers=response_headers)
+
+    @staticmethod
+    def local_methods(app):
+        """Methods with which a non-cloud route serves the current path."""
+        adapter = app.url_map.bind_to_environ(request.environ)
+        methods = set()
+        for method in ("GET", "POST", "PUT", "DELETE", "PATCH"):
+            try:
+                endpoint, _ = adapter.match(request.path, method=method)
+            except HTTPException:
+                continue
+            if not endpoint.startswith(ENDPOINT_PREFIX):
+                methods.add(method)
+        return methods
+
+    def register(self, app):
+        for index, route in enumerate(self.routes):
+            def view(route=route, **_):
+                if "<" in route["rule"]:
+                    # 通配路由：本地已实现的接口用错了方法时返回 405，而不是转发到云端
+                    allowed = self.local_methods(app)
+                    if allowed:
+                        raise MethodNotAllowed(valid_methods=sorted(allowed))
+                return self.forward(route)
+            app.add_url_rule(route["rule"], endpoint=f"{ENDPOINT_PREFIX}{index}", view_func=view, methods=route["methods"])
@@ -0,0 +1,130 @@
+# eta.py
+"""
+排队位置与预计完成时间：按工作流记录最近的运行耗时，结合后端实时队列（/queue）
+和代理侧调度队列，估算每个未完成任务前面还有几个任务、多久之后能拿到结果。
+后端队列与耗时估计都短暂缓存，插件频繁查询时不会每次都打到 ComfyUI。
+"""
+import time
+import logging
+
+import requests
+
+from metrics import percentile
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 轮询建议间隔的上下限（秒）
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 30
+
+# 全局耗时分布的缓存键
+ALL_WORKFLOWS = "*"
+
+
+def runtime_distribution(samples):
+    if not samples:
+        return None
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 1),
+        "p90": round(percentile(samples, 90), 1),
+        "mean": round(sum(samples) / len(samples), 1),
+    }
+
+
+class EtaEstimator:
+    def __init__(self, state, queue_ttl=2, estimate_ttl=30, timeout=3):
+        self.state = state
+        self.timeout = timeout
+        self.queue_ttl = queue_ttl
+        self.queues = TTLCache(ttl=queue_ttl)
+        self.fetched_at = {}
+        self.estimates = TTLCache(ttl=estimate_ttl)
+
+    def distribution(self, workflow_id):
+        """Runtime distribution of a workflow; all workflows together when it is unknown or has no history yet."""
+        def load():
+            samples = (workflow_id and self.state.runtime_samples(workflow_id)) or self.state.runtime_samples()
+            return runtime_distribution(samples) or {}
+        # 不认识的 prompt（其他客户端直接提交到 ComfyUI 的）按全局分布估算
+        return self.estimates.get_or_load(workflow_id or ALL_WORKFLOWS, load) or None
+
+    def expected_runtime(self, workflow_id):
+        distribution = self.distribution(workflow_id)
+        return distribution["p50"] if distribution else None
+
+    def backend_queue(self, backend, fresh=False):
+        """(running prompt_ids, pending prompt_ids in order) from ComfyUI /queue."""
+        def load():
+            resp = requests.get(f"{backend}/queue", timeout=self.timeout)
+            resp.raise_for_status()
+            queue = resp.json()
+            # 队列项格式: [number, prompt_id, ...]，pending 按 number 排序才是执行顺序
+            running = [item[1] for item in queue.get("queue_running", []) if len(item) > 1]
+            pending = [item[1] for item in sorted(queue.get("queue_pending", []), key=lambda item: item[0]) if len(item) > 1]
+            self.fetched_at[backend] = time.time()
+            return running, pending
+        # fresh 也受 queue_ttl 限制：status 消息密集时不会每条都请求一次 /queue
+        if fresh and time.time() - self.fetched_at.get(backend, 0) >= self.queue_ttl:
+            self.queues.set(backend, load())
+        return self.queues.get_or_load(backend, load)
+
+    def workflow_of(self, prompt_id):
+        status = self.state.get_task(prompt_id)
+        return status["data"].get("workflow_id") if status else None
+
+    def remaining(self, prompt_id, now):
+        """Expected seconds left for a prompt that is currently running."""
+        status = self.state.get_task(prompt_id)
+        data = status["data"] if status else {}
+        expected = self.expected_runtime(data.get("workflow_id"))
+        if expected is None:
+            return None
+        started_at = data.get("started_at")
+        return max(expected - (now - started_at), 0) if started_at else expected
+
+    def estimate(self, prompt_id, status, held_ahead=None):
+        """Queue position and ETA for an unfinished local task; None when it is not waiting anywhere.
+
+        held_ahead: jobs the proxy-side scheduler will release before this one (it is not in ComfyUI yet)."""
+        data = status["data"]
+        backend = data.get("backend")
+        if not backend or backend == "cloud":
+            return None
+        comfy_id = data.get("batch_id") or data.get("comfy_prompt_id") or prompt_id
+        running, pending = self.backend_queue(backend)
+        now = time.time()
+
+        if comfy_id in running:
+            ahead_running, ahead_pending, extra = [], [], []
+        elif comfy_id in pending:
+            ahead_running, ahead_pending, extra = running, pending[:pending.index(comfy_id)], []
+        elif held_ahead is not None or status["type"] == "scheduled":
+            ahead_running, ahead_pending = running, pending
+            extra = [job.payload.get("workflow_id") for job in held_ahead or []]
+        else:
+            return None
+
+        own = self.expected_runtime(data.get("workflow_id"))
+        eta = self.remaining(comfy_id, now) if comfy_id in running else own
+        for pid in ahead_running:
+            if eta is not None:
+                left = self.remaining(pid, now)
+                eta = None if left is None else eta + left
+        for workflow_id in [self.workflow_of(pid) for pid in ahead_pending] + extra:
+            if eta is not None:
+                expected = self.expected_runtime(workflow_id)
+                eta = None if expected is None else eta + expected
+
+        position = len(ahead_running) + len(ahead_pending) + len(extra)
+        result = {
+            "queue_position": position,
+            "running": comfy_id in running,
+            "expected_runtime": own,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+        if eta is not None:
+            # 排在后面时放慢轮询，快轮到时再加快
+            result["suggested_poll_interval"] = int(min(max(eta / 10, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL))
+        return result
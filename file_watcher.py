@@ -0,0 +1,69 @@
+# file_watcher.py
+"""
+轮询式文件监视：定期比较文件的 (mtime, size)，变化稳定一个周期后回调，
+避免在文件写到一半时触发。无需额外依赖，Windows 与 Linux 行为一致。
+"""
+import os
+import glob
+import time
+import logging
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class FileWatcher:
+    def __init__(self, paths=(), patterns=(), interval=2.0, on_change=None):
+        # paths: 单个文件；patterns: glob 模式（如 workflows/*.json），新增和删除也算变化
+        self.paths = list(paths)
+        self.patterns = list(patterns)
+        self.interval = interval
+        self.on_change = on_change
+        self.running = False
+
+    def snapshot(self):
+        files = set(self.paths)
+        for pattern in self.patterns:
+            files.update(glob.glob(pattern))
+        return {path: file_signature(path) for path in files}
+
+    def run(self):
+        current = self.snapshot()
+        pending = None
+        while self.running:
+            time.sleep(self.interval)
+            latest = self.snapshot()
+            if latest == current:
+                pending = None
+                continue
+            if latest != pending:
+                # 第一次看到变化，等下一个周期确认文件已写完
+                pending = latest
+                continue
+            changed = sorted(path for path in set(current) | set(latest) if current.get(path) != latest.get(path))
+            current, pending = latest, None
+            logger.info(f"👀 检测到文件变化: {', '.join(os.path.basename(p) for p in changed)}")
+            if self.on_change:
+                try:
+                    self.on_change(changed)
+                except Exception as e:
+                    logger.error(f"❌ 文件变化处理失败: {e}")
+
+    def start(self):
+        if self.running:
+            return None
+        self.running = True
+        thread = Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.running = False
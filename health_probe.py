@@ -0,0 +1,141 @@
+# health_probe.py
+"""
+后端健康探测：后台定期请求各 ComfyUI 的 /system_stats 记录其状态，
+提交前即可知道后端是否在线，宕机时直接快速失败或改道，不必等待请求超时。
+提交里的 comfyuiUrl 由客户端决定，探测列表有上限，长时间无人使用的后端会被移出。
+"""
+import time
+import logging
+import requests
+from threading import Thread, Lock
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+UP = "up"
+DOWN = "down"
+
+
+class BackendHealth:
+    __slots__ = ("url", "state", "failures", "last_check", "last_ok", "latency_ms", "last_error", "last_used", "pinned")
+
+    def __init__(self, url, pinned=False):
+        self.url = url
+        # 配置里的本地后端常驻，不会因空闲被移出
+        self.pinned = pinned
+        self.last_used = time.time()
+        self.state = UNKNOWN
+        self.failures = 0
+        self.last_check = 0.0
+        self.last_ok = 0.0
+        self.latency_ms = None
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "last_check": self.last_check,
+            "last_ok": self.last_ok,
+            "latency_ms": self.latency_ms,
+            "last_error": self.last_error,
+        }
+
+
+class HealthProber:
+    def __init__(self, interval=5, timeout=2, down_after=2, on_change=None, max_backends=32, idle_timeout=3600):
+        self.interval = interval
+        self.timeout = timeout
+        # 连续失败几次才判定为宕机，避免偶发抖动
+        self.down_after = down_after
+        self.on_change = on_change
+        self.max_backends = max_backends
+        self.idle_timeout = idle_timeout
+        self.backends = {}
+        self.lock = Lock()
+
+    def track(self, url, pinned=False):
+        if not url:
+            return
+        backend = self.backends.get(url)
+        if backend is not None:
+            backend.last_used = time.time()
+            backend.pinned = backend.pinned or pinned
+            return
+        with self.lock:
+            if url in self.backends:
+                return
+            if len(self.backends) >= self.max_backends:
+                idle = [b for b in self.backends.values() if not b.pinned]
+                if idle:
+                    oldest = min(idle, key=lambda b: b.last_used)
+                    del self.backends[oldest.url]
+                    logger.info(f"🩺 探测列表已满，移出最久未使用的后端: {oldest.url}")
+            self.backends[url] = BackendHealth(url, pinned)
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        with self.lock:
+            idle = [url for url, b in self.backends.items() if not b.pinned and b.last_used < cutoff]
+            for url in idle:
+                del self.backends[url]
+        for url in idle:
+            logger.info(f"🩺 后端长时间未使用，停止探测: {url}")
+        return idle
+
+    def state(self, url):
+        backend = self.backends.get(url)
+        return backend.state if backend else UNKNOWN
+
+    def is_down(self, url):
+        return self.state(url) == DOWN
+
+    def probe(self, url):
+        backend = self.backends.get(url)
+        if backend is None:
+            return UNKNOWN
+        started = time.time()
+        try:
+            res = requests.get(f"{url}/system_stats", timeout=self.timeout)
+            ok = res.status_code == 200
+            error = None if ok else f"状态码 {res.status_code}"
+        except Exception as e:
+            ok, error = False, str(e)
+
+        previous = backend.state
+        backend.last_check = time.time()
+        if ok:
+            backend.failures = 0
+            backend.last_ok = backend.last_check
+            backend.latency_ms = round((backend.last_check - started) * 1000, 1)
+            backend.last_error = None
+            backend.state = UP
+        else:
+            backend.failures += 1
+            backend.last_error = error
+            if backend.failures >= self.down_after:
+                backend.state = DOWN
+
+        if backend.state != previous:
+            logger.info(f"🩺 后端状态变化 {url}: {previous} → {backend.state}")
+            if self.on_change:
+                try:
+                    self.on_change(url, previous, backend.state)
+                except Exception as e:
+                    logger.warning(f"⚠️ 后端状态回调失败: {e}")
+        return backend.state
+
+    def run(self):
+        while True:
+            self.evict_idle()
+            for url in list(self.backends):
+                self.probe(url)
+            time.sleep(self.interval)
+
+    def start(self):
+        thread = Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def snapshot(self):
+        return {url: backend.to_dict() for url, backend in list(self.backends.items())}
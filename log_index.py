@@ -0,0 +1,177 @@
+# log_index.py
+"""
+日志检索索引：日志管道的写线程把记录批量写入 SQLite，
+按级别、client_id、prompt_id、时间走普通索引，正文走 FTS5 全文索引
+（trigram 分词，支持中文子串；SQLite 不支持 FTS5 时退化为 LIKE）。
+控制面板通过 /api/logs/search 查询，不必扫描界面里的文本。
+"""
+import os
+import time
+import sqlite3
+import logging
+from threading import Lock
+
+from log_pipeline import DEFAULT_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# 超过保留时间的记录在写入时顺带清理
+PRUNE_EVERY = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    level TEXT NOT NULL,
+    client_id TEXT,
+    prompt_id TEXT,
+    route TEXT,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts);
+CREATE INDEX IF NOT EXISTS idx_logs_level_ts ON logs(level, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_client_ts ON logs(client_id, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_prompt_ts ON logs(prompt_id, ts);
+"""
+
+FTS_TABLES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(message, content='logs', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(message, content='logs', content_rowid='id')",
+]
+
+# 全文索引由触发器随 logs 的插入/删除同步维护；多个 worker 并发写入时也不会漏行或重复
+FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+    INSERT INTO logs_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+    INSERT INTO logs_fts (logs_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+"""
+
+
+class LogIndex:
+    def __init__(self, path="huiying_logs.db", retention_hours=72):
+        self.path = path
+        self.retention = retention_hours * 3600
+        self.formatter = logging.Formatter(DEFAULT_FORMAT)
+        self.inserted = 0
+        # 写入只发生在日志写线程；查询来自请求协程，单独一个连接并加锁
+        self.writer = None
+        self.reader = None
+        self.pid = os.getpid()
+        self.read_lock = Lock()
+        self.fts = None
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        for ddl in FTS_TABLES:
+            try:
+                conn.execute(ddl)
+                self.fts = "trigram" if "trigram" in ddl else "unicode61"
+                break
+            except sqlite3.OperationalError:
+                continue
+        if self.fts is None:
+            logger.warning("⚠️ SQLite 不支持 FTS5，日志检索退化为 LIKE 扫描")
+        else:
+            conn.executescript(FTS_TRIGGERS)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            # fork 出的 worker 不能复用父进程的连接
+            self.writer = self.reader = None
+            self.pid = os.getpid()
+
+    def write_records(self, records):
+        """Log sink: called by the log writer thread with each drained batch."""
+        self._check_fork()
+        if self.writer is None:
+            self.writer = self._connect()
+        rows = []
+        for record in records:
+            try:
+                message = record.getMessage()
+            except Exception:
+                message = str(record.msg)
+            if record.exc_info:
+                message = f"{message}\n{self.formatter.formatException(record.exc_info)}"
+            rows.append((
+                record.created,
+                record.levelname,
+                getattr(record, "client_id", None),
+                getattr(record, "prompt_id", None),
+                getattr(record, "route", None),
+                message,
+            ))
+        conn = self.writer
+        with conn:
+            conn.executemany(
+                "INSERT INTO logs (ts, level, client_id, prompt_id, route, message) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        self.inserted += len(rows)
+        if self.inserted >= PRUNE_EVERY:
+            self.inserted = 0
+            self.prune()
+
+    def prune(self):
+        cutoff = time.time() - self.retention
+        conn = self.writer
+        with conn:
+            conn.execute("DELETE FROM logs WHERE ts < ?", (cutoff,))
+
+    def search(self, q=None, level=None, client_id=None, prompt_id=None, since=None, until=None, limit=200):
+        """Newest-first matches; every filter is optional and they are ANDed together."""
+        clauses, params = [], []
+        if level:
+            levels = [name.strip().upper() for name in str(level).split(",") if name.strip()]
+            clauses.append(f"l.level IN ({','.join('?' * len(levels))})")
+            params.extend(levels)
+        if client_id:
+            clauses.append("l.client_id = ?")
+            params.append(client_id)
+        if prompt_id:
+            clauses.append("l.prompt_id = ?")
+            params.append(prompt_id)
+        if since:
+            clauses.append("l.ts >= ?")
+            params.append(float(since))
+        if until:
+            clauses.append("l.ts <= ?")
+            params.append(float(until))
+
+        table = "logs l"
+        terms = (q or "").split()
+        # trigram 只能匹配 3 个字符及以上的片段，更短的词用 LIKE
+        fts_terms = [t for t in terms if self.fts and (self.fts != "trigram" or len(t) >= 3)]
+        like_terms = [t for t in terms if t not in fts_terms]
+        if fts_terms:
+            table = "logs_fts f JOIN logs l ON l.id = f.rowid"
+            clauses.append("logs_fts MATCH ?")
+            params.append(" ".join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+        for term in like_terms:
+            clauses.append("l.message LIKE ? ESCAPE '\\'")
+            escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+
+        sql = f"SELECT l.id, l.ts, l.level, l.client_id, l.prompt_id, l.route, l.message FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY l.id DESC LIMIT ?"
+        params.append(int(limit))
+
+        with self.read_lock:
+            self._check_fork()
+            if self.reader is None:
+                self.reader = self._connect()
+            rows = self.reader.execute(sql, params).fetchall()
+        keys = ("id", "ts", "level", "client_id", "prompt_id", "route", "message")
+        return [dict(zip(keys, row)) for row in rows]
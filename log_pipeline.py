@@ -0,0 +1,305 @@
+# log_pipeline.py
+"""
+异步日志管道：业务协程只把 LogRecord 放入内存队列，格式化和磁盘写入
+由后台的原生线程完成，热点路径上的日志不会因磁盘 I/O 卡住 gevent hub。
+日志文件按大小和时间滚动，滚出的文件在后台压缩为 .gz，只保留最近若干份。
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import atexit
+import shutil
+import logging
+from datetime import datetime
+from collections import deque
+
+try:
+    from gevent import monkey as _monkey
+    _start_new_thread = _monkey.get_original('_thread', 'start_new_thread')
+    _sleep = _monkey.get_original('time', 'sleep')
+except ImportError:
+    from _thread import start_new_thread as _start_new_thread
+    from time import sleep as _sleep
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 后台线程无事可做时的轮询间隔（秒）
+FLUSH_INTERVAL = 0.05
+
+# 通过 logger.info(..., extra={...}) 传入、JSONL 格式会单独输出的字段
+STRUCTURED_FIELDS = ("route", "method", "status", "client_id", "prompt_id", "workflow_id", "backend", "duration")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured fields passed via extra= become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueingHandler(logging.Handler):
+    """Appends records to a deque; deque.append is atomic so no lock is taken on the hot path."""
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def handle(self, record):
+        # 跳过 Handler.handle 里的锁，过滤器仍然生效
+        if self.filter(record):
+            self.emit(record)
+        return True
+
+
+def compress_rolled(path, backup_count):
+    """Gzip a rolled log file and prune the oldest archives beyond backup_count."""
+    try:
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    except OSError as e:
+        sys.stderr.write(f"日志压缩失败 {path}: {e}\n")
+        return
+    base = path.rsplit('.', 1)[0]
+    archives = sorted(glob.glob(base + '.*.gz'))
+    for stale in archives[:max(0, len(archives) - backup_count)]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+class LogWriter:
+    """Drains the record queue on a native OS thread and writes formatted lines to the file and console.
+
+    The writer is the only consumer of the queue. It writes to the streams directly instead of going
+    through logging.Handler, whose locks are gevent locks after monkey-patching and cannot be taken
+    from a native thread."""
+
+    def __init__(self, log_file, stream=None, formatter=None, max_pending=100000,
+                 max_bytes=20 * 1024 * 1024, max_age=24 * 3600, backup_count=10):
+        self.path = log_file
+        self.stream = stream
+        self.formatter = formatter or logging.Formatter(DEFAULT_FORMAT)
+        # 控制台始终输出可读文本，即使文件使用 JSONL
+        self.stream_formatter = logging.Formatter(DEFAULT_FORMAT)
+        self.records = deque(maxlen=max_pending)
+        # 额外的记录消费者（如检索索引），在写线程中按批调用 sink.write_records(batch)
+        self.sinks = []
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.rotate_requested = False
+        # fork 出的子进程不滚动文件，只在父进程滚动后重新打开
+        self.follow_rotation = False
+        self.checked_at = 0.0
+        self.running = False
+        self.stopped = True
+        self.exit_registered = False
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.size = self.file.tell()
+        self.opened_at = time.time()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stopped = False
+        _start_new_thread(self._run, ())
+        if not self.exit_registered:
+            self.exit_registered = True
+            atexit.register(self.stop)
+
+    def after_fork_in_child(self):
+        """The writer thread does not survive fork(); restart it and leave rotation to the parent."""
+        self.records.clear()
+        self._open()
+        self.max_bytes = 0
+        self.max_age = 0
+        self.follow_rotation = True
+        self.running = False
+        self.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the writer thread and write whatever is still queued."""
+        self.running = False
+        remaining = timeout
+        while not self.stopped and remaining > 0:
+            _sleep(FLUSH_INTERVAL)
+            remaining -= FLUSH_INTERVAL
+        if self.stopped:
+            self.drain()
+
+    def set_formatter(self, formatter):
+        """Swap the file formatter; the current file is rolled so one file never mixes formats."""
+        if type(formatter) is not type(self.formatter):
+            self.rotate_requested = self.size > 0
+        self.formatter = formatter
+
+    def drain(self):
+        records = self.records
+        if not records:
+            return
+        batch = []
+        while records:
+            try:
+                record = records.popleft()
+            except IndexError:
+                break
+            self.write(record)
+            batch.append(record)
+        self.flush()
+        for sink in self.sinks:
+            try:
+                sink.write_records(batch)
+            except Exception as e:
+                sys.stderr.write(f"日志索引写入失败: {e}\n")
+
+    def write(self, record):
+        try:
+            line = self.formatter.format(record) + '\n'
+        except Exception:
+            line = f"{record.levelname} - {record.msg!r} (日志格式化失败)\n"
+        self.file.write(line)
+        # 按字符数近似文件大小，省去每行编码计算
+        self.size += len(line)
+        if self.stream is not None:
+            if type(self.formatter) is not logging.Formatter:
+                line = self.stream_formatter.format(record) + '\n'
+            try:
+                self.stream.write(line)
+            except (OSError, ValueError):
+                # 控制台被关闭（如 pythonw 启动）时只写文件
+                self.stream = None
+
+    def flush(self):
+        self.file.flush()
+        if self.stream is not None:
+            try:
+                self.stream.flush()
+            except (OSError, ValueError):
+                self.stream = None
+
+    def reopen_if_rotated(self):
+        now = time.time()
+        if now - self.checked_at < 1:
+            return
+        self.checked_at = now
+        try:
+            if os.stat(self.path).st_ino == os.fstat(self.file.fileno()).st_ino:
+                return
+        except OSError:
+            pass
+        self.file.close()
+        self._open()
+
+    def should_rotate(self):
+        if self.rotate_requested:
+            return True
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        return bool(self.max_age) and self.size > 0 and time.time() - self.opened_at >= self.max_age
+
+    def rotate(self):
+        """Roll the current file to <name>.<timestamp> and gzip it on another native thread."""
+        self.rotate_requested = False
+        self.file.close()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        rolled = f"{self.path}.{stamp}"
+        index = 1
+        while os.path.exists(rolled) or os.path.exists(rolled + '.gz'):
+            rolled = f"{self.path}.{stamp}-{index}"
+            index += 1
+        try:
+            os.replace(self.path, rolled)
+        except OSError as e:
+            # Windows 下文件被其他进程占用时放弃本次滚动，继续追加
+            sys.stderr.write(f"日志滚动失败: {e}\n")
+            rolled = None
+        self._open()
+        if rolled:
+            _start_new_thread(compress_rolled, (rolled, self.backup_count))
+
+    def _run(self):
+        try:
+            while self.running:
+                try:
+                    if self.follow_rotation:
+                        self.reopen_if_rotated()
+                    elif self.should_rotate():
+                        self.rotate()
+                    if self.records:
+                        self.drain()
+                        continue
+                except Exception as e:
+                    sys.stderr.write(f"日志写入失败: {e}\n")
+                _sleep(FLUSH_INTERVAL)
+        finally:
+            self.stopped = True
+
+
+_writer = None
+
+
+def setup_logging(log_file='huiying_proxy.log', level=logging.INFO, fmt=DEFAULT_FORMAT):
+    """Route all logging through the async pipeline (file + console); call once per process."""
+    global _writer
+    _writer = LogWriter(log_file, stream=sys.stdout, formatter=logging.Formatter(fmt))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueingHandler(_writer.records))
+    set_level(level)
+    _writer.start()
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_writer.after_fork_in_child)
+    return _writer
+
+
+def add_sink(sink):
+    if _writer is not None:
+        _writer.sinks.append(sink)
+
+
+def configure(config):
+    """Apply log_level / log_format / rotation settings from config.json."""
+    set_level(config.get("log_level", "INFO"))
+    if _writer is None:
+        return
+    _writer.max_bytes = int(config.get("log_max_mb", 20) * 1024 * 1024)
+    _writer.max_age = int(config.get("log_rotate_hours", 24) * 3600)
+    _writer.backup_count = int(config.get("log_backup_count", 10))
+    if config.get("log_format", "text") == "jsonl":
+        _writer.set_formatter(JsonFormatter())
+    else:
+        _writer.set_formatter(logging.Formatter(DEFAULT_FORMAT))
+
+
+def set_level(level):
+    """Accepts logging constants or names such as "INFO"; the root level gates records before they are queued."""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    logging.getLogger().setLevel(level)
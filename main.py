@@ -12,6 +12,7 @@ import logging
 import time
 import uuid
 import copy
+import random
 import signal
 import logging
 logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
@@ -28,9 +29,7 @@ import sys
 # 云端统一前缀
 CLOUD_BASE_URL = "https://proxy.hueying.cn"
 
-# 云端接口路径（基于统一前缀拼接）
-CLOUD_AUTH_URL = f"{CLOUD_BASE_URL}/auth/login"
-CLOUD_LOGOUT_URL = f"{CLOUD_BASE_URL}/auth/logout"
+# 云端接口路径（基于统一前缀拼接）；其余接口由 cloud_proxy 路由表透传
 CLOUD_CHECK_URL = f"{CLOUD_BASE_URL}/psPlus/workflow/checkOnline"
 
 def start_comfyui():
@@ -51,6 +50,8 @@ def start_comfyui():
 
 # 调用
 start_comfyui()
+# 工作流直接在内存中从 payload 读取，不再解压到 temp_dir；
+# 旧版本解压出的明文工作流仍需在启动和退出时清理
 if os.path.exists(temp_dir):
     try:
         shutil.rmtree(temp_dir)
@@ -99,21 +100,37 @@ import time
 time.sleep(0.5) 
 from datetime import datetime, timedelta
 from threading import Thread, Lock
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import websocket as ws_client
 from collections import defaultdict, deque
+from workflow_store import WorkflowStore, WorkflowCatalog
+from file_watcher import FileWatcher
+from update import CONTAINER_FILE
+from mapping_index import MappingIndex
+from object_info_cache import ObjectInfoCache
+from param_validator import validate_workflow
+from circuit_breaker import CircuitBreaker, PROBE
+from health_probe import HealthProber, UP as BACKEND_UP, DOWN as BACKEND_DOWN
+from ttl_cache import TTLCache
+from cloud_proxy import CloudProxy, HOP_BY_HOP_HEADERS
+from log_index import LogIndex
+from metrics import Metrics
+from state_store import create_state_store, CANCELLED
+from workers import effective_workers, fork_workers
+from task_recovery import reconcile_tasks
+from scheduler import FairScheduler, ScheduledJob
+from eta import EtaEstimator
+from batch_coalescer import (
+    BatchCoalescer, CoalescedCommit, batch_signature, merge_batch, split_message,
+)
 # Default ComfyUI URL, will be overwritten by config on start
 COMFYUI_URL = "http://127.0.0.1:8188"
 
-logging.basicConfig(
-    level=logging.DEBUG, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('huiying_proxy.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 日志经内存队列由后台线程写入，级别在配置加载后按 log_level 调整
+import log_pipeline
+from log_pipeline import setup_logging
+setup_logging('huiying_proxy.log', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -166,12 +183,11 @@ def adapt_workflow_paths(workflow_data, comfyui_url: str):
          
 
 comfyui_ws = None  
-message_queue = defaultdict(deque) 
-task_status = {}  
-client_last_seen = {}  
+# 任务状态、客户端消息队列与后端队列深度保存在 state（见 state_store.py），配置加载后创建
+state = None
 upload_progress = {}  
-queue_lock = Lock()  
 task_result_cache = {}
+metrics = Metrics()
 
 def start_progress_tracker_by_mapping(prompt_id, workflow_id, client_id, comfyui_url):
     comfyui_url = sanitize_url(comfyui_url)
@@ -245,70 +261,23 @@ def start_progress_tracker_by_mapping(prompt_id, workflow_id, client_id, comfyui
 
 def add_message_to_queue(client_id, message):
    
-    with queue_lock:
-    
-        if len(message_queue[client_id]) > 100:
-            message_queue[client_id].popleft()
-     
-        enhanced_message = {
-            "id": str(uuid.uuid4())[:8],
-            "timestamp": time.time(),
-            "data": message
-        }
-        
-        message_queue[client_id].append(enhanced_message)
-        logger.info(f"📨 消息已添加到客户端队列: {client_id} (类型: {message.get('type', 'unknown')})")
+    state.add_message(client_id, message)
+    logger.debug("📨 消息已添加到客户端队列: %s (类型: %s)", client_id, message.get('type', 'unknown'))
 
 def get_messages_for_client(client_id, since_timestamp=None):
     
-    with queue_lock:
-        client_last_seen[client_id] = time.time()
-        
-        if client_id not in message_queue:
-            return []
-        
-        messages = []
-        for msg in message_queue[client_id]:
-            if since_timestamp is None or msg["timestamp"] > since_timestamp:
-                messages.append(msg)
-        
-
-        if len(messages) > 0:
-            message_queue[client_id] = deque(list(message_queue[client_id])[-20:])
-        
-        return messages
+    return state.get_messages(client_id, since_timestamp)
 
 def broadcast_message(message):
    
-    current_time = time.time()
-    active_clients = []
-    
-    with queue_lock:
-
-        for client_id, last_seen in client_last_seen.items():
-            if current_time - last_seen < 300:  
-                active_clients.append(client_id)
-    
-
-    for client_id in active_clients:
+    for client_id in state.active_clients(300):
         add_message_to_queue(client_id, message)
 
 def cleanup_inactive_clients():
 
-    current_time = time.time()
-    inactive_clients = []
-    
-    with queue_lock:
-        for client_id, last_seen in client_last_seen.items():
-            if current_time - last_seen > 600:  
-                inactive_clients.append(client_id)
-        
-        for client_id in inactive_clients:
-            del client_last_seen[client_id]
-            if client_id in message_queue:
-                del message_queue[client_id]
-            if client_id in upload_progress:
-                del upload_progress[client_id]
+    inactive_clients = state.remove_inactive_clients(600)
+    for client_id in inactive_clients:
+        upload_progress.pop(client_id, None)
     
     if inactive_clients:
         logger.info(f"🧹 清理了 {len(inactive_clients)} 个非活跃客户端")
@@ -374,61 +343,84 @@ def comfy_ws_listener():
 
         return enhanced
 
+    def handle_message(msg_json):
+        enhanced = enhance_message(msg_json)
+
+        msg_type = msg_json.get("type")
+        data = msg_json.get("data", {})
+
+        if msg_type == "status":
+            exec_info = data.get("status", {}).get("exec_info", {})
+            state.set_backend_depth(ws_base_url, exec_info.get("queue_remaining", 0))
+            # 队列有变化，向排队中的任务推送新的位置与 ETA
+            publish_queue_positions_async(ws_base_url)
+
+        elif msg_type == "execution_start":
+            prompt_id = data.get("prompt_id")
+            if state.update_task(prompt_id, "executing", {"status": "executing", "started_at": time.time()}):
+                logger.debug("▶️ [开始执行] %s", prompt_id)
+
+        elif msg_type == "progress":
+            prompt_id = data.get("prompt_id")
+            value = data.get("value", 0)
+            max_value = data.get("max", 1)
+            percent = int((value / max_value) * 100) if max_value else 0
+            node_id = data.get("node")
+
+            if state.update_task(prompt_id, "progress", {
+                "percentage": percent,
+                "current_step": value,
+                "total_steps": max_value,
+                "node_id": node_id,
+                "is_sampling": str(data.get("name", "")).lower().startswith("ksampler"),
+            }):
+                logger.debug("📈 进度更新: %s%% [%s/%s] @节点 %s", percent, value, max_value, node_id)
+
+        elif msg_type == "executing":
+            prompt_id = data.get("prompt_id")
+            node_id = data.get("node")
+
+            if state.update_task(prompt_id, "executing", {
+                "node_id": node_id,
+                "status": "executing"
+            }):
+                logger.debug("⚙️ [执行中] %s 节点: %s", prompt_id, node_id)
+            if node_id is None and prompt_id:
+                # node 为空表示整个 prompt 执行结束，释放调度名额
+                scheduler.release(prompt_id)
+                record_runtime(prompt_id)
+
+        elif msg_type in ("execution_error", "execution_interrupted"):
+            prompt_id = data.get("prompt_id")
+            if state.update_task(prompt_id, "error", {"status": msg_type, "error": data.get("exception_message")}):
+                logger.warning(f"❌ [失败] {prompt_id}: {data.get('exception_message') or msg_type}")
+            if prompt_id:
+                scheduler.release(prompt_id)
+
+        elif msg_type == "executed":
+            prompt_id = data.get("prompt_id")
+
+            if state.update_task(prompt_id, "done", {"status": "done"}):
+                logger.info(f"✅ [完成] {prompt_id}")
+
+        
+        client_id = state.task_client(data.get("prompt_id")) if data.get("prompt_id") else None
+        if client_id:
+            add_message_to_queue(client_id, enhanced)
+
     def on_message(ws, message):
         try:
             msg_json = json.loads(message)
-            enhanced = enhance_message(msg_json)
-
-            msg_type = msg_json.get("type")
-            data = msg_json.get("data", {})
-
-            if msg_type == "progress":
-                prompt_id = data.get("prompt_id")
-                value = data.get("value", 0)
-                max_value = data.get("max", 1)
-                percent = int((value / max_value) * 100) if max_value else 0
-                node_id = data.get("node")
-
-                if prompt_id in task_status:
-                    task_status[prompt_id]["type"] = "progress"
-                    task_status[prompt_id]["data"].update({
-                        "percentage": percent,
-                        "current_step": value,
-                        "total_steps": max_value,
-                        "node_id": node_id,
-                        "is_sampling": str(data.get("name", "")).lower().startswith("ksampler"),
-                    })
-                    task_status[prompt_id]["timestamp"] = time.time()
-                    logger.info(f"📈 进度更新: {percent}% [{value}/{max_value}] @节点 {node_id}")
-
-            elif msg_type == "executing":
-                prompt_id = data.get("prompt_id")
-                node_id = data.get("node")
-
-                if prompt_id in task_status:
-                    task_status[prompt_id]["type"] = "executing"
-                    task_status[prompt_id]["data"].update({
-                        "node_id": node_id,
-                        "status": "executing"
-                    })
-                    task_status[prompt_id]["timestamp"] = time.time()
-                    logger.info(f"⚙️ [执行中] {prompt_id} 节点: {node_id}")
-
-            elif msg_type == "executed":
-                prompt_id = data.get("prompt_id")
-
-                if prompt_id in task_status:
-                    task_status[prompt_id]["type"] = "done"
-                    task_status[prompt_id]["data"].update({
-                        "status": "done"
-                    })
-                    task_status[prompt_id]["timestamp"] = time.time()
-                    logger.info(f"✅ [完成] {prompt_id}")
+            handle_message(msg_json)
 
-        
-            client_id = task_status.get(data.get("prompt_id"), {}).get("data", {}).get("client_id")
-            if client_id:
-                add_message_to_queue(client_id, enhanced)
+            # 合并批次的消息按成员改写后逐个处理，输出按批次下标拆分
+            prompt_id = (msg_json.get("data") or {}).get("prompt_id")
+            if prompt_id and proxy.config.get("enable_batch_coalescing", False):
+                batch = state.get_task(prompt_id)
+                members = batch["data"].get("batch_members") if batch else None
+                if members:
+                    for member_message in split_message(msg_json, members, batch["data"].get("batch_total")):
+                        handle_message(member_message)
 
         except Exception as e:
             logger.warning(f"⚠️ WebSocket消息处理失败: {e}")
@@ -440,9 +432,11 @@ def comfy_ws_listener():
         
     def on_open(ws):
         logger.info("🔗 [ComfyUI WS] 连接已建立")
+        # 重新连上说明 ComfyUI 可能重启过（节点/模型可能变化），刷新 object_info
+        proxy.object_info_cache.invalidate(ws_base_url)
 
-    ws_url = sanitize_url(proxy.config.get("local_comfyui_url", COMFYUI_URL))
-    ws_url = ws_url.replace("http://", "ws://").replace("https://", "wss://") + "/ws"
+    ws_base_url = sanitize_url(proxy.config.get("local_comfyui_url", COMFYUI_URL))
+    ws_url = ws_base_url.replace("http://", "ws://").replace("https://", "wss://") + "/ws"
     ws = websocket.WebSocketApp(
         ws_url,
         on_message=on_message,
@@ -451,7 +445,8 @@ def comfy_ws_listener():
         on_open=on_open
     )
 
-    thread = Thread(target=ws.run_forever, daemon=True)
+    # reconnect: ComfyUI 重启或晚于代理启动时自动重连
+    thread = Thread(target=ws.run_forever, kwargs={"reconnect": 5}, daemon=True)
     thread.start()
 
 
@@ -462,17 +457,14 @@ def cleanup_task():
             cleanup_inactive_clients()
             
            
-            current_time = time.time()
-            expired_tasks = []
-            for prompt_id, status_info in task_status.items():
-                if current_time - status_info["timestamp"] > 7200:  # 2小时
-                    expired_tasks.append(prompt_id)
-            
-            for prompt_id in expired_tasks:
-                del task_status[prompt_id]
+            expired_tasks = state.expire_tasks()
             
             if expired_tasks:
-                logger.info(f"🧹 清理了 {len(expired_tasks)} 个过期任务状态")
+                logger.info(f"🧹 清理了 {expired_tasks} 个过期任务状态")
+
+            expired_messages = state.expire_messages()
+            if expired_messages:
+                logger.info(f"🧹 清理了 {expired_messages} 条过期未读消息")
                 
         except Exception as e:
             logger.error(f"清理任务异常: {e}")
@@ -482,21 +474,99 @@ def cleanup_task():
  
 class HuiYingProxy:
     def __init__(self, config_file='config.json', mappings_file=None):
-        global temp_dir
-        if mappings_file is None:
-            mappings_file = os.path.join(temp_dir, "workflow_mappings.json")
         self.config_file = config_file
+        # 显式传入的映射文件优先，否则使用 payload 内置的 workflow_mappings.json
         self.mappings_file = mappings_file
         self.config = self.load_config(config_file)
-        self.mappings = self.load_mappings(self.mappings_file)
-        self.workflow_cache = {}
+        # payload、映射文件和 workflow_dir 变化时在后台重建目录并整体替换
+        watched = [CONTAINER_FILE] + ([mappings_file] if mappings_file else [])
+        self.watcher = FileWatcher(
+            paths=watched,
+            patterns=[os.path.join(self.config["workflow_dir"], "*.json")],
+            interval=self.config.get("hot_reload_interval", 2),
+            on_change=self.reload_catalog,
+        )
+        self.reload_lock = Lock()
+        self.catalog = self.build_catalog()
         self.workflow_node_count = {}
+        self.breakers = {}
+        self.health = HealthProber(
+            interval=self.config.get("health_probe_interval", 5),
+            timeout=self.config.get("health_probe_timeout", 2),
+            on_change=self.on_backend_state_change,
+            max_backends=self.config.get("health_probe_max_backends", 32),
+            idle_timeout=self.config.get("health_probe_idle_timeout", 3600),
+        )
+        self.health.track(self.config.get("local_comfyui_url"), pinned=True)
+        self.object_info_cache = ObjectInfoCache(
+            ttl=self.config.get("object_info_ttl", 600),
+            timeout=self.config.get("timeout", 30),
+        )
+
+    def load_store(self):
+        try:
+            return WorkflowStore.from_payload()
+        except Exception as e:
+            logger.error(f"🔥 payload 读取失败: {e}")
+            return WorkflowStore()
+
+    # 以下属性始终指向当前目录；需要前后一致的调用方应先取 self.catalog 再使用
+    @property
+    def store(self):
+        return self.catalog.store
+
+    @property
+    def mappings(self):
+        return self.catalog.mappings
+
+    @property
+    def mapping_index(self):
+        return self.catalog.mapping_index
+
+    @property
+    def workflow_cache(self):
+        return self.catalog.workflow_cache
+
+    def build_catalog(self):
+        """Load payload index and mappings into a new catalog; mappings are compiled in the background."""
+        # 先记录签名再加载，加载期间发生的修改会在下一轮再次触发
+        sources = self.watcher.snapshot()
+        store = self.load_store()
+        mappings = store.mappings
+        if self.mappings_file is not None:
+            mappings = self.load_mappings(self.mappings_file)
+        mapping_index = MappingIndex(mappings.get('workflow_mappings', {}))
+        # 后台预编译参数映射，错误路径在启动和每次热更新时集中报告一次
+        Thread(target=mapping_index.compile_all, args=(store,), daemon=True).start()
+        return WorkflowCatalog(store, mappings, mapping_index, sources, time.time())
+
+    def reload_catalog(self, changed=None):
+        """Rebuild the catalog in the calling (background) thread and swap it in atomically."""
+        with self.reload_lock:
+            if self.watcher.snapshot() == self.catalog.sources:
+                logger.debug("♻️ 工作流文件未变化，跳过重新加载")
+                return False
+            try:
+                catalog = self.build_catalog()
+            except Exception as e:
+                logger.error(f"❌ 热更新加载失败: {e}")
+                return False
+            self.catalog = catalog
+        logger.info(f"♻️ 热更新完成，工作流数量: {len(catalog.mappings.get('workflow_mappings', {}))}")
+        return True
+
+    def reload_payload(self):
+        """后台更新下载完新 payload 后热加载，无需重启"""
+        return self.reload_catalog([CONTAINER_FILE])
 
     def save_config(self):
-        """Persist current configuration to disk."""
+        """Persist current configuration to disk; written to a temp file and renamed, so readers never see a torn file."""
+        # 每个进程使用自己的临时文件，多个 worker 同时保存时互不覆盖写到一半的内容
+        tmp_path = f"{self.config_file}.{os.getpid()}.tmp"
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(self.config, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.config_file)
             logger.info("💾 配置已保存")
         except Exception as e:
             logger.warning(f"⚠️ 配置保存失败: {e}")
@@ -512,10 +582,58 @@ class HuiYingProxy:
             "mode": "local",
             "proxy_port": 8080,
             "enable_cloud_fallback": True,
+            "cloud_fallback_queue_limit": 8,
+            "circuit_failure_threshold": 3,
+            "circuit_recovery_timeout": 30,
             "timeout": 30,
+            "connect_timeout": 3,
+            "health_probe_interval": 5,
+            "health_probe_timeout": 2,
+            # 最多同时探测的后端数；超过 health_probe_idle_timeout 秒没有提交的后端停止探测
+            "health_probe_max_backends": 32,
+            "health_probe_idle_timeout": 3600,
+            "cloud_timeout": 10,
+            "check_online_cache_ttl": 30,
+            "cloud_pool_size": 20,
             "enable_parameter_validation": True,
+            "object_info_ttl": 600,
             "enable_workflow_cache": True,
-            "log_level": "INFO"
+            "log_level": "INFO",
+            # text 或 jsonl；日志按大小/时间滚动并压缩，保留最近 log_backup_count 份
+            "log_format": "text",
+            "log_max_mb": 20,
+            "log_rotate_hours": 24,
+            "log_backup_count": 10,
+            "enable_log_index": True,
+            "log_index_retention_hours": 72,
+            # 每个请求结束时以 INFO 记录路由、方法、状态码与耗时；成功请求按 log_request_sample_rate 抽样
+            "log_requests": True,
+            "log_request_sample_rate": 1.0,
+            "enable_hot_reload": True,
+            "hot_reload_interval": 2,
+            # worker 进程数；state_store: auto / sqlite（默认持久化到 SQLite，重启后恢复任务与未读消息，
+            # 多 worker 共享同一文件）/ memory（显式关闭持久化，仅限单 worker）
+            "workers": 1,
+            "state_store": "auto",
+            "state_db": "huiying_state.db",
+            # 任务状态与未读消息的保留时间（秒）；启动时与 ComfyUI 对账未完成的任务
+            "task_ttl": 7200,
+            "message_ttl": 7200,
+            "enable_task_recovery": True,
+            # 公平调度（仅单 worker）：按客户端加权轮转放行，每个后端最多同时占用 scheduler_max_outstanding 个 ComfyUI 队列位置
+            "enable_fair_scheduler": False,
+            "scheduler_max_outstanding": 2,
+            "scheduler_max_priority": 5,
+            "scheduler_slot_timeout": 1800,
+            # 只改种子的同一工作流提交在窗口内合并为一个批次 prompt
+            "enable_batch_coalescing": False,
+            "batch_coalescing_window_ms": 500,
+            "batch_coalescing_max": 8,
+            # 插件的 /ws 断开且 grace 秒内未重连时，取消该客户端未完成的任务
+            "cancel_on_disconnect": False,
+            "cancel_disconnect_grace": 10,
+            # 排队位置估算时后端 /queue 的缓存秒数
+            "eta_queue_ttl": 2
         }
         logger.info(f"📁 开始扫描所需的必要文件")
 
@@ -562,10 +680,16 @@ class HuiYingProxy:
             logger.error(f"🔥 配置文件读取失败: {str(e)}")
             return {}
 
-    def load_workflow(self, workflow_id):
-        if self.config.get('enable_workflow_cache', True) and workflow_id in self.workflow_cache:
+    def load_workflow(self, workflow_id, catalog=None):
+        catalog = catalog or self.catalog
+        workflow = catalog.store.get_workflow(workflow_id)
+        if workflow is not None:
+            logger.info(f"⚡ 从内存中加载当前工作流: {workflow_id}")
+            return workflow
+        # 兼容 workflow_dir 中用户自行放置的工作流
+        if self.config.get('enable_workflow_cache', True) and workflow_id in catalog.workflow_cache:
             logger.info(f"⚡ 从缓存中加载当前工作流: {workflow_id}")
-            return self.workflow_cache[workflow_id]
+            return catalog.workflow_cache[workflow_id]
         workflow_file = os.path.join(self.config['workflow_dir'], f"{workflow_id}.json")
         if not os.path.exists(workflow_file):
             logger.error(f"❌ 工作流文件不存在: {workflow_file}")
@@ -574,58 +698,123 @@ class HuiYingProxy:
             with open(workflow_file, "r", encoding="utf-8") as f:
                 workflow = json.load(f)
             if self.config.get('enable_workflow_cache', True):
-                self.workflow_cache[workflow_id] = workflow
+                catalog.workflow_cache[workflow_id] = workflow
             logger.info(f"📄 从缓存中读取到当前工作流: {workflow_id}")
             return workflow
         except Exception as e:
             logger.error(f"工作流加载失败 {workflow_id}: {e}")
             raise
       
-    def _set_nested_value(self, data, path, value):
-
-        try:
-            for key in path[:-1]:
-                if isinstance(key, int):
-                    data = data[key]
-                else:
-                    data = data.setdefault(key, {})
-            last_key = path[-1]
-            if isinstance(last_key, int):
-                data[last_key] = value
-            else:
-                data[last_key] = value
-            logger.debug(f"✅ 设置路径 {path} = {value}")
-        except Exception as e:
-            logger.error(f"❌ 设置参数失败: path={path}, value={value}, 错误: {e}")
-
-    def merge_workflow_params(self, workflow, param_dict, workflow_id):
+    def merge_workflow_params(self, workflow, param_dict, workflow_id, catalog=None):
       
         try:
-            merged_workflow = copy.deepcopy(workflow)
-
-            workflow_mappings = self.mappings.get('workflow_mappings', {})
-            param_mappings = workflow_mappings.get(workflow_id, {}).get('param_mappings', {})
-
             logger.info(f"🔧 匹配到绘影 AIGC 发送的 {len(param_dict)} 个参数")
-
-            for param_key, param_value in param_dict.items():
-                if isinstance(param_value, str) and param_value.startswith("默认"):
-                    #logger.info(f"🆗 默认参数: {param_key} = {param_value}")
-                    continue
-                if param_key not in param_mappings:
-                    logger.debug(f"⏭️ 未映射参数: {param_key}")
-                    continue
-
-                path = param_mappings[param_key]
-                self._set_nested_value(merged_workflow, path, param_value)
-
-            return merged_workflow
+            return (catalog or self.catalog).mapping_index.merge(workflow_id, workflow, param_dict)
 
         except Exception as e:
             logger.error(f"❌ 参数合并失败: {e}")
             raise
        
-    def send_to_comfyui(self, workflow_data, client_id, comfyui_url=None):
+    def validate_workflow(self, workflow_data, comfyui_url):
+        """Check against the cached /object_info; skipped (empty list) until the schema is cached."""
+        comfyui_url = sanitize_url(comfyui_url)
+        entry = self.object_info_cache.get(comfyui_url)
+        if entry is None:
+            logger.debug("⏭️ object_info 尚未缓存，跳过参数校验")
+            return []
+        workflow_data = adapt_workflow_paths(workflow_data, comfyui_url)
+        errors = validate_workflow(workflow_data, entry.schema)
+        # 新下载的模型/新装的节点可能还不在缓存里：缓存不是刚拉取的就重新获取一次再判定
+        if errors and entry.age > 30:
+            entry = self.object_info_cache.fetch(comfyui_url)
+            if entry is None:
+                return []
+            errors = validate_workflow(workflow_data, entry.schema)
+        return errors
+
+    def get_breaker(self, comfyui_url):
+        breaker = self.breakers.get(comfyui_url)
+        if breaker is None:
+            breaker = self.breakers.setdefault(comfyui_url, CircuitBreaker(
+                comfyui_url,
+                failure_threshold=self.config.get("circuit_failure_threshold", 3),
+                recovery_timeout=self.config.get("circuit_recovery_timeout", 30),
+            ))
+        return breaker
+
+    def on_backend_state_change(self, comfyui_url, previous, state):
+        if state == BACKEND_UP:
+            # 后端恢复：立即关闭熔断；若之前宕机过，节点/模型可能已变化
+            self.get_breaker(comfyui_url).record_success()
+            if previous == BACKEND_DOWN:
+                self.object_info_cache.invalidate(comfyui_url)
+
+    def should_use_cloud(self, comfyui_url):
+        """Decide right before submitting whether this commit goes to the cloud instead of comfyui_url.
+
+        Returns (use_cloud, probe); probe is True if the commit was granted the breaker's half-open probe
+        and must release it if it is dropped before reaching the backend."""
+        if not self.config.get("enable_cloud_fallback", True):
+            return False, False
+        if self.health.is_down(comfyui_url):
+            logger.warning(f"⚠️ 本地后端探测为离线，任务转发至云端: {comfyui_url}")
+            return True, False
+        queue_limit = self.config.get("cloud_fallback_queue_limit", 8)
+        queue_depth = state.backend_depths().get(comfyui_url, 0)
+        if fair_scheduler_enabled():
+            # 调度器限制了 ComfyUI 里的排队数，代理侧等待的任务也计入队列深度
+            queue_depth += scheduler.waiting(comfyui_url)
+        if queue_limit and queue_depth >= queue_limit:
+            logger.warning(f"⚠️ 本地队列已满 ({queue_depth})，任务转发至云端")
+            return True, False
+        allowed = self.get_breaker(comfyui_url).allow_request()
+        if not allowed:
+            logger.warning(f"⚠️ 本地后端熔断中，任务转发至云端: {comfyui_url}")
+            return True, False
+        return False, allowed == PROBE
+
+    def cloud_url(self):
+        url = sanitize_url(self.config.get("cloud_service_url") or CLOUD_BASE_URL)
+        if not url.startswith(("http://", "https://")):
+            url = f"https://{url}"
+        return url
+
+    def send_to_cloud(self, commit_data, headers):
+        """Forward the original plugin commit to the cloud service's huiYingCommit endpoint."""
+        url = f"{self.cloud_url()}/psPlus/workflow/huiYingCommit"
+        timeout = (self.config.get("connect_timeout", 3), self.config.get("timeout", 30))
+        logger.info(f"☁️ 正在提交任务到云端: {url}")
+        try:
+            response = requests.post(url, json=commit_data, headers=headers, timeout=timeout)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"code": response.status_code, "msg": response.text}
+            return response.status_code, body
+        except requests.RequestException as e:
+            logger.error(f"❌ 云端请求失败: {e}")
+            return 502, {"code": 502, "msg": f"云端请求失败: {str(e)}"}
+
+    def cancel_on_backend(self, comfyui_url, prompt_id):
+        """Interrupt prompt_id if it is running, or delete it from the queue if pending.
+
+        Returns "running", "queued", or None when ComfyUI no longer has the prompt."""
+        comfyui_url = sanitize_url(comfyui_url)
+        timeout = (self.config.get("connect_timeout", 3), self.config.get("timeout", 30))
+        response = requests.get(f"{comfyui_url}/queue", timeout=timeout)
+        response.raise_for_status()
+        queue = response.json()
+        # 队列项格式: [number, prompt_id, prompt, extra_data, outputs_to_execute]
+        if any(len(item) > 1 and item[1] == prompt_id for item in queue.get("queue_running", [])):
+            # 新版 ComfyUI 只在正在执行的正是该 prompt 时中断；旧版忽略参数，但此时它就是正在执行的那个
+            requests.post(f"{comfyui_url}/interrupt", json={"prompt_id": prompt_id}, timeout=timeout).raise_for_status()
+            return "running"
+        if any(len(item) > 1 and item[1] == prompt_id for item in queue.get("queue_pending", [])):
+            requests.post(f"{comfyui_url}/queue", json={"delete": [prompt_id]}, timeout=timeout).raise_for_status()
+            return "queued"
+        return None
+
+    def send_to_comfyui(self, workflow_data, client_id, comfyui_url=None, prompt_id=None):
 
         import requests
 
@@ -634,6 +823,7 @@ class HuiYingProxy:
         comfyui_url = sanitize_url(comfyui_url)
         workflow_data = adapt_workflow_paths(workflow_data, comfyui_url)
         url = f"{comfyui_url}/prompt"
+        breaker = self.get_breaker(comfyui_url)
 
         try:
             headers = {
@@ -643,26 +833,95 @@ class HuiYingProxy:
                 "client_id": client_id,
                 "prompt": workflow_data
             }
+            if prompt_id:
+                payload["prompt_id"] = prompt_id
             logger.info(f"🚀 正在提交任务到 生成服务器: {url}")
-            response = requests.post(url, json=payload, headers=headers, timeout=self.config.get("timeout", 30))
+            # 连接超时单独设短，后端宕机时尽快失败而不是等满 timeout
+            timeout = (self.config.get("connect_timeout", 3), self.config.get("timeout", 30))
+            response = requests.post(url, json=payload, headers=headers, timeout=timeout)
+
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
 
             if response.status_code == 200:
                 logger.info("✅ 任务提交成功")
                 return {"data": response.json()}
             else:
                 logger.error(f"❌ 任务请求失败，状态码: {response.status_code}, 内容: {response.text}")
-                return {"error": f"任务 请求失败: {response.status_code}", "detail": response.text}
+                return {"error": f"任务 请求失败: {response.status_code}", "detail": response.text,
+                        "retryable": response.status_code >= 500}
 
         except Exception as e:
+            breaker.record_failure()
             logger.error(f"❌ ComfyUI请求失败: {str(e)}")
-            return {"error": str(e)}
+            return {"error": str(e), "retryable": True}
 proxy = HuiYingProxy()
 COMFYUI_URL = sanitize_url(proxy.config.get("local_comfyui_url", COMFYUI_URL))
+log_pipeline.configure(proxy.config)
+
+# workers > 1 时 fork 多个进程共同监听端口（仅 POSIX），状态改用 SQLite 共享
+WORKERS = effective_workers(proxy.config.get("workers", 1))
+worker_index = 0
+state = create_state_store(proxy.config, WORKERS)
+
+
+def fair_scheduler_enabled():
+    # 调度名额按进程计数，多个 worker 各自放行会突破 max_outstanding，也无法跨进程轮转
+    return WORKERS == 1 and proxy.config.get("enable_fair_scheduler", False)
+
+
+if WORKERS > 1 and proxy.config.get("enable_fair_scheduler", False):
+    logger.warning("⚠️ 公平调度仅支持单 worker，workers > 1 时不启用 enable_fair_scheduler")
+
+
+# 日志检索索引，由日志写线程批量写入
+log_index = None
+if proxy.config.get("enable_log_index", True):
+    try:
+        log_index = LogIndex(
+            proxy.config.get("log_index_file", "huiying_logs.db"),
+            retention_hours=proxy.config.get("log_index_retention_hours", 72),
+        )
+        log_pipeline.add_sink(log_index)
+    except Exception as e:
+        logger.warning(f"⚠️ 日志索引初始化失败，检索不可用: {e}")
 
 
 @app.before_request
 def log_all_requests():
-    logger.info(f"📡 收到绘影接口请求: {request.method} {request.path}")
+    g.request_started = time.time()
+    logger.debug("📡 收到绘影接口请求: %s %s", request.method, request.path)
+
+
+@app.after_request
+def log_request_done(response):
+    if not proxy.config.get("log_requests", True) or not logger.isEnabledFor(logging.INFO):
+        return response
+    # 出错的请求总是记录，成功的按比例抽样，避免轮询接口刷屏
+    if response.status_code < 400 and random.random() >= proxy.config.get("log_request_sample_rate", 1.0):
+        return response
+    duration = round((time.time() - g.get("request_started", time.time())) * 1000, 1)
+    logger.info(
+        "📡 %s %s → %s (%.0fms)", request.method, request.path, response.status_code, duration,
+        extra={
+            "route": request.path,
+            "method": request.method,
+            "status": response.status_code,
+            "client_id": request.args.get("clientId") or request.headers.get("Clientid"),
+            "duration": duration,
+        }
+    )
+    return response
+
+
+@app.after_request
+def record_commit_metrics(response):
+    if request.endpoint == 'huiying_commit':
+        duration = (time.time() - g.get("request_started", time.time())) * 1000
+        metrics.record_commit(duration, ok=response.status_code < 400)
+    return response
 
 # 处理跨域请求
 @app.route('/api/poll', methods=['GET'])
@@ -679,8 +938,8 @@ def poll_messages():
         
 
         extra_info = {
-            "active_tasks": len(task_status),
-            "queue_size": len(message_queue.get(client_id, [])),
+            "active_tasks": state.task_count(),
+            "queue_size": state.queue_size(client_id),
             "server_time": time.time()
         }
         
@@ -703,14 +962,23 @@ def poll_messages():
 def get_task_status(prompt_id):
 
     try:
-        if prompt_id in task_status:
-            status_info = task_status[prompt_id]
+        status_info = state.get_task(prompt_id)
+        if status_info is not None:
          
             enhanced_status = {
                 **status_info,
                 "age_seconds": time.time() - status_info["timestamp"],
                 "is_recent": (time.time() - status_info["timestamp"]) < 300  # 5分钟内
             }
+            if status_info["type"] not in ("done", "error", CANCELLED):
+                try:
+                    estimate = task_estimate(prompt_id, status_info)
+                except (requests.RequestException, ValueError) as e:
+                    logger.debug("排队位置估算失败 %s: %s", prompt_id, e)
+                    estimate = None
+                if estimate:
+                    enhanced_status.update(estimate)
+                    enhanced_status["runtime"] = eta_estimator.distribution(status_info["data"].get("workflow_id"))
             
             return jsonify({
                 "code": 0,
@@ -727,23 +995,31 @@ def get_task_status(prompt_id):
     except Exception as e:
         logger.error(f"获取任务状态失败: {e}")
         return jsonify({"error": f"获取状态失败: {str(e)}"}), 500
-# #comfyui对象信息接口
-# @app.route('/api/object_info', methods=['GET'])
-# def proxy_object_info():
-  
-#     try:
-#         comfyui_url = request.args.get('comfyuiUrl') or proxy.config.get('local_comfyui_url', COMFYUI_URL)
-#         comfyui_url = sanitize_url(comfyui_url)
-#         res = requests.get(f"{comfyui_url}/object_info", timeout=10)
-#         logger.info("🔁 成功转发 object_info，状态码: %s", res.status_code)
-#         return Response(
-#             res.content,
-#             status=res.status_code,
-#             content_type=res.headers.get('Content-Type', 'application/json')
-#         )
-#     except Exception as e:
-#         logger.error(f"❌ object_info 转发失败: {e}")
-#         return jsonify({"error": f"连接失败: {str(e)}"}), 500
+#comfyui对象信息接口（按后端缓存，支持 ETag / gzip）
+@app.route('/api/object_info', methods=['GET'])
+def proxy_object_info():
+
+    comfyui_url = request.args.get('comfyuiUrl') or proxy.config.get('local_comfyui_url', COMFYUI_URL)
+    comfyui_url = sanitize_url(comfyui_url)
+    cache = proxy.object_info_cache
+    # 有缓存时直接返回（过期则后台刷新），仅首次需要等待下载
+    entry = cache.get(comfyui_url) or cache.fetch(comfyui_url)
+    if entry is None:
+        logger.error(f"❌ object_info 获取失败: {comfyui_url}")
+        return jsonify({"error": "连接失败: 无法获取 object_info"}), 500
+
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    etag = entry.gzip_etag if use_gzip else entry.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = entry.gzip_body
+    else:
+        body = entry.body
+    return Response(body, status=200, content_type=entry.content_type, headers=headers)
 # #图像上传接口
 # @app.route('/upload/image', methods=['POST'])
 # def proxy_upload_image():
@@ -781,6 +1057,465 @@ def get_task_status(prompt_id):
 #     except Exception as e:
 #         logger.exception("❌ mask 转发失败:")
 #         return jsonify({"code": 500, "msg": "上传 mask 转发失败", "error": str(e)}), 500
+def commit_to_cloud(data, client_id, workflow_id):
+    """Send a commit to the cloud service and register it so /api/task_status knows about it."""
+    headers = {
+        key: value for key, value in request.headers.items()
+        if key.lower() not in ('host', 'content-length')
+    }
+    status_code, body = proxy.send_to_cloud(data, headers)
+    prompt_id = ((body or {}).get("data") or {}).get("prompt_id") if isinstance(body, dict) else None
+    if status_code == 200 and prompt_id:
+        state.set_task(prompt_id, {
+            "type": "submitted",
+            "data": {
+                "prompt_id": prompt_id,
+                "client_id": client_id,
+                "workflow_id": workflow_id,
+                "backend": "cloud"
+            },
+            "timestamp": time.time(),
+            "enhanced": True
+        })
+        add_message_to_queue(client_id, {
+            "type": "task_submitted",
+            "data": {"prompt_id": prompt_id, "workflow_id": workflow_id, "client_id": client_id, "backend": "cloud"}
+        })
+        logger.info(
+            f"☁️ 云端提交成功 → prompt_id: {prompt_id}",
+            extra={"prompt_id": prompt_id, "client_id": client_id, "workflow_id": workflow_id, "backend": "cloud"}
+        )
+    return jsonify(body), status_code
+
+def register_local_task(prompt_id, client_id, workflow_id, total_nodes, comfyui_url):
+    """Record a prompt accepted by a local ComfyUI, start progress tracking and tell the client."""
+    state.set_task(prompt_id, {
+        "type": "submitted",
+        "data": {
+            "prompt_id": prompt_id,
+            "client_id": client_id,
+            "workflow_id": workflow_id,
+            "node_count": total_nodes,
+            "backend": comfyui_url
+        },
+        "timestamp": time.time(),
+        "enhanced": True
+    })
+
+    start_progress_tracker_by_mapping(prompt_id, workflow_id, client_id, comfyui_url)
+
+    submit_message = {
+        "type": "task_submitted",
+        "data": {
+            "prompt_id": prompt_id,
+            "workflow_id": workflow_id,
+            "node_count": total_nodes,
+            "client_id": client_id
+        }
+    }
+    add_message_to_queue(client_id, submit_message)
+
+
+def is_cancelled(prompt_id):
+    status = state.get_task(prompt_id)
+    return status is not None and status["type"] == CANCELLED
+
+
+def submit_scheduled(job):
+    """Called by the scheduler (or directly) when a held commit or batch is released to its backend."""
+    payload = job.payload
+    members = payload.get("members")
+    if members:
+        # 等待期间可能有成员被取消（取消请求可能落在其他 worker 上），按剩余成员重排批次
+        remaining = [member for member in members if not is_cancelled(member[0])]
+        if not remaining:
+            if payload.get("probe"):
+                proxy.get_breaker(job.backend).release_probe()
+            return False
+        if len(remaining) < len(members):
+            members, total = [], 0
+            for prompt_id, client_id, _start, count in remaining:
+                members.append([prompt_id, client_id, total, count])
+                total += count
+            payload = {**payload, "workflow": merge_batch(payload["workflow"], total), "members": members}
+    elif is_cancelled(job.prompt_id):
+        if payload.get("probe"):
+            proxy.get_breaker(job.backend).release_probe()
+        return False
+    result = proxy.send_to_comfyui(payload["workflow"], job.client_id, job.backend, prompt_id=job.prompt_id)
+    if "error" in result:
+        failed = [(member[0], member[1]) for member in members] if members else [(job.prompt_id, job.client_id)]
+        state.update_task(job.prompt_id, "error", {"status": "error", "error": result["error"]})
+        for prompt_id, client_id in failed:
+            state.update_task(prompt_id, "error", {"status": "error", "error": result["error"]})
+            add_message_to_queue(client_id, {
+                "type": "execution_error",
+                "data": {"prompt_id": prompt_id, "exception_message": f"ComfyUI请求失败: {result['error']}"}
+            })
+        return False
+    prompt_id = result["data"].get("prompt_id") or job.prompt_id
+    if prompt_id != job.prompt_id:
+        # 旧版 ComfyUI 不接受指定的 prompt_id，以后端分配的为准，并告知客户端对应关系
+        scheduler.rename(job.prompt_id, prompt_id)
+        state.update_task(job.prompt_id, "submitted", {"comfy_prompt_id": prompt_id})
+    if members:
+        register_batch(prompt_id, members, payload["workflow_id"], payload["total_nodes"], job.backend)
+    else:
+        register_local_task(prompt_id, job.client_id, payload["workflow_id"], payload["total_nodes"], job.backend)
+    logger.info(
+        f"🚦 调度放行 → prompt_id: {prompt_id}（等待 {time.time() - job.enqueued_at:.1f}s）",
+        extra={"prompt_id": prompt_id, "client_id": job.client_id, "workflow_id": payload["workflow_id"], "backend": job.backend}
+    )
+    return True
+
+
+def register_batch(batch_id, members, workflow_id, total_nodes, comfyui_url):
+    """Record a coalesced prompt; ComfyUI messages for batch_id are fanned out to the members."""
+    total = max(start + count for _prompt_id, _client_id, start, count in members)
+    state.set_task(batch_id, {
+        "type": "submitted",
+        "data": {
+            "prompt_id": batch_id,
+            "workflow_id": workflow_id,
+            "node_count": total_nodes,
+            "backend": comfyui_url,
+            "batch_members": members,
+            "batch_total": total
+        },
+        "timestamp": time.time(),
+        "enhanced": True
+    })
+    for prompt_id, client_id, start, count in members:
+        state.update_task(prompt_id, "submitted", {
+            "batch_id": batch_id, "batch_index": start, "batch_count": count, "batch_total": total
+        })
+        add_message_to_queue(client_id, {
+            "type": "task_submitted",
+            "data": {
+                "prompt_id": prompt_id,
+                "workflow_id": workflow_id,
+                "node_count": total_nodes,
+                "client_id": client_id,
+                "batch_id": batch_id,
+                "batch_index": start
+            }
+        })
+
+
+def release_job(prompt_id, client_id, backend, payload, priority=1):
+    """Hand a held commit to the fair scheduler, or submit it right away when scheduling is off."""
+    if fair_scheduler_enabled():
+        return scheduler.enqueue(prompt_id, client_id, backend, payload, priority)
+    job = ScheduledJob(prompt_id, client_id, backend, priority, payload)
+    job.started_at = time.time()
+    Thread(target=submit_scheduled, args=(job,), daemon=True).start()
+    return 0
+
+
+def flush_batch(backend, commits):
+    """Coalescer callback: submit one commit as-is, or several random-seed commits as a single batched prompt."""
+    # 探测名额随批次一起提交；整个批次都被取消时才交还
+    probe = any(commit.probe for commit in commits)
+    commits = [commit for commit in commits if not is_cancelled(commit.prompt_id)]
+    if not commits:
+        if probe:
+            proxy.get_breaker(backend).release_probe()
+        return
+    first = commits[0]
+    payload = {"workflow": first.workflow, "workflow_id": first.workflow_id, "total_nodes": first.total_nodes,
+               "probe": probe}
+    if len(commits) == 1:
+        if probe and not first.probe:
+            # 持有探测名额的提交已被取消，名额转给剩下的这个提交
+            state.update_task(first.prompt_id, "scheduled", {"probe": True})
+        release_job(first.prompt_id, first.client_id, backend, payload, first.priority)
+        return
+    members, start = [], 0
+    for commit in commits:
+        members.append([commit.prompt_id, commit.client_id, start, commit.batch_size])
+        start += commit.batch_size
+    batch_id = str(uuid.uuid4())
+    payload.update(workflow=merge_batch(first.workflow, start), members=members)
+    state.set_task(batch_id, {
+        "type": "scheduled",
+        "data": {"prompt_id": batch_id, "workflow_id": first.workflow_id, "backend": backend, "batch_members": members,
+                 "probe": probe},
+        "timestamp": time.time(),
+        "enhanced": True
+    })
+    for prompt_id, _client_id, member_start, count in members:
+        state.update_task(prompt_id, "scheduled", {"batch_id": batch_id, "batch_index": member_start, "batch_count": count})
+    logger.info(
+        f"🧩 合并 {len(commits)} 个只改种子的提交为 1 个批次（batch_size={start}，节省 {len(commits) - 1} 次 prompt）",
+        extra={"prompt_id": batch_id, "workflow_id": first.workflow_id, "backend": backend}
+    )
+    release_job(batch_id, first.client_id, backend, payload, max(commit.priority for commit in commits))
+
+
+def task_finished(prompt_id):
+    status = state.get_task(prompt_id)
+    if status is None or status["type"] in ("done", "error", CANCELLED):
+        return True
+    data = status["data"]
+    return status["type"] == "executing" and "node_id" in data and data["node_id"] is None
+
+
+scheduler = FairScheduler(
+    submit_scheduled,
+    max_outstanding=proxy.config.get("scheduler_max_outstanding", 2),
+    max_priority=proxy.config.get("scheduler_max_priority", 5),
+    slot_timeout=proxy.config.get("scheduler_slot_timeout", 1800),
+    is_finished=task_finished,
+)
+
+eta_estimator = EtaEstimator(state, queue_ttl=proxy.config.get("eta_queue_ttl", 2))
+queue_publish_lock = Lock()
+
+
+def record_runtime(prompt_id):
+    """Add a finished prompt's execution time to its workflow's runtime distribution."""
+    status = state.get_task(prompt_id)
+    if status is None:
+        return
+    data = status["data"]
+    # 合并批次的耗时随批次大小变化，不计入单次运行的分布
+    if data.get("batch_id") or data.get("batch_members"):
+        return
+    started_at, workflow_id = data.get("started_at"), data.get("workflow_id")
+    if started_at and workflow_id:
+        state.record_runtime(workflow_id, round(time.time() - started_at, 2))
+
+
+def task_estimate(prompt_id, status):
+    held_ahead = None
+    if status["type"] == "scheduled":
+        # 合并批次的成员在调度器里以批次的身份排队
+        held_ahead = scheduler.jobs_ahead(status["data"].get("batch_id") or prompt_id)
+    return eta_estimator.estimate(prompt_id, status, held_ahead)
+
+
+def publish_queue_positions(backend):
+    """Push queue_position messages to every task waiting on backend whose position changed."""
+    running, pending = eta_estimator.backend_queue(backend, fresh=True)
+    waiting = pending + [job.prompt_id for job in scheduler.waiting_jobs(backend)]
+    for comfy_id in waiting:
+        status = state.get_task(comfy_id)
+        if status is None:
+            continue
+        members = status["data"].get("batch_members")
+        targets = [(member[0], member[1]) for member in members] if members else [(comfy_id, status["data"].get("client_id"))]
+        for prompt_id, client_id in targets:
+            task = status if prompt_id == comfy_id else state.get_task(prompt_id)
+            if not client_id or task is None:
+                continue
+            estimate = task_estimate(prompt_id, task)
+            if estimate is None or estimate["queue_position"] == task["data"].get("queue_position"):
+                continue
+            state.update_task(prompt_id, task["type"], {
+                "queue_position": estimate["queue_position"], "eta_seconds": estimate["eta_seconds"]
+            })
+            add_message_to_queue(client_id, {"type": "queue_position", "data": {"prompt_id": prompt_id, **estimate}})
+
+
+def publish_queue_positions_async(backend):
+    # status 消息可能连续到达，同一时间只跑一次推送
+    if not queue_publish_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            publish_queue_positions(backend)
+        except Exception as e:
+            logger.debug("推送排队位置失败: %s", e)
+        finally:
+            queue_publish_lock.release()
+
+    Thread(target=run, daemon=True).start()
+
+
+coalescer = BatchCoalescer(
+    flush_batch,
+    window=proxy.config.get("batch_coalescing_window_ms", 500) / 1000.0,
+    max_batch=proxy.config.get("batch_coalescing_max", 8),
+)
+
+
+def coalesce_commit(merged_workflow, signature, batch_size, client_id, workflow_id, total_nodes, comfyui_url, priority,
+                    probe=False):
+    """Hold a commit briefly so identical random-seed variations can share one batched prompt.
+
+    probe marks the commit that owns the backend's half-open circuit breaker probe."""
+    prompt_id = str(uuid.uuid4())
+    priority = scheduler.clamp_priority(priority)
+    state.set_task(prompt_id, {
+        "type": "scheduled",
+        "data": {
+            "prompt_id": prompt_id,
+            "client_id": client_id,
+            "workflow_id": workflow_id,
+            "node_count": total_nodes,
+            "backend": comfyui_url,
+            "priority": priority,
+            "probe": probe
+        },
+        "timestamp": time.time(),
+        "enhanced": True
+    })
+    coalescer.add(comfyui_url, signature, CoalescedCommit(
+        prompt_id, client_id, workflow_id, merged_workflow, batch_size, total_nodes, priority, probe
+    ))
+    return jsonify({
+        "code": 0,
+        "msg": "提交成功",
+        "data": {
+            "prompt_id": prompt_id,
+            "taskId": prompt_id,
+            "client_id": client_id,
+            "node_num": total_nodes,
+            "scheduled": True,
+            "coalescing": True
+        }
+    }), 200
+
+
+def schedule_commit(merged_workflow, client_id, workflow_id, total_nodes, comfyui_url, priority, probe=False):
+    """Hold a commit in the fair scheduler; the prompt_id is assigned here and passed to /prompt on release."""
+    prompt_id = str(uuid.uuid4())
+    state.set_task(prompt_id, {
+        "type": "scheduled",
+        "data": {
+            "prompt_id": prompt_id,
+            "client_id": client_id,
+            "workflow_id": workflow_id,
+            "node_count": total_nodes,
+            "backend": comfyui_url,
+            "priority": scheduler.clamp_priority(priority),
+            "probe": probe
+        },
+        "timestamp": time.time(),
+        "enhanced": True
+    })
+    ahead = scheduler.enqueue(prompt_id, client_id, comfyui_url, {
+        "workflow": merged_workflow,
+        "workflow_id": workflow_id,
+        "total_nodes": total_nodes,
+        "probe": probe,
+    }, priority)
+    add_message_to_queue(client_id, {
+        "type": "task_scheduled",
+        "data": {"prompt_id": prompt_id, "workflow_id": workflow_id, "client_id": client_id, "queue_position": ahead}
+    })
+    logger.info(
+        f"🚦 任务进入调度队列 → prompt_id: {prompt_id}，前方等待 {ahead}",
+        extra={"prompt_id": prompt_id, "client_id": client_id, "workflow_id": workflow_id, "backend": comfyui_url}
+    )
+    return jsonify({
+        "code": 0,
+        "msg": "提交成功",
+        "data": {
+            "prompt_id": prompt_id,
+            "taskId": prompt_id,
+            "client_id": client_id,
+            "node_num": total_nodes,
+            "scheduled": True,
+            "queue_position": ahead
+        }
+    }), 200
+
+
+def cancel_task(prompt_id, reason="user"):
+    """Cancel a task wherever it is; returns (stage, error message)."""
+    status = state.get_task(prompt_id)
+    if status is None:
+        return None, "任务状态不存在"
+    if status["type"] in ("done", "error", CANCELLED):
+        return None, f"任务已结束（{status['type']}）"
+    data = status["data"]
+    backend = data.get("backend")
+    if backend == "cloud":
+        return None, "云端任务不支持取消"
+
+    if scheduler.remove(prompt_id) or coalescer.remove(prompt_id):
+        # 未到达后端就被移除，若它持有熔断探测名额需交还
+        if data.get("probe"):
+            proxy.get_breaker(backend).release_probe()
+        stage = "scheduled"
+    elif data.get("batch_id"):
+        stage = cancel_batch_member(prompt_id, data)
+    elif status["type"] == "scheduled":
+        # 由其他 worker 持有、尚未放行：标记取消后放行时会跳过
+        stage = "scheduled"
+    else:
+        stage = proxy.cancel_on_backend(backend, data.get("comfy_prompt_id") or prompt_id) or "finishing"
+
+    if not state.update_task(prompt_id, CANCELLED, {"status": CANCELLED, "reason": reason, "cancelled_stage": stage}):
+        return None, "任务已取消"
+    scheduler.release(prompt_id)
+    client_id = data.get("client_id")
+    if client_id:
+        add_message_to_queue(client_id, {
+            "type": "execution_cancelled",
+            "data": {"prompt_id": prompt_id, "reason": reason, "stage": stage}
+        })
+    logger.info(
+        f"🛑 任务已取消: {prompt_id}（{stage}，原因: {reason}）",
+        extra={"prompt_id": prompt_id, "client_id": client_id, "workflow_id": data.get("workflow_id"), "backend": backend}
+    )
+    return stage, None
+
+
+def cancel_batch_member(prompt_id, data):
+    """Detach one member from a coalesced batch; the batch itself is cancelled once no member is left."""
+    batch_id = data["batch_id"]
+    batch = state.get_task(batch_id)
+    if batch is None:
+        return "finishing"
+    members = [member for member in batch["data"].get("batch_members", []) if member[0] != prompt_id]
+    if members:
+        # 其他成员仍需要结果，批次照常执行，只是不再向该成员转发消息
+        state.update_task(batch_id, batch["type"], {"batch_members": members})
+        return "detached"
+    if scheduler.remove(batch_id):
+        if batch["data"].get("probe"):
+            proxy.get_breaker(batch["data"]["backend"]).release_probe()
+        stage = "scheduled"
+    else:
+        stage = proxy.cancel_on_backend(batch["data"]["backend"], batch_id) or "finishing"
+    state.update_task(batch_id, CANCELLED, {"status": CANCELLED, "batch_members": []})
+    scheduler.release(batch_id)
+    return stage
+
+
+def cancel_after_disconnect(client_id, disconnected_at):
+    # SQLite 存储按间隔写 last_seen，宽限期至少要覆盖一次写入
+    grace = max(proxy.config.get("cancel_disconnect_grace", 10), state.last_seen_interval + 2)
+    time.sleep(grace)
+    # 轮询消息会刷新 last_seen，宽限期内重连过就不取消
+    if client_id in state.active_clients(time.time() - disconnected_at):
+        return
+    for prompt_id, status in state.client_tasks(client_id):
+        if status["type"] in ("done", "error", CANCELLED) or status["data"].get("backend") == "cloud":
+            continue
+        try:
+            cancel_task(prompt_id, reason="disconnect")
+        except Exception as e:
+            logger.warning(f"⚠️ 断开连接后取消任务失败 {prompt_id}: {e}")
+
+
+@app.route('/api/cancel/<prompt_id>', methods=['POST'])
+def cancel_prompt(prompt_id):
+    reason = (request.get_json(silent=True) or {}).get("reason", "user")
+    try:
+        stage, error = cancel_task(prompt_id, reason)
+    except requests.RequestException as e:
+        logger.error(f"❌ 取消任务失败 {prompt_id}: {e}")
+        return jsonify({"code": 502, "msg": f"ComfyUI请求失败: {str(e)}"}), 502
+    if error:
+        code = 404 if state.get_task(prompt_id) is None else 409
+        return jsonify({"code": code, "msg": error}), code
+    return jsonify({"code": 0, "msg": "已取消", "data": {"prompt_id": prompt_id, "stage": stage}})
+
+
 #数据提交接口
 @app.route('/psPlus/workflow/huiYingCommit', methods=['POST'])
 def huiying_commit():
@@ -813,8 +1548,11 @@ def huiying_commit():
         client_id = data.get('clientId', str(uuid.uuid4()))
         comfyui_url = data.get('comfyuiUrl') or proxy.config.get('local_comfyui_url', COMFYUI_URL)
         comfyui_url = sanitize_url(comfyui_url)
-        proxy.config['local_comfyui_url'] = comfyui_url
-        proxy.save_config()
+        if comfyui_url != proxy.config.get('local_comfyui_url'):
+            # 只在地址变化时写盘，且只由 worker 0 写，避免每次提交都重写配置、多进程并发写同一文件
+            proxy.config['local_comfyui_url'] = comfyui_url
+            if worker_index == 0:
+                proxy.save_config()
         COMFYUI_URL = comfyui_url
         
        
@@ -823,14 +1561,17 @@ def huiying_commit():
         
         
         try:
-            workflow = proxy.load_workflow(workflow_id)
+            # 本次提交全程使用同一份目录快照，期间的热更新不影响它
+            catalog = proxy.catalog
+            workflow = proxy.load_workflow(workflow_id, catalog)
             logger.info(f"📦 工作流加载成功: {workflow_id}")
             logger.info(f"📊 存在总节点数: {len(workflow)}")
             logger.info(f"📥 接收参数数量: {len(param_dict)}")
             
            
-            for k, v in param_dict.items():
-                logger.debug(f"  ├─ 参数: {k} = {v}")
+            if logger.isEnabledFor(logging.DEBUG):
+                for k, v in param_dict.items():
+                    logger.debug("  ├─ 参数: %s = %s", k, v)
                 
         except FileNotFoundError:
             return jsonify({"code": 404, "msg": f"工作流不存在: {workflow_id}"}), 404
@@ -839,7 +1580,7 @@ def huiying_commit():
         
       
         try:
-            merged_workflow = proxy.merge_workflow_params(workflow, param_dict, workflow_id)
+            merged_workflow = proxy.merge_workflow_params(workflow, param_dict, workflow_id, catalog)
 
             
             total_nodes = len([
@@ -858,67 +1599,99 @@ def huiying_commit():
                     logger.warning(f"⚠️ 移除非法节点: {key}")
             merged_workflow = valid_workflow
 
-            try:
-                BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-                model_name = None
-                sampler_name = "N/A"
-                scheduler = "N/A"
-                steps = "N/A"
-                cfg = "N/A"
-                denoise = "N/A"
-                seed = "N/A"
-
-                has_checkpoint = False
-
-                for node_id, node in merged_workflow.items():
-                    if not isinstance(node, dict):
-                        continue
-                    inputs = node.get("inputs", {})
-                    class_type = node.get("class_type", "")
-
-                    if class_type == "CheckpointLoaderSimple":
-                        model_name = inputs.get("ckpt_name")
-                        has_checkpoint = True
-                    elif class_type == "UNetLoader" and not has_checkpoint:
-                        model_name = "UNET 及其他"
-
-                    if class_type in ["KSampler", "KSamplerAdvanced"]:
-                        sampler_name = inputs.get("sampler_name", sampler_name)
-                        scheduler = inputs.get("scheduler", scheduler)
-                        steps = inputs.get("steps", steps)
-                        cfg = inputs.get("cfg", cfg)
-                        denoise = inputs.get("denoise", denoise)
-                        seed = inputs.get("seed", seed)
-
-                    if "image" in inputs:
-                        image_path = inputs["image"]
-                        width = inputs.get("width", "未知")
-                        height = inputs.get("height", "未知")
-                        image_size = f"{width}x{height}"
-
-
-                seed_info = f"{seed}（随机）" if str(seed) in ["-1", "None", "-1.0"] else str(seed)
-                model_display = model_name if model_name else "UNET 及其他"
-
-                logger.info("📤 ******** 工作流概要 ********")
-                logger.info(f"🎯 工作流 ID: {workflow_id}")
-                logger.info(f"🤖 模型: {model_display}")
-                logger.info(f"⚙️ 采样器: {sampler_name} | 调度器: {scheduler}")
-                logger.info(f"🎛️ 重绘幅度: {denoise} | 步数: {steps} | CFG: {cfg}")
-                logger.info(f"🎲 种子: {seed_info}")
-                logger.info(f"📊 节点总数: {total_nodes}")
-                logger.info("📤 ***************************")
-
-            except Exception as e:
-                logger.warning(f"⚠️ 工作流概要打印失败: {e}")
+            # 概要只用于人工查看，INFO 关闭时整段跳过
+            if logger.isEnabledFor(logging.INFO):
+                try:
+                    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+                    model_name = None
+                    sampler_name = "N/A"
+                    scheduler_name = "N/A"
+                    steps = "N/A"
+                    cfg = "N/A"
+                    denoise = "N/A"
+                    seed = "N/A"
+
+                    has_checkpoint = False
+
+                    for node_id, node in merged_workflow.items():
+                        if not isinstance(node, dict):
+                            continue
+                        inputs = node.get("inputs", {})
+                        class_type = node.get("class_type", "")
+
+                        if class_type == "CheckpointLoaderSimple":
+                            model_name = inputs.get("ckpt_name")
+                            has_checkpoint = True
+                        elif class_type == "UNetLoader" and not has_checkpoint:
+                            model_name = "UNET 及其他"
+
+                        if class_type in ["KSampler", "KSamplerAdvanced"]:
+                            sampler_name = inputs.get("sampler_name", sampler_name)
+                            scheduler_name = inputs.get("scheduler", scheduler_name)
+                            steps = inputs.get("steps", steps)
+                            cfg = inputs.get("cfg", cfg)
+                            denoise = inputs.get("denoise", denoise)
+                            seed = inputs.get("seed", seed)
+
+                        if "image" in inputs:
+                            image_path = inputs["image"]
+                            width = inputs.get("width", "未知")
+                            height = inputs.get("height", "未知")
+                            image_size = f"{width}x{height}"
+
+
+                    seed_info = f"{seed}（随机）" if str(seed) in ["-1", "None", "-1.0"] else str(seed)
+                    model_display = model_name if model_name else "UNET 及其他"
+
+                    logger.info("📤 ******** 工作流概要 ********")
+                    logger.info(f"🎯 工作流 ID: {workflow_id}")
+                    logger.info(f"🤖 模型: {model_display}")
+                    logger.info(f"⚙️ 采样器: {sampler_name} | 调度器: {scheduler_name}")
+                    logger.info(f"🎛️ 重绘幅度: {denoise} | 步数: {steps} | CFG: {cfg}")
+                    logger.info(f"🎲 种子: {seed_info}")
+                    logger.info(f"📊 节点总数: {total_nodes}")
+                    logger.info("📤 ***************************")
+
+                except Exception as e:
+                    logger.warning(f"⚠️ 工作流概要打印失败: {e}")
 
         except Exception as e:
             logger.exception("❌ 参数合并失败:")
             return jsonify({"code": 500, "msg": f"参数合并失败: {str(e)}"}), 500
 
-       
+        if proxy.config.get("enable_parameter_validation", True):
+            errors = proxy.validate_workflow(merged_workflow, comfyui_url)
+            if errors:
+                for error in errors:
+                    logger.warning(f"⚠️ 参数校验未通过: {error}")
+                return jsonify({"code": 400, "msg": "参数校验失败", "data": {"errors": errors}}), 400
+
+        proxy.health.track(comfyui_url)
+        use_cloud, probe = proxy.should_use_cloud(comfyui_url)
+        if use_cloud:
+            return commit_to_cloud(data, client_id, workflow_id)
+        if proxy.health.is_down(comfyui_url):
+            # 已知离线且未启用云端兜底：立即失败，不占用协程等待超时
+            logger.error(f"❌ 生成服务器离线: {comfyui_url}")
+            return jsonify({"code": 503, "msg": "生成服务器离线，请稍后重试"}), 503
+
+        if proxy.config.get("enable_batch_coalescing", False):
+            batchable = batch_signature(merged_workflow)
+            if batchable:
+                return coalesce_commit(merged_workflow, *batchable, client_id, workflow_id, total_nodes,
+                                       comfyui_url, data.get("priority", 1), probe)
+
+        if fair_scheduler_enabled():
+            return schedule_commit(merged_workflow, client_id, workflow_id, total_nodes, comfyui_url,
+                                   data.get("priority", 1), probe)
+
         try:
             result = proxy.send_to_comfyui(merged_workflow, client_id, comfyui_url)
+            if "error" in result:
+                if result.get("retryable") and proxy.config.get("enable_cloud_fallback", True):
+                    logger.warning("⚠️ 本地提交失败，改为提交到云端")
+                    return commit_to_cloud(data, client_id, workflow_id)
+                return jsonify({"code": 500, "msg": f"ComfyUI请求失败: {result['error']}"}), 500
             prompt_id = result["data"].get("prompt_id")
 
             if not prompt_id:
@@ -926,32 +1699,7 @@ def huiying_commit():
                 return jsonify({"code": 500, "msg": "ComfyUI返回数据异常"}), 500
             
             
-            task_status[prompt_id] = {
-                "type": "submitted",
-                "data": {
-                    "prompt_id": prompt_id,
-                    "client_id": client_id,
-                    "workflow_id": workflow_id,
-                    "node_count": total_nodes  
-                },
-                "timestamp": time.time(),
-                "enhanced": True
-            }
-
-           
-            start_progress_tracker_by_mapping(prompt_id, workflow_id, client_id, comfyui_url)
-
-            
-            submit_message = {
-                "type": "task_submitted",
-                "data": {
-                    "prompt_id": prompt_id,
-                    "workflow_id": workflow_id,
-                    "node_count": total_nodes,  
-                    "client_id": client_id
-                }
-            }
-            add_message_to_queue(client_id, submit_message)
+            register_local_task(prompt_id, client_id, workflow_id, total_nodes, comfyui_url)
             response_data = {
                 "code": 0,
                 "msg": "提交成功",
@@ -965,7 +1713,10 @@ def huiying_commit():
             }
             
             #logger.info("✅ 任务提交成功")
-            logger.info(f"  → prompt_id: {prompt_id}")
+            logger.info(
+                f"  → prompt_id: {prompt_id}",
+                extra={"prompt_id": prompt_id, "client_id": client_id, "workflow_id": workflow_id, "backend": comfyui_url}
+            )
             logger.info(f"  → 节点总数: {total_nodes}")
             
             return jsonify(response_data), 200
@@ -998,22 +1749,31 @@ def proxy_ws():
         return
 
 
+    cancel_on_disconnect = request.args.get("cancelOnDisconnect")
+    if cancel_on_disconnect is None:
+        cancel_on_disconnect = proxy.config.get("cancel_on_disconnect", False)
+    else:
+        cancel_on_disconnect = cancel_on_disconnect.lower() in ("1", "true", "yes")
+
     try:
-        while True:
+        while not ws.closed:
             msgs = get_messages_for_client(client_id)
 
             if not msgs:
-                logger.debug(f"🕐 [client {client_id}] 当前无新消息")
+                logger.debug("🕐 [client %s] 当前无新消息", client_id)
             else:
                 for msg in msgs:
                     ws.send(json.dumps(msg))
-                    logger.info(f"📤 [client {client_id}] 已转发消息: {msg}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("📤 [client %s] 已转发消息: %s", client_id, msg)
 
             gevent.sleep(1)  
     except Exception as e:
         logger.warning(f"⚠️ WebSocket 异常: {e}")
     finally:
         ws.close()
+        if cancel_on_disconnect:
+            Thread(target=cancel_after_disconnect, args=(client_id, time.time()), daemon=True).start()
 
 @app.route('/api/config/comfyui_url', methods=['POST'])
 def update_comfyui_url():
@@ -1024,39 +1784,148 @@ def update_comfyui_url():
     url = sanitize_url(url)
     proxy.config['local_comfyui_url'] = url
     proxy.save_config()
+    proxy.health.track(url, pinned=True)
     global COMFYUI_URL
     COMFYUI_URL = url
     return jsonify({"code": 200, "msg": "updated", "data": {"comfyuiUrl": url}})
 
 
 
+# 按鉴权信息缓存成功的 checkOnline 结果，并发的相同请求只向云端发一次
+check_online_cache = TTLCache(ttl=proxy.config.get("check_online_cache_ttl", 30))
+# 缓存的是解压后的响应体，不透传 Accept-Encoding
+CHECK_ONLINE_SKIP_HEADERS = HOP_BY_HOP_HEADERS | {'accept-encoding'}
+
+# 插件未登录时会发送 "Bearer undefined" 之类的占位值，不算有效凭证
+PLACEHOLDER_CREDENTIALS = {"", "undefined", "null", "none"}
+
+
+def real_credential(value):
+    value = (value or "").strip()
+    if value.lower().startswith("bearer "):
+        value = value[7:].strip()
+    return value.lower() not in PLACEHOLDER_CREDENTIALS
+
+
+def check_online_cache_key():
+    """Cache key covering everything the cloud answer may depend on; None when no real credential is sent."""
+    authorization = request.headers.get('Authorization', '')
+    token = request.headers.get('token', '')
+    if not real_credential(authorization) and not real_credential(token):
+        return None
+    return (
+        authorization,
+        token,
+        request.headers.get('Clientid', ''),
+        request.headers.get('Tenantid', ''),
+        request.query_string.decode('utf-8', 'replace'),
+    )
+
+
 @app.route('/psPlus/workflow/checkOnline', methods=['GET'])
 def check_online():
-    headers = dict(request.headers)
-    try:
-        logger.info("🔍 [CheckOnline] 收到请求")
-        logger.debug("[CheckOnline] Headers: %s", headers)
-
-        response = requests.get(CLOUD_CHECK_URL, headers=headers)
+    headers = {
+        key: value for key, value in request.headers.items()
+        if key.lower() not in CHECK_ONLINE_SKIP_HEADERS
+    }
+    params = list(request.args.items(multi=True))
+    cache_key = check_online_cache_key()
+
+    def load():
+        timeout = (proxy.config.get("connect_timeout", 3), proxy.config.get("cloud_timeout", 10))
+        response = cloud_proxy.session.get(CLOUD_CHECK_URL, headers=headers, params=params, timeout=timeout)
         logger.debug("[CheckOnline] 云端响应状态码: %s", response.status_code)
-        logger.debug("[CheckOnline] 云端响应内容: %s", response.text)
+        return (
+            response.status_code,
+            response.content,
+            response.headers.get('Content-Type', 'application/json')
+        )
 
-        if response.status_code == 200:
-            logger.info("✅ 在线检查通过 - by cloud")
+    try:
+        if cache_key is None:
+            status_code, content, content_type = load()
         else:
-            logger.warning("❌ 在线检查失败 - by cloud")
+            status_code, content, content_type = check_online_cache.get_or_load(
+                cache_key, load, cacheable=lambda result: result[0] == 200
+            )
 
-        return Response(
-            response.content,
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type', 'application/json')
-        )
+        if status_code == 200:
+            logger.debug("✅ 在线检查通过 - by cloud")
+        else:
+            logger.warning("❌ 在线检查失败 - by cloud, 状态码: %s", status_code)
+
+        return Response(content, status=status_code, content_type=content_type)
 
     except Exception as e:
         logger.error("[CheckOnline] 请求云端失败: %s", str(e))
         return jsonify({"code": 500, "msg": "checkOnline failed"}), 500
 
 
+@app.route('/api/logs/search', methods=['GET'])
+def search_logs():
+    """Indexed log search for the control panel: q, level, client_id, prompt_id, since, until, limit."""
+    if log_index is None:
+        return jsonify({"code": 503, "msg": "日志索引未启用", "data": None}), 503
+    try:
+        limit = min(max(int(request.args.get("limit", 200)), 1), 1000)
+        items = log_index.search(
+            q=request.args.get("q"),
+            level=request.args.get("level"),
+            client_id=request.args.get("client_id"),
+            prompt_id=request.args.get("prompt_id"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": f"查询参数错误: {e}", "data": None}), 400
+    except Exception as e:
+        logger.error(f"❌ 日志检索失败: {e}")
+        return jsonify({"code": 500, "msg": f"日志检索失败: {e}", "data": None}), 500
+    return jsonify({"code": 0, "msg": "success", "data": {"items": items, "count": len(items)}})
+
+
+def collect_runtime_metrics():
+    """Gauges computed when a metrics snapshot is taken."""
+    queued, queue_bytes = state.queue_stats()
+    depths = state.backend_depths()
+    return {
+        "backend_queue_depth": depths,
+        "backend_queue_total": sum(depths.values()),
+        "active_clients": len(state.active_clients(300)),
+        "queued_messages": queued,
+        "message_queue_bytes": queue_bytes,
+        "tracked_tasks": state.task_count(),
+        "worker": worker_index,
+        **(coalescer.stats() if proxy.config.get("enable_batch_coalescing", False) else {}),
+    }
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({"code": 0, "msg": "success", "data": metrics.snapshot(collect_runtime_metrics)})
+
+
+@app.route('/api/metrics/stream', methods=['GET'])
+def stream_metrics():
+    """Server-Sent Events: one metrics snapshot per interval (seconds, default 1)."""
+    try:
+        interval = min(max(float(request.args.get("interval", 1)), 0.5), 60)
+    except ValueError:
+        interval = 1
+
+    def generate():
+        while True:
+            snapshot = metrics.snapshot(collect_runtime_metrics)
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            gevent.sleep(interval)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
 
@@ -1065,62 +1934,24 @@ def health_check():
         "service": "huiying-proxy-enhanced-fixed",
         "version": "2.5.0",
         "timestamp": datetime.now().isoformat(),
-        "features": ["http_polling", "task_status", "message_queue", "enhanced_progress", "upload_progress", "mask_support"]
+        "features": ["http_polling", "task_status", "message_queue", "enhanced_progress", "upload_progress", "mask_support"],
+        "backends": proxy.health.snapshot()
     })
 
 
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-
 
-@app.route('/auth/login', methods=['POST'])
-def login_compatible():
-    data = request.get_json()
-    try:
-        response = requests.post(CLOUD_AUTH_URL, json=data)
-        if response.status_code == 200:
-            result = response.json()
-            print("[Login] 登录成功 - by cloud")
-            print("[Login] 云端返回内容:")
-            print(json.dumps(result, indent=2, ensure_ascii=False))
-            return jsonify(result), 200
-        else:
-            print("[Login] 登录失败")
-            print(f"[Login] 状态码: {response.status_code}")
-            print(f"[Login] 云端返回原始内容: {response.text}")
-            return jsonify({"code": 1, "msg": "cloud authentication failed"}), 401
-    except requests.RequestException as e:
-        print("[Login] 登录失败")
-        return jsonify({"code": 1, "msg": "request to cloud failed"}), 500
 
-    
-@app.route('/auth/logout', methods=['POST'])
-def logout_proxy():
-    try:
-        payload = request.get_data()
-        headers = {
-            key: value for key, value in request.headers.items()
-            if key.lower() != 'host'
-        }
-        response = requests.post(CLOUD_LOGOUT_URL, headers=headers, data=payload)
-        try:
-            result = response.json()
-        except Exception:
-            result = {"code": 500, "msg": "云端响应格式错误", "raw": response.text}
-        if response.status_code == 200:
-            print("[Logout] 退出成功 - by cloud")
-            print("[Logout] 云端返回内容:")
-            print(json.dumps(result, indent=2, ensure_ascii=False))
-        else:
-            print("[Logout] 退出失败")
-            print(f"[Logout] 状态码: {response.status_code}")
-            print(f"[Logout] 云端返回原始内容: {response.text}")
-        return jsonify(result), response.status_code
-    except Exception as e:
-        print("[Logout] 退出失败")
-        return jsonify({"code": 500, "msg": "代理登出失败", "error": str(e)}), 500
+# /auth/*、/psPlus/* 等云端透传接口（本地实现的路由优先匹配）
+cloud_proxy = CloudProxy(
+    CLOUD_BASE_URL,
+    connect_timeout=proxy.config.get("connect_timeout", 3),
+    pool_size=proxy.config.get("cloud_pool_size", 20),
+)
+# 登录、登出后鉴权状态变化，缓存的 checkOnline 结果作废
+cloud_proxy.on_forward("/auth/login", check_online_cache.clear)
+cloud_proxy.on_forward("/auth/logout", check_online_cache.clear)
+cloud_proxy.register(app)
 
 
 if __name__ == '__main__':
@@ -1136,23 +1967,56 @@ if __name__ == '__main__':
 
     import logging
     
-
-    logger.info("🔧 启动 ComfyUI WebSocket 监听线程...")
-    logger.info("🔄 已使用增强HTTP轮询模式，兼容本地化部署进程")
-    comfy_ws_listener()
-
-    logger.info("🔧 启动清理任务线程服务")
-    Thread(target=cleanup_task, daemon=True).start()
+    port = proxy.config.get('proxy_port', 8080)
+    # 先 fork 再启动后台任务，线程与连接不会跨进程共享
+    worker_index, listener = fork_workers('0.0.0.0', port, WORKERS)
+
+    # ComfyUI 监听、清理与更新检查只在 worker 0 运行一份
+    if worker_index == 0:
+        logger.info("🔧 启动 ComfyUI WebSocket 监听线程...")
+        logger.info("🔄 已使用增强HTTP轮询模式，兼容本地化部署进程")
+        comfy_ws_listener()
+
+        logger.info("🔧 启动清理任务线程服务")
+        Thread(target=cleanup_task, daemon=True).start()
+
+        if proxy.config.get("enable_task_recovery", True):
+            # 仍在运行的任务重新挂上进度轮询
+            def resume_tracking(prompt_id, data):
+                if data.get("batch_id"):
+                    # 合并批次的进度来自 WebSocket 消息拆分，没有自己的 history
+                    return
+                start_progress_tracker_by_mapping(prompt_id, data.get("workflow_id"), data.get("client_id"), data["backend"])
+
+            Thread(target=reconcile_tasks, args=(state, add_message_to_queue, resume_tracking), daemon=True).start()
+
+    logger.info("🩺 启动后端健康探测")
+    proxy.health.start()
+
+    # 后台预取 object_info，供提交前参数校验使用
+    proxy.object_info_cache.get(COMFYUI_URL)
+
+    if fair_scheduler_enabled():
+        logger.info("🚦 启动公平调度")
+        scheduler.start()
+
+    if proxy.config.get("enable_hot_reload", True):
+        logger.info("👀 启动工作流与映射文件监视")
+        proxy.watcher.start()
+
+    if worker_index == 0:
+        from update import start_background_update_check
+        logger.info("🔧 启动后台更新检查")
+        start_background_update_check(on_update=proxy.reload_payload)
     
 
     server = WSGIServer(("0.0.0.0", 8080), app, handler_class=WebSocketHandler)
     logger.info("✅ HTTP & WebSocket 服务启动成功：http://0.0.0.0:8080")
 
-    port = proxy.config.get('proxy_port', 8080)
-    logger.info(f"🟢 代理服务启动，监听端口: {port}")
+    logger.info(f"🟢 代理服务启动，监听端口: {port}（worker {worker_index}/{WORKERS}）")
     logger.info(f"✅ 配置加载完成，映射数量: {len(proxy.mappings.get('workflow_mappings', {}))}")
     print("============== 欢迎使用绘影 AICG 代理终端服务 v2.5  ==============")
 
-    server = WSGIServer(('0.0.0.0', port), app, log=None)
+    server = WSGIServer(listener or ('0.0.0.0', port), app, log=None)
     server.serve_forever()
 
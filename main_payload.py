@@ -1,63 +1,21 @@
 # main_payload.py
-import os, base64, zipfile, io, shutil, atexit
-from Crypto.Cipher import AES
-
-LOCAL_PAYLOAD_PATH = "payload.b64"
-KEY = b"1234567890abcdef"
-
-from update import auto_update_if_needed, download_payload, fetch_remote_version
-
-def decrypt(data: bytes, key: bytes) -> bytes:
-    nonce, tag, ciphertext = data[:16], data[16:32], data[32:]
-    cipher = AES.new(key, AES.MODE_EAX, nonce)
-    return cipher.decrypt_and_verify(ciphertext, tag)
-
-def extract_payload(temp_dir):
-    with open(LOCAL_PAYLOAD_PATH, "rb") as f:
-        decrypted = decrypt(base64.b64decode(f.read()), KEY)
-        with zipfile.ZipFile(io.BytesIO(decrypted)) as zf:
-            # print("📦 解压内容如下：", zf.namelist())
-            tmp_extract_dir = os.path.join(temp_dir, ".payload_tmp")
-            if os.path.exists(tmp_extract_dir):
-                shutil.rmtree(tmp_extract_dir, ignore_errors=True)
-            os.makedirs(tmp_extract_dir, exist_ok=True)
-            zf.extractall(tmp_extract_dir)
-
-            # ✅ 自动判断 payload 根目录（新版逻辑）
-            possible_items = os.listdir(tmp_extract_dir)
-            if "payload" in possible_items:
-                payload_root = os.path.join(tmp_extract_dir, "payload")
-            else:
-                payload_root = tmp_extract_dir
-                            # 最终强校验：必须包含 workflows 或 workflow_mappings.json，否则报错
-            if not any(name in possible_items for name in ["workflows", "workflow_mappings.json"]):
-                raise RuntimeError("❌ 无法识别有效 payload 内容：缺少 workflows 或 workflow_mappings.json")
-            # ✅ 将 payload 内容复制到 temp_dir
-
-            for item in os.listdir(payload_root):
-                s = os.path.join(payload_root, item)
-                d = os.path.join(temp_dir, item)
-                if os.path.isdir(s):
-                    shutil.copytree(s, d, dirs_exist_ok=True)
-                else:
-                    shutil.copy2(s, d)
-
-            print(f"✅ 授权码比对完成")
-            atexit.register(lambda: shutil.rmtree(tmp_extract_dir, ignore_errors=True))
+import os
 
+from update import PAYLOAD_FILE, CONTAINER_FILE, download_payload, fetch_remote_version
+from payload_container import ensure_container
 
+# 随程序分发的 payload，只读；运行时使用由它转换出的 CONTAINER_FILE
+LOCAL_PAYLOAD_PATH = PAYLOAD_FILE
+KEY = b"1234567890abcdef"
 
 
 def init_payload():
-    auto_update_if_needed()
-    temp_dir = os.path.join(os.path.expanduser("~"), "AppData", "Local", "Temp", "HueyingAI_temp_root")
-    if not os.path.exists(temp_dir) or not os.listdir(temp_dir):
-        # print("📦 当前为首次加载，开始检查本地 payload 文件...")
-        if os.path.exists(LOCAL_PAYLOAD_PATH):
-            # print("✅ 本地 payload.b64 已存在，准备解压...")
-            extract_payload(temp_dir)
-        else:
-            print("📡 未检测到mp/wf，尝试从服务器下载...")
-            if not download_payload(fetch_remote_version()):
-                raise RuntimeError("❌ 无法下载热更新文件")
-            extract_payload(temp_dir)
+    """Make sure a payload file exists; workflows are served from memory (workflow_store)."""
+    # 版本检查已移到后台（update.start_background_update_check），启动时不再阻塞联网
+    if not os.path.exists(LOCAL_PAYLOAD_PATH) and not os.path.exists(CONTAINER_FILE):
+        print("📡 未检测到mp/wf，尝试从服务器下载...")
+        if not download_payload(fetch_remote_version()):
+            raise RuntimeError("❌ 无法下载热更新文件")
+    # 分发的 payload 转换为单独的索引容器文件，原文件保持不变
+    elif ensure_container(LOCAL_PAYLOAD_PATH, CONTAINER_FILE, KEY):
+        print("📦 payload 已转换为索引容器格式")
@@ -0,0 +1,141 @@
+# mapping_index.py
+"""
+参数映射编译索引：把每个工作流的 param_mappings 编译成已校验的赋值计划
+（节点、输入键、期望类型）并缓存，错误路径只报告一次，之后的提交只需按计划直接赋值。
+启动和热更新时在后台编译全部映射，集中报告错误路径；后台编译完成前被提交的工作流
+在第一次使用时编译。
+"""
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SetterPlan:
+    __slots__ = ("param_key", "node_id", "keys", "expected_type")
+
+    def __init__(self, param_key, node_id, keys, expected_type=None):
+        self.param_key = param_key
+        self.node_id = node_id
+        # 节点内部的路径，通常为 ("inputs", "<输入名>")
+        self.keys = keys
+        self.expected_type = expected_type
+
+    def coerce(self, value):
+        """Convert string values the plugin sends to the template's scalar type where it is lossless."""
+        expected = self.expected_type
+        if expected is None or isinstance(value, expected):
+            return value
+        try:
+            if expected is bool and isinstance(value, str) and value.lower() in ("true", "false"):
+                return value.lower() == "true"
+            if expected is int and not isinstance(value, bool):
+                as_float = float(value)
+                if as_float.is_integer():
+                    return int(as_float)
+            if expected is float and not isinstance(value, bool):
+                return float(value)
+        except (TypeError, ValueError):
+            pass
+        return value
+
+    def assign(self, merged, value):
+        target = merged[self.node_id]
+        for key in self.keys[:-1]:
+            target = target[key]
+        target[self.keys[-1]] = value
+
+
+def _check_structure(path):
+    if not isinstance(path, (list, tuple)) or len(path) < 2:
+        return "路径至少需要包含节点和键"
+    if not isinstance(path[0], (str, int)):
+        return "节点 ID 必须是字符串或数字"
+    return None
+
+
+def compile_plans(workflow_id, template, param_mappings):
+    """Resolve every mapping path against the workflow template.
+
+    Returns (plans, errors); a path whose node does not exist is rejected,
+    a missing final key is kept (ComfyUI accepts optional inputs the
+    template omits) but reported."""
+    plans = {}
+    errors = []
+    for param_key, path in param_mappings.items():
+        problem = _check_structure(path)
+        if problem:
+            errors.append(f"{param_key}: {problem} {path}")
+            continue
+
+        node_id = str(path[0])
+        node = template.get(node_id)
+        if not isinstance(node, dict) or "class_type" not in node:
+            errors.append(f"{param_key}: 节点不存在 {path}")
+            continue
+
+        keys = tuple(path[1:])
+        container = node
+        try:
+            for key in keys[:-1]:
+                container = container[key]
+        except (KeyError, IndexError, TypeError):
+            errors.append(f"{param_key}: 路径无法解析 {path}")
+            continue
+
+        expected_type = None
+        if isinstance(container, dict) and keys[-1] in container:
+            current = container[keys[-1]]
+            # 模板中为连线 [node, index] 时不做类型约束
+            if isinstance(current, (bool, int, float, str)):
+                expected_type = type(current)
+        elif isinstance(container, dict):
+            logger.warning(f"⚠️ [{workflow_id}] 模板中不存在输入 {param_key} -> {path}，将直接新增")
+        else:
+            errors.append(f"{param_key}: 路径无法解析 {path}")
+            continue
+
+        plans[param_key] = SetterPlan(param_key, node_id, keys, expected_type)
+    return plans, errors
+
+
+class MappingIndex:
+    def __init__(self, workflow_mappings):
+        self.workflow_mappings = workflow_mappings or {}
+        self.plans = {}
+
+    def plans_for(self, workflow_id, template):
+        """Compiled plans for a workflow; compiled and validated once, then cached."""
+        plans = self.plans.get(workflow_id)
+        if plans is None:
+            param_mappings = self.workflow_mappings.get(workflow_id, {}).get("param_mappings", {})
+            plans, errors = compile_plans(workflow_id, template, param_mappings)
+            for error in errors:
+                logger.error(f"❌ [{workflow_id}] 映射路径无效，已忽略: {error}")
+            self.plans[workflow_id] = plans
+        return plans
+
+    def compile_all(self, store):
+        """Compile every mapped workflow up front so bad paths surface at load time."""
+        for workflow_id in self.workflow_mappings:
+            template = store.get_workflow(workflow_id)
+            if template is None:
+                logger.warning(f"⚠️ 映射中的工作流不存在: {workflow_id}")
+                continue
+            self.plans_for(workflow_id, template)
+        logger.info(f"✅ 参数映射编译完成，工作流数量: {len(self.plans)}")
+
+    def merge(self, workflow_id, template, param_dict):
+        """Apply param_dict to a deep copy of template; the cached template is never modified."""
+        plans = self.plans_for(workflow_id, template)
+        # 合并结果之后还会被改写（路径适配、批次合并等），不能与缓存的模板共享节点
+        merged = copy.deepcopy(template)
+        for param_key, param_value in param_dict.items():
+            if isinstance(param_value, str) and param_value.startswith("默认"):
+                continue
+            plan = plans.get(param_key)
+            if plan is None:
+                logger.debug("⏭️ 未映射参数: %s", param_key)
+                continue
+            plan.assign(merged, plan.coerce(param_value))
+        return merged
@@ -0,0 +1,74 @@
+# metrics.py
+"""
+运行指标：提交速率、提交延迟 p95、后端队列深度、活跃客户端与消息队列占用。
+提交只记录时间戳和耗时，统计在读取快照时按滑动窗口计算；
+快照缓存一小段时间，多个仪表盘同时订阅也只计算一次。
+"""
+import math
+import time
+from collections import deque
+from threading import Lock
+
+# 速率窗口与延迟窗口（秒）
+RATE_WINDOW = 10
+LATENCY_WINDOW = 60
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Metrics:
+    def __init__(self, snapshot_ttl=1.0, max_samples=10000):
+        self.started_at = time.time()
+        self.snapshot_ttl = snapshot_ttl
+        # (时间戳, 耗时毫秒, 是否成功)
+        self.commits = deque(maxlen=max_samples)
+        self.total_commits = 0
+        self.total_errors = 0
+        self.gauges = {}
+        self.lock = Lock()
+        self._cached = None
+        self._cached_at = 0.0
+
+    def record_commit(self, duration_ms, ok=True):
+        self.commits.append((time.time(), duration_ms, ok))
+        self.total_commits += 1
+        if not ok:
+            self.total_errors += 1
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self, collect=None):
+        """Return the current metrics; collect() may return extra gauges computed on demand."""
+        now = time.time()
+        if self._cached is not None and now - self._cached_at < self.snapshot_ttl:
+            return self._cached
+        with self.lock:
+            if self._cached is not None and time.time() - self._cached_at < self.snapshot_ttl:
+                return self._cached
+            recent = [c for c in list(self.commits) if now - c[0] <= LATENCY_WINDOW]
+            in_rate_window = [c for c in recent if now - c[0] <= RATE_WINDOW]
+            latencies = [c[1] for c in recent if c[2]]
+            p95 = percentile(latencies, 95)
+            data = {
+                "timestamp": now,
+                "uptime": round(now - self.started_at, 1),
+                "commits_per_sec": round(len(in_rate_window) / RATE_WINDOW, 2),
+                "commit_errors_per_sec": round(sum(1 for c in in_rate_window if not c[2]) / RATE_WINDOW, 2),
+                "p95_latency_ms": round(p95, 1) if p95 is not None else None,
+                "total_commits": self.total_commits,
+                "total_errors": self.total_errors,
+                **self.gauges,
+            }
+            if collect is not None:
+                data.update(collect())
+            self._cached = data
+            self._cached_at = now
+            return data
@@ -0,0 +1,101 @@
+# object_info_cache.py
+"""
+ComfyUI /object_info 按后端缓存。
+
+/object_info 有数 MB，ComfyUI 重启前基本不变，这里缓存解析后的节点定义
+以及原始响应体（附 ETag 和预压缩的 gzip），过期后在后台刷新，调用方不会因下载而阻塞。
+ComfyUI 重启后由调用方 invalidate() 使缓存失效。
+"""
+import time
+import gzip
+import hashlib
+import json
+import logging
+import requests
+from threading import Thread, Lock, Event
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectInfoEntry:
+    __slots__ = ("schema", "body", "gzip_body", "etag", "gzip_etag", "content_type", "fetched_at")
+
+    def __init__(self, body, content_type, fetched_at):
+        self.body = body
+        self.schema = json.loads(body)
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        digest = hashlib.sha1(body).hexdigest()
+        self.etag = f'"{digest}"'
+        # 压缩后的表示是不同的字节序列，强 ETag 不能与原文相同
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.content_type = content_type
+        self.fetched_at = fetched_at
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class ObjectInfoCache:
+    def __init__(self, ttl=600, timeout=10):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.entries = {}
+        # 正在进行的下载：同一后端同时只发一个请求，其余调用等待结果
+        self.inflight = {}
+        self.lock = Lock()
+
+    def _download(self, comfyui_url):
+        try:
+            res = requests.get(f"{comfyui_url}/object_info", timeout=self.timeout)
+            if res.status_code != 200:
+                logger.warning(f"⚠️ object_info 获取失败，状态码: {res.status_code}")
+                return None
+            entry = ObjectInfoEntry(
+                res.content,
+                res.headers.get("Content-Type", "application/json"),
+                time.time(),
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ object_info 获取失败: {e}")
+            return None
+        with self.lock:
+            self.entries[comfyui_url] = entry
+        logger.info(f"✅ object_info 已缓存: {comfyui_url}，节点类型 {len(entry.schema)} 个")
+        return entry
+
+    def fetch(self, comfyui_url):
+        """Download /object_info now (joining an in-flight download if any); returns the entry or None."""
+        with self.lock:
+            done = self.inflight.get(comfyui_url)
+            owner = done is None
+            if owner:
+                done = self.inflight[comfyui_url] = Event()
+        if not owner:
+            done.wait(self.timeout + 1)
+            return self.entries.get(comfyui_url)
+        try:
+            return self._download(comfyui_url)
+        finally:
+            with self.lock:
+                self.inflight.pop(comfyui_url, None)
+            done.set()
+
+    def refresh_async(self, comfyui_url):
+        if comfyui_url in self.inflight:
+            return
+        Thread(target=self.fetch, args=(comfyui_url,), daemon=True).start()
+
+    def get(self, comfyui_url):
+        """Never blocks: returns the cached entry (possibly stale) and schedules a refresh when needed."""
+        entry = self.entries.get(comfyui_url)
+        if entry is None or entry.age > self.ttl:
+            self.refresh_async(comfyui_url)
+        return entry
+
+    def invalidate(self, comfyui_url, refresh=True):
+        with self.lock:
+            self.entries.pop(comfyui_url, None)
+        logger.info(f"♻️ object_info 缓存已失效: {comfyui_url}")
+        if refresh:
+            self.refresh_async(comfyui_url)
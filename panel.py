@@ -7,7 +7,7 @@
 
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-from tkinter import messagebox, Menu, filedialog
+from tkinter import messagebox, Menu, filedialog, Canvas
 import subprocess
 import threading
 import os
@@ -15,7 +15,9 @@ import time
 import webbrowser
 import sys
 from datetime import datetime
+from collections import deque
 import json
+import requests
 from pathlib import Path
 
 # 导入增强版日志终端
@@ -32,9 +34,15 @@ class FinalControlPanel:
         # 已取消外部文件执行，直接集成 main.py 内部逻辑
         self.config_file = "panel_config.json"
         self.log_file = "panel_logs.txt"
+        self.search_job = None
+        self.search_window = None
         
         # 加载配置
         self.load_config()
+
+        # 日志先进入待显示队列，由定时器批量刷新到界面；队列有上限，突发时只保留最新的行
+        self.pending_logs = deque(maxlen=self.config.get("max_log_lines", 5000))
+        self.log_handle = None
         
         # 创建主窗口
         self.setup_main_window()
@@ -51,6 +59,9 @@ class FinalControlPanel:
         # 添加欢迎消息
         self.add_welcome_message()
 
+        # 启动日志批量刷新
+        self.flush_logs()
+
     def load_config(self):
         """加载配置文件"""
         default_config = {
@@ -59,6 +70,8 @@ class FinalControlPanel:
             "font_size": 11,
             "auto_save_logs": True,
             "log_level": "all",
+            "max_log_lines": 5000,
+            "log_flush_ms": 100,
             "paned_position": 300
         }
         
@@ -285,6 +298,9 @@ class FinalControlPanel:
         
         # 右侧日志区域
         self.create_log_panel()
+
+        # 右侧仪表盘标签页
+        self.create_dashboard_panel()
         
         # 设置初始分割位置
         self.app.after(100, lambda: self.paned_window.sashpos(0, self.config.get("paned_position", 300)))
@@ -422,9 +438,13 @@ class FinalControlPanel:
 
     def create_log_panel(self):
         """创建右侧日志面板"""
+        # 右侧分为日志与仪表盘两个标签页
+        self.right_notebook = ttk.Notebook(self.paned_window)
+        self.paned_window.add(self.right_notebook, weight=3)
+
         # 日志面板容器
-        log_container = ttk.Frame(self.paned_window, style="Card.TFrame", padding=10)
-        self.paned_window.add(log_container, weight=3)
+        log_container = ttk.Frame(self.right_notebook, style="Card.TFrame", padding=10)
+        self.right_notebook.add(log_container, text="💻 日志")
         
         # 日志面板标题
         log_header = ttk.Frame(log_container)
@@ -509,6 +529,118 @@ class FinalControlPanel:
             # 降级到基本版本
             self.create_basic_log_terminal(log_container)
 
+    def create_dashboard_panel(self):
+        """创建性能仪表盘标签页，订阅代理的 /api/metrics/stream"""
+        dashboard = ttk.Frame(self.right_notebook, style="Card.TFrame", padding=15)
+        self.right_notebook.add(dashboard, text="📊 仪表盘")
+
+        self.metric_labels = {}
+        self.metric_values = {}
+        cards = [
+            ("commits_per_sec", "提交速率 (次/秒)"),
+            ("p95_latency_ms", "提交延迟 p95 (ms)"),
+            ("backend_queue_total", "后端队列深度"),
+            ("active_clients", "活跃客户端"),
+            ("queued_messages", "待投递消息"),
+            ("message_queue_bytes", "消息队列占用"),
+            ("total_commits", "累计提交"),
+            ("total_errors", "累计失败"),
+        ]
+        for index, (key, title) in enumerate(cards):
+            card = ttk.LabelFrame(dashboard, text=title, padding=10, bootstyle="secondary")
+            card.grid(row=index // 4, column=index % 4, sticky="nsew", padx=5, pady=5)
+            label = ttk.Label(card, text="--", font=("微软雅黑", 20, "bold"), bootstyle="info")
+            label.pack()
+            self.metric_labels[key] = label
+        for column in range(4):
+            dashboard.columnconfigure(column, weight=1)
+
+        # 提交速率与 p95 走势，每次只移动折线坐标，不重绘画布
+        self.metric_history = {
+            "commits_per_sec": deque([0.0] * 120, maxlen=120),
+            "p95_latency_ms": deque([0.0] * 120, maxlen=120),
+        }
+        self.trend_canvas = Canvas(dashboard, height=180, background="#0c1021", highlightthickness=0)
+        self.trend_canvas.grid(row=2, column=0, columnspan=4, sticky="nsew", padx=5, pady=(10, 5))
+        dashboard.rowconfigure(2, weight=1)
+        self.trend_lines = {
+            "commits_per_sec": self.trend_canvas.create_line(0, 0, 0, 0, fill="#22c55e", width=2),
+            "p95_latency_ms": self.trend_canvas.create_line(0, 0, 0, 0, fill="#f59e0b", width=2),
+        }
+        self.dashboard_status = ttk.Label(
+            dashboard,
+            text="● 等待代理服务…  绿色: 提交速率  橙色: p95 延迟",
+            font=("微软雅黑", 9),
+            bootstyle="secondary"
+        )
+        self.dashboard_status.grid(row=3, column=0, columnspan=4, sticky="w", padx=5)
+
+        self.latest_metrics = None
+        self.metrics_connected = False
+        threading.Thread(target=self.subscribe_metrics, daemon=True).start()
+        self.apply_metrics()
+
+    def subscribe_metrics(self):
+        """后台线程读取 SSE 流，断线后自动重连；只保存最新快照，由界面定时器取用"""
+        while True:
+            try:
+                with requests.get(f"{self.proxy_base_url()}/api/metrics/stream", stream=True, timeout=(3, 30)) as res:
+                    self.metrics_connected = True
+                    for line in res.iter_lines(decode_unicode=True):
+                        if line and line.startswith("data: "):
+                            self.latest_metrics = json.loads(line[6:])
+            except Exception:
+                pass
+            self.metrics_connected = False
+            time.sleep(3)
+
+    def apply_metrics(self):
+        """只更新发生变化的数值"""
+        try:
+            snapshot, self.latest_metrics = self.latest_metrics, None
+            if snapshot:
+                for key, label in self.metric_labels.items():
+                    value = self.format_metric(key, snapshot.get(key))
+                    if self.metric_values.get(key) != value:
+                        self.metric_values[key] = value
+                        label.configure(text=value)
+                for key, history in self.metric_history.items():
+                    history.append(float(snapshot.get(key) or 0))
+                self.update_trend()
+            status = "● 已连接" if self.metrics_connected else "● 未连接，正在重试…"
+            if self.metric_values.get("_status") != status:
+                self.metric_values["_status"] = status
+                self.dashboard_status.configure(
+                    text=f"{status}  绿色: 提交速率  橙色: p95 延迟",
+                    bootstyle="success" if self.metrics_connected else "secondary"
+                )
+        finally:
+            self.app.after(500, self.apply_metrics)
+
+    def update_trend(self):
+        width = max(self.trend_canvas.winfo_width(), 2)
+        height = max(self.trend_canvas.winfo_height(), 2)
+        for key, history in self.metric_history.items():
+            peak = max(max(history), 1e-6)
+            step = width / (len(history) - 1)
+            coords = []
+            for i, value in enumerate(history):
+                coords.extend((i * step, height - 5 - (value / peak) * (height - 10)))
+            self.trend_canvas.coords(self.trend_lines[key], *coords)
+
+    def format_metric(self, key, value):
+        if value is None:
+            return "--"
+        if key == "message_queue_bytes":
+            for unit in ("B", "KB", "MB"):
+                if value < 1024:
+                    return f"{value:.0f} {unit}"
+                value /= 1024
+            return f"{value:.1f} GB"
+        if isinstance(value, float):
+            return f"{value:.2f}" if key == "commits_per_sec" else f"{value:.0f}"
+        return str(value)
+
     def create_basic_log_terminal(self, parent):
         """创建基本版日志终端（降级方案）"""
         from tkinter import scrolledtext
@@ -593,30 +725,50 @@ class FinalControlPanel:
         self.log_message("💡 提示: 使用 F1 启动服务，F2 停止服务，F5 重启服务")
 
     def log_message(self, message, level="info"):
-        """添加日志消息"""
-        if hasattr(self, 'log_terminal') and self.log_terminal:
-            # 使用增强版终端
-            self.log_terminal.add_log(message, level)
-        else:
-            # 使用基本版终端
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            formatted_message = f"[{timestamp}] {message}\n"
-            
-            if hasattr(self, 'log_text'):
-                self.log_text.configure(state='normal')
-                self.log_text.insert('end', formatted_message)
-                self.log_text.see('end')
-                self.log_text.configure(state='disabled')
-        
-        # 保存到文件
+        """添加日志消息（可在任意线程调用，界面由 flush_logs 批量刷新）"""
+        now = datetime.now()
+        self.pending_logs.append((now, message, level))
+
+        # 保存到文件，文件句柄常驻，刷盘随界面刷新一起做
         if self.config.get("auto_save_logs", True):
             try:
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                with open(self.log_file, 'a', encoding='utf-8') as f:
-                    f.write(f"[{timestamp}] {message}\n")
+                if self.log_handle is None:
+                    self.log_handle = open(self.log_file, 'a', encoding='utf-8')
+                self.log_handle.write(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
             except:
                 pass
 
+    def flush_logs(self):
+        """把待显示的日志一次性写入界面，并裁剪到 max_log_lines 行"""
+        try:
+            batch = []
+            while self.pending_logs:
+                batch.append(self.pending_logs.popleft())
+
+            if batch:
+                if hasattr(self, 'log_terminal') and self.log_terminal:
+                    # 使用增强版终端
+                    for _, message, level in batch:
+                        self.log_terminal.add_log(message, level)
+                elif hasattr(self, 'log_text'):
+                    # 使用基本版终端
+                    text = "".join(f"[{ts.strftime('%H:%M:%S')}] {message}\n" for ts, message, _ in batch)
+                    self.log_text.configure(state='normal')
+                    self.log_text.insert('end', text)
+                    excess = int(self.log_text.index('end-1c').split('.')[0]) - self.config.get("max_log_lines", 5000)
+                    if excess > 0:
+                        self.log_text.delete('1.0', f'{excess + 1}.0')
+                    self.log_text.see('end')
+                    self.log_text.configure(state='disabled')
+
+                if self.log_handle:
+                    try:
+                        self.log_handle.flush()
+                    except:
+                        pass
+        finally:
+            self.app.after(self.config.get("log_flush_ms", 100), self.flush_logs)
+
     # 核心功能方法（与之前相同，这里省略重复代码）
     def start_service(self):
         """启动服务
@@ -791,6 +943,7 @@ class FinalControlPanel:
     def clear_logs(self):
         """清除日志"""
         if messagebox.askyesno("确认", "确定要清除所有日志吗？"):
+            self.pending_logs.clear()
             if hasattr(self, 'log_terminal') and self.log_terminal:
                 self.log_terminal.clear_terminal()
             elif hasattr(self, 'log_text'):
@@ -854,14 +1007,87 @@ class FinalControlPanel:
             count = self.log_terminal.search_text(search_term)
             if count > 0:
                 self.log_message(f"🔍 找到 {count} 个匹配项")
-        else:
-            # 基本搜索功能
-            pass
+        # 同时查询服务端日志索引（输入停顿后再发请求）
+        self.schedule_index_search()
 
     def filter_logs(self, event=None):
         """过滤日志级别"""
         level = self.log_level_var.get()
         self.log_message(f"🔍 已切换到 {level} 级别过滤")
+        self.schedule_index_search()
+
+    def schedule_index_search(self, delay=300):
+        """合并连续输入，只在停顿 delay 毫秒后查询一次"""
+        if self.search_job:
+            self.app.after_cancel(self.search_job)
+        self.search_job = self.app.after(delay, self.run_index_search)
+
+    def proxy_base_url(self):
+        """代理服务地址，端口取自服务端 config.json"""
+        port = 8080
+        try:
+            with open("config.json", 'r', encoding='utf-8') as f:
+                port = json.load(f).get("proxy_port", 8080)
+        except Exception:
+            pass
+        return f"http://127.0.0.1:{port}"
+
+    def run_index_search(self):
+        """在后台线程查询 /api/logs/search，结果回到界面线程显示"""
+        self.search_job = None
+        term = self.search_var.get().strip()
+        level = self.log_level_var.get()
+        if not term and level == "全部":
+            return
+        levels = {"信息": "INFO", "成功": "INFO", "警告": "WARNING", "错误": "ERROR,CRITICAL"}
+        if level == "成功":
+            term = f"{term} ✅".strip()
+        params = {"q": term, "level": levels.get(level, ""), "limit": 500}
+        threading.Thread(target=self.query_log_index, args=(params,), daemon=True).start()
+
+    def query_log_index(self, params):
+        try:
+            res = requests.get(f"{self.proxy_base_url()}/api/logs/search", params=params, timeout=5)
+            body = res.json()
+            if body.get("code") != 0:
+                raise RuntimeError(body.get("msg"))
+            items, error = body["data"]["items"], None
+        except Exception as e:
+            items, error = [], str(e)
+        self.app.after(0, self.show_search_results, params, items, error)
+
+    def show_search_results(self, params, items, error):
+        """在独立窗口显示检索结果，窗口复用"""
+        if error:
+            self.log_message(f"⚠️ 日志检索失败（服务未启动？）: {error}", "warning")
+            return
+
+        if not self.search_window or not self.search_window.winfo_exists():
+            from tkinter import scrolledtext
+            self.search_window = ttk.Toplevel(self.app)
+            self.search_window.geometry("900x500")
+            self.search_results = scrolledtext.ScrolledText(
+                self.search_window,
+                wrap="word",
+                font=("JetBrains Mono", self.config.get("font_size", 11)),
+                bg="#0c1021",
+                fg="#e5e7eb",
+                relief="flat"
+            )
+            self.search_results.pack(fill=BOTH, expand=YES)
+
+        query = params.get("q") or "*"
+        self.search_window.title(f"日志检索: {query} [{params.get('level') or '全部'}] - {len(items)} 条")
+        lines = [
+            f"[{datetime.fromtimestamp(item['ts']).strftime('%m-%d %H:%M:%S')}] {item['level']:<7} {item['message']}"
+            for item in reversed(items)
+        ]
+        self.search_results.configure(state='normal')
+        self.search_results.delete(1.0, 'end')
+        self.search_results.insert('end', "\n".join(lines) if lines else "没有匹配的日志")
+        self.search_results.see('end')
+        self.search_results.configure(state='disabled')
+        self.search_window.lift()
 
     def show_settings(self):
         """显示设置对话框"""
@@ -927,6 +1153,12 @@ PowerShell 风格日志终端
         self.app.quit()
         self.app.destroy()
 
+        if self.log_handle:
+            try:
+                self.log_handle.close()
+            except:
+                pass
+
     def run(self):
         """运行应用"""
         self.app.mainloop()
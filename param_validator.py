@@ -0,0 +1,101 @@
+# param_validator.py
+"""
+提交前参数校验：用缓存的 ComfyUI /object_info 检查合并后的工作流，
+无效的采样器、缺失的模型文件、越界数值在本地直接拒绝，不再绕 ComfyUI 一圈。
+"""
+
+
+def _is_link(value):
+    # API 格式中的连线: ["节点ID", 输出序号]
+    return (
+        isinstance(value, list) and len(value) == 2
+        and isinstance(value[0], str) and isinstance(value[1], int)
+    )
+
+
+def _spec_parts(spec):
+    if not isinstance(spec, (list, tuple)) or not spec:
+        return None, {}
+    options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+    return spec[0], options
+
+
+def _choices(kind, options):
+    if isinstance(kind, list):
+        return kind
+    # 新版 ComfyUI: ["COMBO", {"options": [...]}]
+    if kind == "COMBO" and isinstance(options.get("options"), list):
+        return options["options"]
+    return None
+
+
+def _accepts_upload(options):
+    # LoadImage 等节点的可选项是上传目录快照，新上传的文件不会出现在缓存里
+    return any(key.endswith("upload") and options[key] for key in options)
+
+
+# 与 ComfyUI validate_inputs 相同的类型转换：能转换的值（如 "20"）会被 ComfyUI 接受，不应在本地拒绝
+COERCE = {"INT": int, "FLOAT": float, "STRING": str, "BOOLEAN": bool}
+TYPE_NAMES = {"INT": "整数", "FLOAT": "数值", "STRING": "字符串", "BOOLEAN": "布尔值"}
+
+
+def coerce(kind, value):
+    """Convert value the way ComfyUI does before its range checks; raises if it cannot be converted."""
+    if isinstance(value, (list, dict)) or value is None:
+        raise TypeError(kind)
+    return COERCE[kind](value)
+
+
+def check_input(node_id, class_type, name, value, spec):
+    kind, options = _spec_parts(spec)
+    if kind is None or _is_link(value):
+        return None
+    where = f"节点 {node_id} ({class_type}) 的 {name}"
+
+    choices = _choices(kind, options)
+    if choices is not None:
+        if not _accepts_upload(options) and value not in choices:
+            return f"{where} 取值无效: {value!r}"
+        return None
+
+    if kind not in COERCE:
+        return None
+    try:
+        value = coerce(kind, value)
+    except (TypeError, ValueError, OverflowError):
+        return f"{where} 需要{TYPE_NAMES[kind]}，实际为 {value!r}"
+
+    if "min" in options and value < options["min"]:
+        return f"{where} 小于最小值 {options['min']}: {value}"
+    if "max" in options and value > options["max"]:
+        return f"{where} 大于最大值 {options['max']}: {value}"
+    return None
+
+
+def validate_workflow(workflow, object_info):
+    """Return a list of human-readable errors; an empty list means the workflow looks valid."""
+    errors = []
+    for node_id, node in workflow.items():
+        class_type = node.get("class_type")
+        node_info = object_info.get(class_type)
+        if node_info is None:
+            errors.append(f"节点 {node_id} 类型不存在: {class_type}")
+            continue
+
+        inputs = node.get("inputs", {})
+        declared = node_info.get("input", {})
+        required = declared.get("required", {})
+        optional = declared.get("optional", {})
+
+        for name in required:
+            if name not in inputs:
+                errors.append(f"节点 {node_id} ({class_type}) 缺少必填输入: {name}")
+
+        for name, value in inputs.items():
+            spec = required.get(name) or optional.get(name)
+            if spec is None:
+                continue
+            error = check_input(node_id, class_type, name, value, spec)
+            if error:
+                errors.append(error)
+    return errors
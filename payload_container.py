@@ -0,0 +1,259 @@
+# payload_container.py
+"""
+带索引的 payload 容器格式，可按条目随机读取。
+
+文件仍是纯文本（运行时保存为 payload.hypk，分发的 payload.b64 保持原样），按行组织：
+
+    HYPK1
+    <base64(nonce | tag | 加密后的索引 JSON)>
+    <base64(nonce | tag | 条目 1 密文)>
+    <base64(nonce | tag | 条目 2 密文)>
+    ...
+
+索引记录每个条目在数据区内的 offset / length 以及明文 sha256，
+并记录容器由哪个分发 payload 转换而来（source_sha256），据此判断是否需要重新转换。
+每个条目单独 AES-EAX 认证，并以条目名作为附加认证数据，防止条目被互换。
+打开容器时只读取并解密索引，与数据区大小无关；读取某个工作流时按 offset 读取并解密对应的条目。
+容器存活期间文件句柄保持打开，更新用 os.replace 覆盖文件后，旧容器（及引用它的旧目录）
+仍读取原来的文件。
+"""
+import os
+import glob
+import uuid
+import io
+import json
+import base64
+import hashlib
+import zipfile
+from threading import Lock
+from Crypto.Cipher import AES
+
+MAGIC = b"HYPK1"
+KEY = b"1234567890abcdef"
+INDEX_AAD = b"__index__"
+
+
+def _seal(data: bytes, aad: bytes, key: bytes) -> bytes:
+    cipher = AES.new(key, AES.MODE_EAX)
+    cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return base64.b64encode(cipher.nonce + tag + ciphertext)
+
+
+def _open(line: bytes, aad: bytes, key: bytes) -> bytes:
+    raw = base64.b64decode(line)
+    nonce, tag, ciphertext = raw[:16], raw[16:32], raw[32:]
+    cipher = AES.new(key, AES.MODE_EAX, nonce)
+    cipher.update(aad)
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+def _open_shared(path):
+    """Open path for reading so it can still be renamed or replaced while open.
+
+    POSIX allows that for any open file; Windows only with FILE_SHARE_DELETE, which open() does not request."""
+    if os.name != "nt":
+        return open(path, "rb")
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    # GENERIC_READ；FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE；OPEN_EXISTING；FILE_ATTRIBUTE_NORMAL
+    handle = kernel32.CreateFileW(path, 0x80000000, 0x7, None, 3, 0x80, None)
+    if handle == wintypes.HANDLE(-1).value:
+        raise ctypes.WinError(ctypes.get_last_error())
+    return os.fdopen(msvcrt.open_osfhandle(handle, os.O_RDONLY), "rb")
+
+
+def replace_file(src, dst):
+    """os.replace that also works on Windows while an open container still holds dst."""
+    try:
+        os.replace(src, dst)
+    except PermissionError:
+        if os.name != "nt":
+            raise
+        # 被占用的旧文件先改名让出位置（句柄以 FILE_SHARE_DELETE 打开，允许改名），旧容器继续读取它
+        os.replace(dst, f"{dst}.{uuid.uuid4().hex}.old")
+        os.replace(src, dst)
+    for stale in glob.glob(glob.escape(dst) + ".*.old"):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_container(path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class PayloadContainer:
+    """Random-access reader; only the index is read and decrypted on open.
+
+    The file stays open for the container's lifetime and entries are read by offset, so the
+    container stays readable after the file on disk has been replaced by an update."""
+
+    def __init__(self, path, key=KEY):
+        self.path = path
+        self.key = key
+        self.lock = Lock()
+        self.file = _open_shared(path)
+        try:
+            if self.file.readline().rstrip(b"\r\n") != MAGIC:
+                raise ValueError(f"不是有效的 payload 容器: {path}")
+            index = json.loads(_open(self.file.readline().strip(), INDEX_AAD, key).decode("utf-8"))
+            self.data_start = self.file.tell()
+        except Exception:
+            self.file.close()
+            raise
+        self.version = index.get("version")
+        self.source_sha256 = index.get("source_sha256")
+        self.entries = index.get("entries", {})
+
+    def close(self):
+        self.file.close()
+
+    def names(self):
+        return list(self.entries)
+
+    def sha256(self, name):
+        return self.entries[name]["sha256"]
+
+    def read_raw(self, name) -> bytes:
+        """Return the still-encrypted base64 chunk, e.g. to copy it into a new container."""
+        meta = self.entries[name]
+        with self.lock:
+            self.file.seek(self.data_start + meta["offset"])
+            return self.file.read(meta["length"])
+
+    def read(self, name) -> bytes:
+        data = _open(self.read_raw(name), name.encode("utf-8"), self.key)
+        if hashlib.sha256(data).hexdigest() != self.entries[name]["sha256"]:
+            raise ValueError(f"条目校验失败: {name}")
+        return data
+
+    def read_all(self) -> dict:
+        return {name: self.read(name) for name in self.entries}
+
+
+class LegacyPayload:
+    """The original single AES-EAX blob around a zip, exposed through the container API."""
+
+    def __init__(self, path, key=KEY):
+        self.path = path
+        with open(path, "rb") as f:
+            raw = base64.b64decode(f.read())
+        nonce, tag, ciphertext = raw[:16], raw[16:32], raw[32:]
+        decrypted = AES.new(key, AES.MODE_EAX, nonce).decrypt_and_verify(ciphertext, tag)
+        self._data = {}
+        with zipfile.ZipFile(io.BytesIO(decrypted)) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                name = info.filename
+                if name.startswith("payload/"):
+                    name = name[len("payload/"):]
+                self._data[name] = zf.read(info)
+        version = self._data.get("version.txt", b"").decode("utf-8").strip()
+        self.version = version or None
+        self.source_sha256 = None
+        self.entries = {
+            name: {"sha256": hashlib.sha256(data).hexdigest()} for name, data in self._data.items()
+        }
+
+    def names(self):
+        return list(self._data)
+
+    def sha256(self, name):
+        return self.entries[name]["sha256"]
+
+    def read(self, name) -> bytes:
+        return self._data[name]
+
+    def read_all(self) -> dict:
+        return dict(self._data)
+
+
+def open_payload(path, key=KEY):
+    if is_container(path):
+        return PayloadContainer(path, key)
+    return LegacyPayload(path, key)
+
+
+def write_container(path, entries, version=None, source=None, source_sha256=None, key=KEY):
+    """Write a container atomically.
+
+    entries maps name -> plaintext bytes, or -> None to copy that entry's
+    encrypted chunk unchanged from ``source`` (a PayloadContainer) without
+    decrypting it. source_sha256 records the shipped payload the container
+    derives from (see ensure_container)."""
+    index = {}
+    chunks = []
+    offset = 0
+    for name in sorted(entries):
+        data = entries[name]
+        if data is None:
+            chunk = source.read_raw(name)
+            digest = source.sha256(name)
+        else:
+            chunk = _seal(data, name.encode("utf-8"), key)
+            digest = hashlib.sha256(data).hexdigest()
+        index[name] = {"offset": offset, "length": len(chunk), "sha256": digest}
+        chunks.append(chunk)
+        offset += len(chunk) + 1
+
+    header = {"version": version, "source_sha256": source_sha256, "entries": index}
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + b"\n")
+        f.write(_seal(header, INDEX_AAD, key) + b"\n")
+        for chunk in chunks:
+            f.write(chunk + b"\n")
+    replace_file(tmp_path, path)
+
+
+def read_source_sha256(path):
+    """source_sha256 recorded in the container at path, or None if it is missing or unreadable."""
+    try:
+        container = PayloadContainer(path)
+    except (OSError, ValueError):
+        return None
+    try:
+        return container.source_sha256
+    finally:
+        container.close()
+
+
+def ensure_container(source, target, key=KEY) -> bool:
+    """Build the container ``target`` from the shipped payload ``source``; ``source`` is never modified.
+
+    Nothing is done while ``target`` records the hash of this very ``source``: it was converted from
+    it, or updated since (updates carry the hash forward), so reinstalling the same payload never
+    overwrites a newer download. Returns True if target was written."""
+    if not os.path.exists(source):
+        return False
+    digest = file_sha256(source)
+    if os.path.exists(target) and read_source_sha256(target) == digest:
+        return False
+    payload = open_payload(source, key)
+    if isinstance(payload, PayloadContainer):
+        try:
+            write_container(target, dict.fromkeys(payload.entries), payload.version, payload, digest, key)
+        finally:
+            payload.close()
+    else:
+        write_container(target, payload.read_all(), payload.version, source_sha256=digest, key=key)
+    return True
@@ -0,0 +1,237 @@
+# scheduler.py
+"""
+公平调度：ComfyUI 的 /prompt 是全局先进先出队列，一个人连续提交几十个任务会让其他人一直排队。
+调度器把提交先放进按客户端划分的队列，按加权轮转（权重取自提交里的 priority）依次放行，
+每个后端同时在 ComfyUI 里排队/执行的任务数不超过 max_outstanding。
+任务完成（ComfyUI 推送结束消息）或超时后释放名额，再放行下一个。
+"""
+import time
+import heapq
+import logging
+from collections import deque
+from itertools import count
+from threading import Thread, Lock
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob:
+    __slots__ = ("prompt_id", "client_id", "backend", "priority", "payload", "enqueued_at", "started_at")
+
+    def __init__(self, prompt_id, client_id, backend, priority, payload):
+        self.prompt_id = prompt_id
+        self.client_id = client_id
+        self.backend = backend
+        self.priority = priority
+        # 放行时原样交给 submit 回调
+        self.payload = payload
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+class BackendQueue:
+    """Per-client queues for one backend, released by weighted round-robin.
+
+    A client's turn releases up to `priority` jobs (the priority of the job at the head of its
+    queue) before the next client gets a turn; within a client, higher priority goes first."""
+
+    def __init__(self):
+        self.clients = {}
+        self.rotation = deque()
+        self.credit = None
+        self.outstanding = {}
+        self.seq = count()
+
+    def push(self, job):
+        heap = self.clients.get(job.client_id)
+        if heap is None:
+            heap = self.clients[job.client_id] = []
+            self.rotation.append(job.client_id)
+        heapq.heappush(heap, (-job.priority, next(self.seq), job))
+
+    def pop(self):
+        if not self.rotation:
+            return None
+        client_id = self.rotation[0]
+        heap = self.clients[client_id]
+        if self.credit is None:
+            self.credit = -heap[0][0]
+        job = heapq.heappop(heap)[2]
+        self.credit -= 1
+        if not heap:
+            del self.clients[client_id]
+            self.rotation.popleft()
+            self.credit = None
+        elif self.credit <= 0:
+            self.rotation.rotate(-1)
+            self.credit = None
+        return job
+
+    def waiting(self):
+        return sum(len(heap) for heap in self.clients.values())
+
+    def order(self):
+        """Waiting jobs in the order they would be released, computed on a copy of the queues."""
+        copy = BackendQueue()
+        copy.clients = {client_id: list(heap) for client_id, heap in self.clients.items()}
+        copy.rotation = deque(self.rotation)
+        copy.credit = self.credit
+        jobs = []
+        while True:
+            job = copy.pop()
+            if job is None:
+                return jobs
+            jobs.append(job)
+
+    def remove(self, prompt_id):
+        for client_id, heap in self.clients.items():
+            for index, entry in enumerate(heap):
+                if entry[2].prompt_id == prompt_id:
+                    break
+            else:
+                continue
+            heap.pop(index)
+            heapq.heapify(heap)
+            if not heap:
+                del self.clients[client_id]
+                if self.rotation[0] == client_id:
+                    self.credit = None
+                self.rotation.remove(client_id)
+            return entry[2]
+        return None
+
+
+class FairScheduler:
+    def __init__(self, submit, max_outstanding=2, max_priority=5, slot_timeout=1800,
+                 is_finished=None, check_interval=5):
+        # submit(job) 在独立协程中调用，负责真正提交到后端；返回 False 表示提交失败，名额立即释放
+        self.submit = submit
+        self.max_outstanding = max(1, int(max_outstanding))
+        self.max_priority = max(1, int(max_priority))
+        self.slot_timeout = slot_timeout
+        # is_finished(prompt_id)：结束消息可能由其他 worker 收到，定期据共享状态补充释放
+        self.is_finished = is_finished
+        self.check_interval = check_interval
+        self.backends = {}
+        self.lock = Lock()
+        self.running = False
+
+    def clamp_priority(self, priority):
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError):
+            priority = 1
+        return min(max(priority, 1), self.max_priority)
+
+    def enqueue(self, prompt_id, client_id, backend, payload, priority=1):
+        """Queue a commit; returns the number of jobs waiting ahead of it on that backend."""
+        job = ScheduledJob(prompt_id, client_id, backend, self.clamp_priority(priority), payload)
+        with self.lock:
+            queue = self.backends.setdefault(backend, BackendQueue())
+            ahead = queue.waiting()
+            queue.push(job)
+        self.dispatch(backend)
+        return ahead
+
+    def waiting(self, backend):
+        queue = self.backends.get(backend)
+        return queue.waiting() if queue else 0
+
+    def outstanding(self, backend):
+        queue = self.backends.get(backend)
+        return len(queue.outstanding) if queue else 0
+
+    def jobs_ahead(self, prompt_id):
+        """Jobs released before prompt_id on its backend, or None if it is not waiting here."""
+        with self.lock:
+            for queue in self.backends.values():
+                order = queue.order()
+                for index, job in enumerate(order):
+                    if job.prompt_id == prompt_id:
+                        return order[:index]
+        return None
+
+    def waiting_jobs(self, backend):
+        with self.lock:
+            queue = self.backends.get(backend)
+            return queue.order() if queue else []
+
+    def dispatch(self, backend):
+        released = []
+        with self.lock:
+            queue = self.backends.get(backend)
+            if queue is None:
+                return
+            while len(queue.outstanding) < self.max_outstanding:
+                job = queue.pop()
+                if job is None:
+                    break
+                job.started_at = time.time()
+                queue.outstanding[job.prompt_id] = job
+                released.append(job)
+        for job in released:
+            Thread(target=self._submit, args=(job,), daemon=True).start()
+
+    def _submit(self, job):
+        try:
+            ok = self.submit(job)
+        except Exception as e:
+            logger.error(f"❌ 调度提交失败 {job.prompt_id}: {e}")
+            ok = False
+        if not ok:
+            self.release(job.prompt_id)
+
+    def release(self, prompt_id):
+        """Free the slot held by prompt_id (finished, failed or timed out) and release the next job."""
+        with self.lock:
+            for backend, queue in self.backends.items():
+                if queue.outstanding.pop(prompt_id, None) is not None:
+                    break
+            else:
+                return False
+        self.dispatch(backend)
+        return True
+
+    def remove(self, prompt_id):
+        """Drop a job that is still waiting in the proxy; returns False if it was already released."""
+        with self.lock:
+            for queue in self.backends.values():
+                if queue.remove(prompt_id) is not None:
+                    return True
+        return False
+
+    def rename(self, prompt_id, new_id):
+        """The backend assigned its own prompt_id (older ComfyUI ignores the one we send)."""
+        with self.lock:
+            for queue in self.backends.values():
+                job = queue.outstanding.pop(prompt_id, None)
+                if job is not None:
+                    job.prompt_id = new_id
+                    queue.outstanding[new_id] = job
+                    return True
+        return False
+
+    def check_slots(self):
+        now = time.time()
+        with self.lock:
+            held = [(prompt_id, job) for queue in self.backends.values() for prompt_id, job in queue.outstanding.items()]
+        for prompt_id, job in held:
+            if now - job.started_at > self.slot_timeout:
+                logger.warning(f"⚠️ 任务占用调度名额超时，强制释放: {prompt_id}")
+                self.release(prompt_id)
+            elif self.is_finished and self.is_finished(prompt_id):
+                self.release(prompt_id)
+
+    def run(self):
+        while self.running:
+            time.sleep(self.check_interval)
+            try:
+                self.check_slots()
+            except Exception as e:
+                logger.error(f"❌ 调度名额检查失败: {e}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        Thread(target=self.run, daemon=True).start()
@@ -0,0 +1,552 @@
+# state_store.py
+"""
+任务状态与客户端消息队列的存储。
+state_store 为 "auto"（默认）或 "sqlite" 时使用 SQLite（WAL）文件，多 worker 共享同一文件；
+代理重启后任务状态和未送达的消息仍在，并在启动时与 ComfyUI 对账。
+"memory" 为显式关闭持久化的纯内存实现（重启即丢失，仅限单 worker）。
+两种实现接口一致，main.py 只通过这些方法访问状态。
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import sqlite3
+import logging
+from collections import defaultdict, deque
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# 每个客户端最多保留的消息数，以及消息被读取后保留的条数
+MAX_QUEUED_MESSAGES = 100
+KEEP_AFTER_READ = 20
+
+# 取消是终态：之后 ComfyUI 推送的进度等消息不再改写任务状态
+CANCELLED = "cancelled"
+
+# 每个工作流保留的最近运行耗时样本数（用于估算排队 ETA）
+RUNTIME_SAMPLES = 50
+
+# 任务状态与未读消息的默认保留时间（秒）
+TASK_TTL = 7200
+MESSAGE_TTL = 7200
+
+# SQLite 中同一客户端 last_seen 的最短写入间隔（秒），轮询不必每次都写库
+LAST_SEEN_INTERVAL = 5
+
+
+def _new_message(message):
+    return {
+        "id": str(uuid.uuid4())[:8],
+        "timestamp": time.time(),
+        "data": message
+    }
+
+
+class ExpiryHeap:
+    """Min-heap of (time, key) for expiring keys in O(expired · log n) instead of scanning every key.
+
+    Updating a key pushes a new entry and leaves the old one in place; stale entries are skipped
+    when popped and the heap is rebuilt once they outnumber the live keys. Not thread-safe."""
+
+    def __init__(self):
+        self.heap = []
+        self.times = {}
+
+    def touch(self, key, at):
+        self.times[key] = at
+        heapq.heappush(self.heap, (at, key))
+        if len(self.heap) > 2 * len(self.times) + 64:
+            self.heap = [(at, key) for key, at in self.times.items()]
+            heapq.heapify(self.heap)
+
+    def discard(self, key):
+        self.times.pop(key, None)
+
+    def pop_before(self, cutoff):
+        """Remove and return the keys whose latest time is older than cutoff."""
+        expired = []
+        heap, times = self.heap, self.times
+        while heap and heap[0][0] < cutoff:
+            at, key = heapq.heappop(heap)
+            if times.get(key) == at:
+                del times[key]
+                expired.append(key)
+        return expired
+
+
+class MemoryStateStore:
+    # last_seen 每次轮询都更新
+    last_seen_interval = 0
+
+    def __init__(self, task_ttl=TASK_TTL, message_ttl=MESSAGE_TTL):
+        self.task_ttl = task_ttl
+        self.message_ttl = message_ttl
+        self.tasks = {}
+        self.queues = defaultdict(deque)
+        self.last_seen = {}
+        self.backend_depth = {}
+        self.runtimes = defaultdict(lambda: deque(maxlen=RUNTIME_SAMPLES))
+        # 任务按最后更新时间、客户端按最后轮询时间建立过期索引，清理只处理到期的部分
+        self.task_expiry = ExpiryHeap()
+        self.client_expiry = ExpiryHeap()
+        # 每个客户端按队首（最早）消息的时间建立过期索引，对应 SQLite 的 expires_at
+        self.message_expiry = ExpiryHeap()
+        self.lock = Lock()
+
+    # ---- 任务状态 ----
+    def set_task(self, prompt_id, status):
+        with self.lock:
+            self.tasks[prompt_id] = status
+            self.task_expiry.touch(prompt_id, status.get("timestamp", time.time()))
+
+    def get_task(self, prompt_id):
+        return self.tasks.get(prompt_id)
+
+    def update_task(self, prompt_id, type_, updates):
+        """Merge updates into an existing task's data; returns False if the task is unknown or cancelled."""
+        with self.lock:
+            status = self.tasks.get(prompt_id)
+            if status is None or status["type"] == CANCELLED:
+                return False
+            status["type"] = type_
+            status["data"].update(updates)
+            status["timestamp"] = time.time()
+            self.task_expiry.touch(prompt_id, status["timestamp"])
+            return True
+
+    def task_client(self, prompt_id):
+        status = self.tasks.get(prompt_id)
+        return status["data"].get("client_id") if status else None
+
+    def task_count(self):
+        return len(self.tasks)
+
+    def iter_tasks(self):
+        return list(self.tasks.items())
+
+    def client_tasks(self, client_id):
+        return [(prompt_id, status) for prompt_id, status in list(self.tasks.items())
+                if status["data"].get("client_id") == client_id]
+
+    def expire_tasks(self):
+        with self.lock:
+            expired = self.task_expiry.pop_before(time.time() - self.task_ttl)
+            for prompt_id in expired:
+                self.tasks.pop(prompt_id, None)
+        return len(expired)
+
+    # ---- 客户端消息 ----
+    def add_message(self, client_id, message):
+        enhanced = _new_message(message)
+        with self.lock:
+            queue = self.queues[client_id]
+            head = queue[0] if queue else None
+            if len(queue) >= MAX_QUEUED_MESSAGES:
+                queue.popleft()
+            queue.append(enhanced)
+            if queue[0] is not head:
+                self.message_expiry.touch(client_id, queue[0]["timestamp"])
+        return enhanced
+
+    def _reindex_messages(self, client_id):
+        queue = self.queues.get(client_id)
+        if queue:
+            self.message_expiry.touch(client_id, queue[0]["timestamp"])
+        else:
+            self.message_expiry.discard(client_id)
+
+    def get_messages(self, client_id, since=None):
+        with self.lock:
+            self.last_seen[client_id] = now = time.time()
+            self.client_expiry.touch(client_id, now)
+            if client_id not in self.queues:
+                return []
+            messages = [msg for msg in self.queues[client_id] if since is None or msg["timestamp"] > since]
+            if messages:
+                self.queues[client_id] = deque(list(self.queues[client_id])[-KEEP_AFTER_READ:])
+                self._reindex_messages(client_id)
+            return messages
+
+    def queue_size(self, client_id):
+        return len(self.queues.get(client_id, ()))
+
+    def active_clients(self, within=300):
+        now = time.time()
+        with self.lock:
+            return [client_id for client_id, seen in self.last_seen.items() if now - seen < within]
+
+    def touch_clients(self, client_ids):
+        now = time.time()
+        with self.lock:
+            for client_id in client_ids:
+                self.last_seen[client_id] = now
+                self.client_expiry.touch(client_id, now)
+
+    def remove_inactive_clients(self, idle=600):
+        with self.lock:
+            inactive = self.client_expiry.pop_before(time.time() - idle)
+            for client_id in inactive:
+                self.last_seen.pop(client_id, None)
+                self.queues.pop(client_id, None)
+                self.message_expiry.discard(client_id)
+        return inactive
+
+    def expire_messages(self):
+        cutoff = time.time() - self.message_ttl
+        expired = 0
+        with self.lock:
+            # 只处理队首消息已过期的客户端
+            for client_id in self.message_expiry.pop_before(cutoff):
+                queue = self.queues.get(client_id)
+                while queue and queue[0]["timestamp"] < cutoff:
+                    queue.popleft()
+                    expired += 1
+                self._reindex_messages(client_id)
+        return expired
+
+    def queue_stats(self):
+        """(queued message count, approximate bytes)"""
+        with self.lock:
+            queued = [msg for queue in self.queues.values() for msg in queue]
+        size = 0
+        for msg in queued:
+            try:
+                size += len(json.dumps(msg, ensure_ascii=False))
+            except (TypeError, ValueError):
+                pass
+        return len(queued), size
+
+    # ---- 后端队列深度（由 ComfyUI 监听写入，提交改道时读取） ----
+    def set_backend_depth(self, url, depth):
+        self.backend_depth[url] = depth
+
+    def backend_depths(self):
+        return dict(self.backend_depth)
+
+    # ---- 工作流运行耗时 ----
+    def record_runtime(self, workflow_id, seconds):
+        self.runtimes[workflow_id].append(seconds)
+
+    def runtime_samples(self, workflow_id=None):
+        """Recent runtimes (seconds) of one workflow, or of all workflows when workflow_id is None."""
+        if workflow_id is None:
+            return [value for samples in list(self.runtimes.values()) for value in samples]
+        samples = self.runtimes.get(workflow_id)
+        return list(samples) if samples else []
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    prompt_id TEXT PRIMARY KEY,
+    client_id TEXT,
+    timestamp REAL NOT NULL,
+    status TEXT NOT NULL,
+    expires_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    body TEXT NOT NULL,
+    expires_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_client ON messages(client_id, seq);
+CREATE TABLE IF NOT EXISTS clients (
+    client_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backend_depth (
+    url TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runtimes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workflow_id TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+"""
+
+# 每一项把库从 user_version == 下标 升级到下标 + 1
+MIGRATIONS = [
+    # 0 -> 1: 过期时间列与索引，清理只扫描已过期的行
+    """
+    ALTER TABLE tasks ADD COLUMN expires_at REAL NOT NULL DEFAULT 0;
+    ALTER TABLE messages ADD COLUMN expires_at REAL NOT NULL DEFAULT 0;
+    """,
+    # 1 -> 2: 工作流运行耗时样本
+    """
+    CREATE TABLE IF NOT EXISTS runtimes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workflow_id TEXT NOT NULL,
+        seconds REAL NOT NULL
+    );
+    """,
+]
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tasks_expires ON tasks(expires_at);
+CREATE INDEX IF NOT EXISTS idx_messages_expires ON messages(expires_at);
+CREATE INDEX IF NOT EXISTS idx_clients_seen ON clients(last_seen);
+CREATE INDEX IF NOT EXISTS idx_tasks_client ON tasks(client_id);
+CREATE INDEX IF NOT EXISTS idx_runtimes_workflow ON runtimes(workflow_id, id);
+"""
+
+
+class SQLiteStateStore:
+    """Same interface as MemoryStateStore, backed by a WAL-mode SQLite file shared between processes."""
+
+    last_seen_interval = LAST_SEEN_INTERVAL
+
+    def __init__(self, path="huiying_state.db", task_ttl=TASK_TTL, message_ttl=MESSAGE_TTL):
+        self.path = path
+        self.task_ttl = task_ttl
+        self.message_ttl = message_ttl
+        # 本进程最近一次写入各客户端 last_seen 的时间
+        self.seen_written = {}
+        self.lock = Lock()
+        self._conn = None
+        self._pid = None
+        self._migrate()
+
+    def _migrate(self):
+        conn = self.conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        has_tasks = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks'").fetchone()
+        if not has_tasks:
+            # 新库直接建最新结构
+            conn.executescript(SCHEMA)
+            version = len(MIGRATIONS)
+        for index in range(version, len(MIGRATIONS)):
+            conn.executescript(MIGRATIONS[index])
+            if index == 0:
+                conn.execute("UPDATE tasks SET expires_at = timestamp + ?", (self.task_ttl,))
+                conn.execute("UPDATE messages SET expires_at = timestamp + ?", (self.message_ttl,))
+        conn.executescript(INDEXES)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+    @property
+    def conn(self):
+        # 连接不能跨 fork 使用，子进程首次访问时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # ---- 任务状态 ----
+    def set_task(self, prompt_id, status):
+        timestamp = status.get("timestamp", time.time())
+        self._execute(
+            "INSERT OR REPLACE INTO tasks (prompt_id, client_id, timestamp, status, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (prompt_id, status.get("data", {}).get("client_id"), timestamp,
+             json.dumps(status, ensure_ascii=False), timestamp + self.task_ttl)
+        )
+
+    def get_task(self, prompt_id):
+        rows = self._execute("SELECT status FROM tasks WHERE prompt_id = ?", (prompt_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def update_task(self, prompt_id, type_, updates):
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT status FROM tasks WHERE prompt_id = ?", (prompt_id,)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return False
+                status = json.loads(row[0])
+                if status["type"] == CANCELLED:
+                    conn.execute("COMMIT")
+                    return False
+                status["type"] = type_
+                status["data"].update(updates)
+                status["timestamp"] = time.time()
+                conn.execute(
+                    "UPDATE tasks SET timestamp = ?, status = ?, expires_at = ? WHERE prompt_id = ?",
+                    (status["timestamp"], json.dumps(status, ensure_ascii=False),
+                     status["timestamp"] + self.task_ttl, prompt_id)
+                )
+                conn.execute("COMMIT")
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def task_client(self, prompt_id):
+        rows = self._execute("SELECT client_id FROM tasks WHERE prompt_id = ?", (prompt_id,))
+        return rows[0][0] if rows else None
+
+    def task_count(self):
+        return self._execute("SELECT COUNT(*) FROM tasks")[0][0]
+
+    def iter_tasks(self):
+        return [(prompt_id, json.loads(status)) for prompt_id, status in
+                self._execute("SELECT prompt_id, status FROM tasks")]
+
+    def client_tasks(self, client_id):
+        return [(prompt_id, json.loads(status)) for prompt_id, status in
+                self._execute("SELECT prompt_id, status FROM tasks WHERE client_id = ?", (client_id,))]
+
+    def expire_tasks(self):
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM tasks WHERE expires_at < ?", (time.time(),))
+            return cursor.rowcount
+
+    # ---- 客户端消息 ----
+    def _trim(self, conn, client_id, keep):
+        conn.execute(
+            "DELETE FROM messages WHERE client_id = ? AND seq <= "
+            "(SELECT seq FROM messages WHERE client_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+            (client_id, client_id, keep)
+        )
+
+    def add_message(self, client_id, message):
+        enhanced = _new_message(message)
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO messages (client_id, timestamp, body, expires_at) VALUES (?, ?, ?, ?)",
+                    (client_id, enhanced["timestamp"], json.dumps(enhanced, ensure_ascii=False),
+                     enhanced["timestamp"] + self.message_ttl)
+                )
+                self._trim(conn, client_id, MAX_QUEUED_MESSAGES)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return enhanced
+
+    def get_messages(self, client_id, since=None):
+        now = time.time()
+        with self.lock:
+            conn = self.conn
+            if now - self.seen_written.get(client_id, 0) >= self.last_seen_interval:
+                conn.execute(
+                    "INSERT OR REPLACE INTO clients (client_id, last_seen) VALUES (?, ?)", (client_id, now)
+                )
+                self.seen_written[client_id] = now
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if since is None:
+                    rows = conn.execute(
+                        "SELECT body FROM messages WHERE client_id = ? ORDER BY seq", (client_id,)
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT body FROM messages WHERE client_id = ? AND timestamp > ? ORDER BY seq",
+                        (client_id, since)
+                    ).fetchall()
+                if rows:
+                    self._trim(conn, client_id, KEEP_AFTER_READ)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [json.loads(row[0]) for row in rows]
+
+    def queue_size(self, client_id):
+        return self._execute("SELECT COUNT(*) FROM messages WHERE client_id = ?", (client_id,))[0][0]
+
+    def active_clients(self, within=300):
+        rows = self._execute("SELECT client_id FROM clients WHERE last_seen > ?", (time.time() - within,))
+        return [row[0] for row in rows]
+
+    def touch_clients(self, client_ids):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO clients (client_id, last_seen) VALUES (?, ?)",
+                [(client_id, now) for client_id in client_ids]
+            )
+            self.seen_written.update((client_id, now) for client_id in client_ids)
+
+    def expire_messages(self):
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM messages WHERE expires_at < ?", (time.time(),))
+            return cursor.rowcount
+
+    def remove_inactive_clients(self, idle=600):
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cutoff = time.time() - idle
+                for client_id in [c for c, written in self.seen_written.items() if written < cutoff]:
+                    del self.seen_written[client_id]
+                inactive = [row[0] for row in conn.execute(
+                    "SELECT client_id FROM clients WHERE last_seen < ?", (cutoff,)
+                ).fetchall()]
+                for client_id in inactive:
+                    conn.execute("DELETE FROM messages WHERE client_id = ?", (client_id,))
+                conn.execute("DELETE FROM clients WHERE last_seen < ?", (cutoff,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return inactive
+
+    def queue_stats(self):
+        count, size = self._execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM messages")[0]
+        return count, size
+
+    # ---- 后端队列深度 ----
+    def set_backend_depth(self, url, depth):
+        self._execute("INSERT OR REPLACE INTO backend_depth (url, depth) VALUES (?, ?)", (url, depth))
+
+    def backend_depths(self):
+        return dict(self._execute("SELECT url, depth FROM backend_depth"))
+
+    # ---- 工作流运行耗时 ----
+    def record_runtime(self, workflow_id, seconds):
+        with self.lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT INTO runtimes (workflow_id, seconds) VALUES (?, ?)", (workflow_id, seconds))
+                conn.execute(
+                    "DELETE FROM runtimes WHERE workflow_id = ? AND id <= "
+                    "(SELECT id FROM runtimes WHERE workflow_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (workflow_id, workflow_id, RUNTIME_SAMPLES)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def runtime_samples(self, workflow_id=None):
+        if workflow_id is None:
+            rows = self._execute("SELECT seconds FROM runtimes ORDER BY id DESC LIMIT 1000")
+        else:
+            rows = self._execute("SELECT seconds FROM runtimes WHERE workflow_id = ?", (workflow_id,))
+        return [row[0] for row in rows]
+
+
+def create_state_store(config, workers=1):
+    """"auto" and "sqlite" persist to SQLite; "memory" opts out of persistence for a single worker."""
+    backend = config.get("state_store", "auto")
+    task_ttl = config.get("task_ttl", TASK_TTL)
+    message_ttl = config.get("message_ttl", MESSAGE_TTL)
+    if backend == "memory" and workers > 1:
+        logger.warning("⚠️ 多 worker 需要共享状态，state_store 已改用 sqlite")
+        backend = "sqlite"
+    if backend != "memory":
+        path = config.get("state_db", "huiying_state.db")
+        try:
+            store = SQLiteStateStore(path, task_ttl, message_ttl)
+            logger.info(f"🗄️ 使用 SQLite 状态存储: {path}")
+            return store
+        except sqlite3.Error as e:
+            if workers > 1:
+                raise
+            logger.error(f"❌ SQLite 状态存储打开失败，改用内存存储（重启后状态丢失）: {e}")
+    return MemoryStateStore(task_ttl, message_ttl)
@@ -0,0 +1,142 @@
+# task_recovery.py
+"""
+启动时的任务对账（默认的 SQLite 状态存储才有意义，state_store 为 memory 时无事可做）：
+代理重启后，持久化存储里仍有未完成的任务，但 ComfyUI 在代理停机期间推送的完成消息已经丢失。这里按后端查询 /queue 与 /history，
+把任务状态补齐，并为客户端补发完成或失败消息，避免 GPU 上的任务成为孤儿、客户端重复提交。
+"""
+import time
+import logging
+
+import requests
+
+from batch_coalescer import split_output
+
+logger = logging.getLogger(__name__)
+
+# 已结束的任务类型，不需要对账
+TERMINAL_TYPES = ("done", "error", "cancelled")
+
+LOST_MESSAGE = "任务在代理重启期间丢失，请重新提交"
+
+
+def pending_tasks(state):
+    """Tasks submitted to a local ComfyUI backend that had not finished when the proxy stopped."""
+    tasks = {}
+    for prompt_id, status in state.iter_tasks():
+        data = status.get("data", {})
+        backend = data.get("backend")
+        if status.get("type") in TERMINAL_TYPES or not backend or backend == "cloud":
+            continue
+        if data.get("batch_members"):
+            # 合并批次本身没有客户端，由各成员按 batch_id 对账
+            continue
+        tasks.setdefault(backend, []).append((prompt_id, data))
+    return tasks
+
+
+def fetch_queue(backend, timeout=5):
+    """Return (running prompt_ids, pending prompt_ids) from ComfyUI /queue."""
+    resp = requests.get(f"{backend}/queue", timeout=timeout)
+    resp.raise_for_status()
+    queue = resp.json()
+    # 队列项格式: [number, prompt_id, prompt, extra_data, outputs_to_execute]
+    running = {item[1] for item in queue.get("queue_running", []) if len(item) > 1}
+    pending = {item[1] for item in queue.get("queue_pending", []) if len(item) > 1}
+    return running, pending
+
+
+def fetch_history(backend, prompt_id, timeout=5):
+    resp = requests.get(f"{backend}/history/{prompt_id}", timeout=timeout)
+    resp.raise_for_status()
+    return resp.json().get(prompt_id)
+
+
+def history_error(history):
+    for message in history.get("status", {}).get("messages", []):
+        if message and message[0] == "execution_error":
+            return message[1] if len(message) > 1 else {}
+    return None
+
+
+def reconcile_backend(state, notify, backend, tasks, on_running=None):
+    """Bring the stored state of one backend's tasks in line with ComfyUI; returns a summary dict."""
+    running, queued = fetch_queue(backend)
+    summary = {"running": 0, "queued": 0, "done": 0, "error": 0, "lost": 0}
+    for prompt_id, data in tasks:
+        client_id = data.get("client_id")
+        # 合并批次的成员在 ComfyUI 里以批次的 prompt_id 存在
+        comfy_id = data.get("batch_id") or data.get("comfy_prompt_id") or prompt_id
+        if comfy_id in running or comfy_id in queued:
+            kind = "executing" if comfy_id in running else "queued"
+            state.update_task(prompt_id, kind, {"status": kind})
+            summary["running" if kind == "executing" else "queued"] += 1
+            if on_running:
+                on_running(prompt_id, data)
+            continue
+
+        history = fetch_history(backend, comfy_id)
+        if history is None:
+            state.update_task(prompt_id, "error", {"status": "lost", "error": LOST_MESSAGE})
+            summary["lost"] += 1
+            if client_id:
+                notify(client_id, {
+                    "type": "execution_error",
+                    "data": {"prompt_id": prompt_id, "exception_message": LOST_MESSAGE, "recovered": True}
+                })
+            continue
+
+        error = history_error(history)
+        if error is not None or history.get("status", {}).get("status_str") == "error":
+            error = error or {}
+            state.update_task(prompt_id, "error", {"status": "error", "error": error.get("exception_message")})
+            summary["error"] += 1
+            if client_id:
+                notify(client_id, {"type": "execution_error", "data": {**error, "prompt_id": prompt_id, "recovered": True}})
+            continue
+
+        state.update_task(prompt_id, "done", {"status": "done"})
+        summary["done"] += 1
+        if not client_id:
+            continue
+        # 按 ComfyUI 的推送顺序补发：每个输出节点一条 executed，最后 node 为空的 executing 表示结束
+        for node_id, output in history.get("outputs", {}).items():
+            if data.get("batch_id"):
+                output = split_output(output, data["batch_index"], data["batch_count"], data["batch_total"])
+            notify(client_id, {
+                "type": "executed",
+                "data": {"node": node_id, "output": output, "prompt_id": prompt_id, "recovered": True}
+            })
+        notify(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id, "recovered": True}})
+    return summary
+
+
+def reconcile_tasks(state, notify, on_running=None, retry_interval=10, max_wait=600):
+    """Reconcile every unfinished task, retrying each backend until it answers or max_wait elapses.
+
+    ComfyUI is often still starting when the proxy comes up, so unreachable backends are retried."""
+    by_backend = pending_tasks(state)
+    if not by_backend:
+        return
+    # 轮询消息的客户端在重启期间可能被判定为不活跃，给它们重新计时
+    state.touch_clients({data["client_id"] for tasks in by_backend.values() for _, data in tasks if data.get("client_id")})
+    logger.info(f"🔁 发现 {sum(len(t) for t in by_backend.values())} 个未完成任务，开始与后端对账")
+
+    deadline = time.time() + max_wait
+    while by_backend:
+        for backend, tasks in list(by_backend.items()):
+            try:
+                summary = reconcile_backend(state, notify, backend, tasks, on_running)
+            except (requests.RequestException, ValueError) as e:
+                logger.debug("对账时后端不可用 %s: %s", backend, e)
+                continue
+            del by_backend[backend]
+            logger.info(
+                f"🔁 [{backend}] 对账完成：运行中 {summary['running']}，排队 {summary['queued']}，"
+                f"已完成 {summary['done']}，失败 {summary['error']}，丢失 {summary['lost']}"
+            )
+        if not by_backend:
+            break
+        if time.time() >= deadline:
+            logger.warning(f"⚠️ 后端长时间不可用，放弃对账: {', '.join(by_backend)}")
+            break
+        time.sleep(retry_interval)
@@ -0,0 +1,98 @@
+import time
+
+from batch_coalescer import (
+    BatchCoalescer, CoalescedCommit, batch_signature, merge_batch, seeds_random, split_message,
+)
+
+
+def _workflow(seed=1, batch_size=1, steps=20):
+    return {
+        "3": {"class_type": "KSampler", "inputs": {"seed": seed, "steps": steps, "model": ["4", 0], "latent_image": ["5", 0]}},
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": batch_size}},
+    }
+
+
+def test_signature_ignores_seed_and_batch_size():
+    sig, size = batch_signature(_workflow(seed=1, batch_size=2))
+    assert size == 2
+    assert batch_signature(_workflow(seed=99, batch_size=1))[0] == sig
+    assert batch_signature(_workflow(steps=30))[0] != sig
+
+
+def test_signature_requires_single_latent_source():
+    workflow = _workflow()
+    workflow["6"] = {"class_type": "EmptyLatentImage", "inputs": {"batch_size": 1}}
+    assert batch_signature(workflow) is None
+
+
+def test_merge_batch_copies():
+    workflow = _workflow()
+    merged = merge_batch(workflow, 4)
+    assert merged["5"]["inputs"]["batch_size"] == 4
+    assert workflow["5"]["inputs"]["batch_size"] == 1
+
+
+def test_seeds_random():
+    assert seeds_random((-1,))
+    assert seeds_random((-1, -1))
+    assert not seeds_random((-1, 5))
+    assert not seeds_random(())
+
+
+def test_split_message_slices_outputs():
+    members = [["a", "c1", 0, 1], ["b", "c2", 1, 2]]
+    message = {"type": "executed", "data": {"prompt_id": "batch", "node": "9", "output": {"images": [1, 2, 3], "meta": "x"}}}
+    split = list(split_message(message, members, total=3))
+    assert [m["data"]["prompt_id"] for m in split] == ["a", "b"]
+    assert split[0]["data"]["output"] == {"images": [1], "meta": "x"}
+    assert split[1]["data"]["output"] == {"images": [2, 3], "meta": "x"}
+    assert [m["data"]["batch_index"] for m in split] == [0, 1]
+    assert "seed" not in split[0]["data"]
+    # 批次消息本身不被改写
+    assert message["data"]["prompt_id"] == "batch"
+
+
+def test_split_message_keeps_positions_of_detached_members():
+    members = [["b", "c2", 1, 1]]
+    message = {"type": "executed", "data": {"output": {"images": [1, 2]}}}
+    split = list(split_message(message, members, total=2))
+    assert split[0]["data"]["output"] == {"images": [2]}
+
+
+def _coalescer(window=0.05, max_batch=8):
+    flushed = []
+    return BatchCoalescer(lambda backend, group: flushed.append([c.prompt_id for c in group]), window, max_batch), flushed
+
+
+def _commit(prompt_id, seed, batch_size=1):
+    workflow = _workflow(seed=seed, batch_size=batch_size)
+    return CoalescedCommit(prompt_id, "c", "wf", workflow, batch_size, 3)
+
+
+def test_random_seeds_coalesce():
+    coalescer, flushed = _coalescer()
+    for prompt_id in "abc":
+        coalescer.add("local", "sig", _commit(prompt_id, -1))
+    time.sleep(0.1)
+    assert flushed == [["a", "b", "c"]]
+
+
+def test_fixed_seeds_submitted_alone():
+    coalescer, flushed = _coalescer()
+    coalescer.add("local", "sig", _commit("a", -1))
+    coalescer.add("local", "sig", _commit("b", 10))
+    coalescer.add("local", "sig", _commit("c", 11))
+    coalescer.add("local", "sig", _commit("d", -1))
+    assert flushed == [["b"], ["c"]]
+    time.sleep(0.1)
+    assert flushed == [["b"], ["c"], ["a", "d"]]
+
+
+def test_full_group_flushes_before_new_one():
+    coalescer, flushed = _coalescer(max_batch=4)
+    coalescer.add("local", "sig", _commit("a", -1, 3))
+    coalescer.add("local", "sig", _commit("b", -1, 2))
+    assert flushed == [["a"]]
+    time.sleep(0.1)
+    assert flushed == [["a"], ["b"]]
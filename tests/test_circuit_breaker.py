@@ -0,0 +1,52 @@
+import time
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, PROBE
+
+
+def _open_breaker(recovery_timeout=0.05):
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=recovery_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = _open_breaker()
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.allow_request() == PROBE
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request() is True
+
+
+def test_failed_probe_reopens():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_released_probe_frees_the_slot():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.allow_request()
+
+
+def test_stale_probe_counts_as_failure():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    time.sleep(0.06)
+    # 探测请求始终没有结果：按失败处理，重新冷却
+    assert not breaker.allow_request()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.allow_request()
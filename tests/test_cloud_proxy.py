@@ -0,0 +1,64 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from flask import Flask
+
+import cloud_proxy
+from cloud_proxy import CloudProxy
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f"{self.headers['Host']} {self.path}".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _upstream():
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_forward_keeps_repeated_params_and_caches_dns(monkeypatch):
+    server = _upstream()
+    lookups = []
+    real_getaddrinfo = socket.getaddrinfo
+
+    def counting_getaddrinfo(host, *args, **kwargs):
+        lookups.append(host)
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(cloud_proxy.socket, "getaddrinfo", counting_getaddrinfo)
+    proxy = CloudProxy(f"http://localhost:{server.server_port}")
+    app = Flask(__name__)
+    proxy.register(app)
+    try:
+        client = app.test_client()
+        first = client.get("/psPlus/list?id=1&id=2")
+        client.get("/psPlus/list")
+        assert first.get_data(as_text=True) == f"localhost:{server.server_port} /psPlus/list?id=1&id=2"
+        assert lookups.count("localhost") == 1
+    finally:
+        server.shutdown()
+
+
+def test_on_forward_runs_after_the_route_is_forwarded():
+    server = _upstream()
+    proxy = CloudProxy(f"http://127.0.0.1:{server.server_port}")
+    calls = []
+    proxy.on_forward("/psPlus/<path:subpath>", lambda: calls.append("psPlus"))
+    proxy.on_forward("/auth/logout", lambda: calls.append("logout"))
+    app = Flask(__name__)
+    proxy.register(app)
+    try:
+        app.test_client().get("/psPlus/list")
+        assert calls == ["psPlus"]
+    finally:
+        server.shutdown()
@@ -0,0 +1,42 @@
+from eta import EtaEstimator
+from state_store import MemoryStateStore
+
+
+def _estimator(queue):
+    state = MemoryStateStore()
+    estimator = EtaEstimator(state)
+    estimator.backend_queue = lambda backend, fresh=False: queue
+    return state, estimator
+
+
+def test_unknown_prompts_use_global_distribution():
+    state, estimator = _estimator((["other-running"], ["other-1", "mine"]))
+    for seconds in (10, 10, 10):
+        state.record_runtime("wf-a", seconds)
+    state.set_task("mine", {"type": "submitted", "data": {"backend": "http://local", "workflow_id": "wf-b"}})
+
+    estimate = estimator.estimate("mine", state.get_task("mine"))
+    assert estimate["queue_position"] == 2
+    # 前面两个 prompt 代理并不认识，自身工作流也没有样本：全部按全局 p50 估算
+    assert estimate["eta_seconds"] == 30
+
+
+def test_fresh_queue_fetch_limited_to_ttl(monkeypatch):
+    calls = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"queue_running": [], "queue_pending": []}
+
+    def get(url, timeout):
+        calls.append(url)
+        return Response()
+
+    monkeypatch.setattr("eta.requests.get", get)
+    estimator = EtaEstimator(MemoryStateStore(), queue_ttl=60)
+    for _ in range(5):
+        estimator.backend_queue("http://local", fresh=True)
+    assert len(calls) == 1
@@ -0,0 +1,25 @@
+import time
+
+from health_probe import HealthProber
+
+
+def test_tracked_backends_are_capped():
+    prober = HealthProber(max_backends=3)
+    prober.track("http://local", pinned=True)
+    for index in range(5):
+        prober.track(f"http://remote-{index}")
+        time.sleep(0.001)
+    assert len(prober.backends) == 3
+    assert "http://local" in prober.backends
+    assert set(prober.backends) == {"http://local", "http://remote-3", "http://remote-4"}
+
+
+def test_idle_backends_evicted():
+    prober = HealthProber(idle_timeout=60)
+    prober.track("http://local", pinned=True)
+    prober.track("http://old")
+    prober.track("http://recent")
+    prober.backends["http://old"].last_used -= 120
+    prober.backends["http://local"].last_used -= 120
+    assert prober.evict_idle() == ["http://old"]
+    assert set(prober.backends) == {"http://local", "http://recent"}
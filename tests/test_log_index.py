@@ -0,0 +1,34 @@
+import logging
+import time
+
+from log_index import LogIndex
+
+
+def _record(message, **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_concurrent_writers_keep_fts_in_sync(tmp_path):
+    path = str(tmp_path / "logs.db")
+    first, second = LogIndex(path), LogIndex(path)
+    first.write_records([_record("任务提交成功 alpha")])
+    # 另一个 worker 的写入与本进程交替进行
+    second.write_records([_record("任务提交成功 beta"), _record("gamma 失败")])
+    first.write_records([_record("任务提交成功 delta", prompt_id="p1")])
+
+    assert [row["message"] for row in first.search(q="提交成功")] == [
+        "任务提交成功 delta", "任务提交成功 beta", "任务提交成功 alpha",
+    ]
+    assert [row["message"] for row in second.search(q="gamma")] == ["gamma 失败"]
+    assert first.search(q="delta", prompt_id="p1")[0]["prompt_id"] == "p1"
+
+
+def test_prune_removes_from_fts(tmp_path):
+    index = LogIndex(str(tmp_path / "logs.db"), retention_hours=1)
+    old = _record("过期的记录 alpha")
+    old.created = time.time() - 7200
+    index.write_records([old, _record("新的记录 alpha")])
+    index.prune()
+    assert [row["message"] for row in index.search(q="alpha")] == ["新的记录 alpha"]
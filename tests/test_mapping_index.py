@@ -0,0 +1,48 @@
+from mapping_index import MappingIndex
+
+TEMPLATE = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20, "cfg": 7.0, "model": ["4", 0]}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}},
+}
+MAPPINGS = {"wf": {"param_mappings": {
+    "steps": ["3", "inputs", "steps"],
+    "cfg": ["3", "inputs", "cfg"],
+    "missing": ["99", "inputs", "x"],
+}}}
+
+
+def test_merge_applies_coerced_values():
+    index = MappingIndex(MAPPINGS)
+    merged = index.merge("wf", TEMPLATE, {"steps": "30", "cfg": "5.5", "missing": 1, "unmapped": 2})
+    assert merged["3"]["inputs"]["steps"] == 30
+    assert merged["3"]["inputs"]["cfg"] == 5.5
+    assert "99" not in merged
+
+
+def test_merge_does_not_share_template_nodes():
+    index = MappingIndex(MAPPINGS)
+    merged = index.merge("wf", TEMPLATE, {"steps": 30})
+    merged["4"]["inputs"]["ckpt_name"] = "b.safetensors"
+    merged["3"]["inputs"]["model"][0] = "5"
+    assert TEMPLATE["4"]["inputs"]["ckpt_name"] == "a.safetensors"
+    assert TEMPLATE["3"]["inputs"] == {"seed": 1, "steps": 20, "cfg": 7.0, "model": ["4", 0]}
+
+
+def test_plans_compiled_lazily_once():
+    index = MappingIndex(MAPPINGS)
+    assert index.plans == {}
+    plans = index.plans_for("wf", TEMPLATE)
+    assert set(plans) == {"steps", "cfg"}
+    assert index.plans_for("wf", TEMPLATE) is plans
+
+
+class _Store:
+    def get_workflow(self, workflow_id):
+        return TEMPLATE if workflow_id == "wf" else None
+
+
+def test_compile_all_compiles_every_mapped_workflow():
+    index = MappingIndex({**MAPPINGS, "gone": {"param_mappings": {}}})
+    index.compile_all(_Store())
+    assert set(index.plans) == {"wf"}
+    assert set(index.plans["wf"]) == {"steps", "cfg"}
@@ -0,0 +1,49 @@
+from param_validator import check_input, validate_workflow
+
+STEPS = ["INT", {"default": 20, "min": 1, "max": 100}]
+CFG = ["FLOAT", {"default": 8.0, "min": 0.0, "max": 30.0}]
+TEXT = ["STRING", {"multiline": True}]
+
+
+def _check(value, spec):
+    return check_input("3", "KSampler", "x", value, spec)
+
+
+def test_numeric_strings_are_coerced():
+    assert _check("20", STEPS) is None
+    assert _check(20.0, STEPS) is None
+    assert _check("7.5", CFG) is None
+    assert _check(7, CFG) is None
+
+
+def test_values_become_strings():
+    assert _check(123, TEXT) is None
+    assert _check(1.5, TEXT) is None
+
+
+def test_range_checked_after_coercion():
+    assert "最大值" in _check("200", STEPS)
+    assert "最小值" in _check("0", STEPS)
+
+
+def test_uncoercible_values_rejected():
+    assert "整数" in _check("twenty", STEPS)
+    assert "整数" in _check(None, STEPS)
+    assert "数值" in _check({"a": 1}, CFG)
+
+
+def test_links_and_unknown_types_pass():
+    assert _check(["4", 0], STEPS) is None
+    assert _check("anything", ["LATENT"]) is None
+
+
+def test_validate_workflow_combo_and_required():
+    object_info = {"KSampler": {"input": {"required": {
+        "steps": STEPS,
+        "sampler_name": [["euler", "dpmpp_2m"]],
+    }}}}
+    workflow = {"3": {"class_type": "KSampler", "inputs": {"steps": "30", "sampler_name": "euler"}}}
+    assert validate_workflow(workflow, object_info) == []
+    workflow["3"]["inputs"] = {"sampler_name": "bogus"}
+    errors = validate_workflow(workflow, object_info)
+    assert len(errors) == 2
@@ -0,0 +1,69 @@
+import time
+
+from scheduler import BackendQueue, FairScheduler, ScheduledJob
+
+
+def _job(prompt_id, client_id, priority=1):
+    return ScheduledJob(prompt_id, client_id, "local", priority, {})
+
+
+def _drain(queue):
+    jobs = []
+    while True:
+        job = queue.pop()
+        if job is None:
+            return [job.prompt_id for job in jobs]
+        jobs.append(job)
+
+
+def test_round_robin_between_clients():
+    queue = BackendQueue()
+    for prompt_id in ("a1", "a2", "a3"):
+        queue.push(_job(prompt_id, "a"))
+    for prompt_id in ("b1", "b2"):
+        queue.push(_job(prompt_id, "b"))
+    assert _drain(queue) == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_priority_is_turn_weight():
+    queue = BackendQueue()
+    for prompt_id in ("a1", "a2", "a3"):
+        queue.push(_job(prompt_id, "a", priority=2))
+    for prompt_id in ("b1", "b2"):
+        queue.push(_job(prompt_id, "b"))
+    assert _drain(queue) == ["a1", "a2", "b1", "a3", "b2"]
+
+
+def test_order_matches_pop_without_consuming():
+    queue = BackendQueue()
+    for prompt_id, client_id, priority in [("a1", "a", 1), ("a2", "a", 3), ("b1", "b", 1), ("c1", "c", 2)]:
+        queue.push(_job(prompt_id, client_id, priority))
+    queue.pop()
+    order = [job.prompt_id for job in queue.order()]
+    assert queue.waiting() == 3
+    assert order == _drain(queue)
+
+
+def test_remove_waiting_job():
+    queue = BackendQueue()
+    queue.push(_job("a1", "a"))
+    queue.push(_job("b1", "b"))
+    queue.push(_job("b2", "b"))
+    assert queue.remove("a1").prompt_id == "a1"
+    assert queue.remove("missing") is None
+    assert _drain(queue) == ["b1", "b2"]
+
+
+def test_max_outstanding_and_release():
+    submitted = []
+    scheduler = FairScheduler(lambda job: submitted.append(job.prompt_id) or True, max_outstanding=1)
+    scheduler.enqueue("a1", "a", "local", {})
+    assert scheduler.enqueue("a2", "a", "local", {}) == 0
+    assert scheduler.enqueue("b1", "b", "local", {}) == 1
+    time.sleep(0.05)
+    assert submitted == ["a1"]
+    assert [job.prompt_id for job in scheduler.jobs_ahead("b1")] == ["a2"]
+    scheduler.release("a1")
+    time.sleep(0.05)
+    assert submitted == ["a1", "a2"]
+    assert scheduler.outstanding("local") == 1 and scheduler.waiting("local") == 1
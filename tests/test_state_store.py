@@ -0,0 +1,59 @@
+import time
+
+from state_store import ExpiryHeap, MemoryStateStore, SQLiteStateStore, create_state_store
+
+
+def test_expiry_heap_pops_only_latest_times():
+    heap = ExpiryHeap()
+    heap.touch("a", 10)
+    heap.touch("b", 20)
+    heap.touch("a", 30)
+    assert heap.pop_before(25) == ["b"]
+    assert heap.pop_before(25) == []
+    assert heap.pop_before(31) == ["a"]
+
+
+def test_expiry_heap_discard_and_compaction():
+    heap = ExpiryHeap()
+    for at in range(500):
+        heap.touch("hot", at)
+    heap.touch("gone", 1)
+    heap.discard("gone")
+    assert len(heap.heap) <= 2 * len(heap.times) + 64
+    assert heap.pop_before(1000) == ["hot"]
+
+
+def test_memory_store_expires_tasks():
+    store = MemoryStateStore(task_ttl=0.05)
+    store.set_task("old", {"type": "done", "data": {}, "timestamp": time.time()})
+    time.sleep(0.06)
+    store.set_task("new", {"type": "submitted", "data": {}, "timestamp": time.time()})
+    store.expire_tasks()
+    assert store.get_task("old") is None and store.get_task("new") is not None
+
+
+def test_memory_store_expires_messages_by_index():
+    store = MemoryStateStore(message_ttl=0.05)
+    store.add_message("a", {"n": 1})
+    time.sleep(0.06)
+    store.add_message("a", {"n": 2})
+    store.add_message("b", {"n": 3})
+    assert store.expire_messages() == 1
+    assert [msg["data"]["n"] for msg in store.queues["a"]] == [2]
+    # 只有队首已过期的客户端会被处理
+    assert store.message_expiry.pop_before(time.time() + 1) == ["a", "b"]
+
+
+def test_sqlite_store_refuses_to_modify_cancelled(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    store.set_task("p", {"type": "scheduled", "data": {"client_id": "c"}, "timestamp": time.time()})
+    assert store.update_task("p", "cancelled", {"reason": "user"})
+    assert not store.update_task("p", "progress", {"value": 1})
+    assert store.get_task("p")["type"] == "cancelled"
+
+
+def test_auto_store_persists_for_single_worker(tmp_path):
+    config = {"state_db": str(tmp_path / "state.db")}
+    assert isinstance(create_state_store(config, workers=1), SQLiteStateStore)
+    assert isinstance(create_state_store({**config, "state_store": "memory"}, workers=1), MemoryStateStore)
+    assert isinstance(create_state_store({**config, "state_store": "memory"}, workers=2), SQLiteStateStore)
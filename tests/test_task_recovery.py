@@ -0,0 +1,57 @@
+import time
+
+import task_recovery
+from state_store import MemoryStateStore
+
+BACKEND = "http://local"
+
+
+def _store(*tasks):
+    store = MemoryStateStore()
+    for prompt_id, data in tasks:
+        store.set_task(prompt_id, {"type": "submitted", "data": {"backend": BACKEND, **data}, "timestamp": time.time()})
+    return store
+
+
+def _reconcile(monkeypatch, store, running=(), pending=(), history=None):
+    history = history or {}
+    monkeypatch.setattr(task_recovery, "fetch_queue", lambda backend: (set(running), set(pending)))
+    monkeypatch.setattr(task_recovery, "fetch_history", lambda backend, prompt_id: history.get(prompt_id))
+    sent = []
+    tasks = task_recovery.pending_tasks(store)[BACKEND]
+    summary = task_recovery.reconcile_backend(store, lambda client_id, msg: sent.append((client_id, msg)), BACKEND, tasks)
+    return summary, sent
+
+
+def test_running_queued_and_lost(monkeypatch):
+    store = _store(("run", {"client_id": "c"}), ("wait", {"client_id": "c"}), ("gone", {"client_id": "c"}))
+    summary, sent = _reconcile(monkeypatch, store, running=["run"], pending=["wait"])
+    assert summary == {"running": 1, "queued": 1, "done": 0, "error": 0, "lost": 1}
+    assert store.get_task("run")["type"] == "executing"
+    assert store.get_task("wait")["type"] == "queued"
+    assert store.get_task("gone")["type"] == "error"
+    assert [msg["type"] for _, msg in sent] == ["execution_error"]
+
+
+def test_done_batch_member_gets_its_share(monkeypatch):
+    store = _store(
+        ("batch", {"batch_members": [["m1", "c1", 0, 1], ["m2", "c2", 1, 1]]}),
+        ("m2", {"client_id": "c2", "batch_id": "batch", "batch_index": 1, "batch_count": 1, "batch_total": 2}),
+    )
+    history = {"batch": {"status": {"status_str": "success"}, "outputs": {"9": {"images": ["a.png", "b.png"]}}}}
+    summary, sent = _reconcile(monkeypatch, store, history=history)
+    assert summary["done"] == 1
+    assert store.get_task("m2")["type"] == "done"
+    executed = [msg for _, msg in sent if msg["type"] == "executed"]
+    assert executed[0]["data"]["output"] == {"images": ["b.png"]}
+    assert sent[-1][1]["data"]["node"] is None
+
+
+def test_history_error(monkeypatch):
+    store = _store(("p", {"client_id": "c"}))
+    history = {"p": {"status": {"status_str": "error", "messages": [
+        ["execution_error", {"exception_message": "boom", "node_id": "3"}],
+    ]}}}
+    summary, sent = _reconcile(monkeypatch, store, history=history)
+    assert summary["error"] == 1
+    assert sent[0][1]["data"]["exception_message"] == "boom"
@@ -0,0 +1,66 @@
+import os
+import json
+
+from payload_container import write_container, ensure_container, is_container, PayloadContainer
+from workflow_store import WorkflowStore, WorkflowCatalog
+
+
+def _entries(version, workflows):
+    entries = {f"workflows/{name}.json": json.dumps(wf).encode("utf-8") for name, wf in workflows.items()}
+    entries["version.txt"] = version.encode("utf-8")
+    return entries
+
+
+def test_old_catalog_reads_after_reload(tmp_path):
+    path = str(tmp_path / "payload.hypk")
+    write_container(path, _entries("1", {"a": {"1": {"class_type": "KSampler"}}}), version="1")
+    old = WorkflowCatalog(WorkflowStore.from_payload(path), {}, None)
+
+    # 更新写入新容器（条目偏移全部变化）后重新加载
+    write_container(path, _entries("2", {"a": {"9": {"class_type": "Other"}}, "b": {}}), version="2")
+    new = WorkflowCatalog(WorkflowStore.from_payload(path), {}, None)
+
+    assert old.store.get_workflow("a") == {"1": {"class_type": "KSampler"}}
+    assert new.store.get_workflow("a") == {"9": {"class_type": "Other"}}
+    assert "b" not in old.store and "b" in new.store
+
+
+def test_ensure_container_leaves_source(tmp_path):
+    source = str(tmp_path / "payload.b64")
+    target = str(tmp_path / "payload.hypk")
+    write_container(source, _entries("1", {"a": {}}), version="1")
+    before = open(source, "rb").read()
+
+    assert ensure_container(source, target)
+    assert not ensure_container(source, target)
+    assert open(source, "rb").read() == before
+    assert is_container(target)
+    assert WorkflowStore.from_payload(target).get_workflow("a") == {}
+
+
+def test_ensure_container_decides_on_source_hash(tmp_path):
+    source = str(tmp_path / "payload.b64")
+    target = str(tmp_path / "payload.hypk")
+    write_container(source, _entries("1", {"a": {}}), version="1")
+    assert ensure_container(source, target)
+
+    # 更新写入更新的容器（沿用 source_sha256），重新安装同一个 payload 后不覆盖
+    origin = PayloadContainer(target).source_sha256
+    write_container(target, _entries("2", {"a": {"n": 1}}), version="2", source_sha256=origin)
+    os.utime(source, (os.path.getmtime(target) + 60,) * 2)
+    assert not ensure_container(source, target)
+    assert PayloadContainer(target).version == "2"
+
+    # 分发的 payload 内容变化时重新转换
+    write_container(source, _entries("3", {"a": {}}), version="3")
+    assert ensure_container(source, target)
+    assert PayloadContainer(target).version == "3"
+
+
+def test_container_reads_entries_on_demand(tmp_path):
+    path = str(tmp_path / "payload.hypk")
+    write_container(path, _entries("1", {"a": {"x": 1}, "b": {"y": 2}}), version="1")
+    container = PayloadContainer(path)
+    assert not hasattr(container, "data")
+    assert container.file.tell() == container.data_start
+    assert json.loads(container.read("workflows/b.json")) == {"y": 2}
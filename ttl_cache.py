@@ -0,0 +1,86 @@
+# ttl_cache.py
+"""
+带过期时间的缓存，附带 single-flight：同一个键并发未命中时只执行一次加载，
+其余调用等待并共享结果（包括异常）。
+"""
+import time
+from threading import Lock, Event
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.flights = {}
+        self.lock = Lock()
+        # clear() 之前开始的加载结果不再写入缓存
+        self.generation = 0
+
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.time():
+            self.entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                now = time.time()
+                for stale in [k for k, (exp, _) in self.entries.items() if exp < now]:
+                    del self.entries[stale]
+                if len(self.entries) >= self.max_entries:
+                    self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def get_or_load(self, key, loader, cacheable=None):
+        """Return the cached value or run loader() once for all concurrent callers of the same key.
+
+        cacheable(value) decides whether a loaded value is stored; exceptions are never cached."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            flight = self.flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self.flights[key] = _Flight()
+            generation = self.generation
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            if self.ttl > 0 and (cacheable is None or cacheable(flight.value)) and generation == self.generation:
+                self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
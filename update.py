@@ -1,18 +1,35 @@
 import os
+import json
+import time
 import requests
 import base64
+import hashlib
+from threading import Thread
 from Crypto.Cipher import AES
-import io, zipfile
+
+from payload_container import (
+    PayloadContainer, open_payload, read_source_sha256, write_container,
+)
 
 BASE_URL = "https://pub-35bf041400df49f594c852a1ca8489db.r2.dev/hueying-workflows-update"
 PAYLOAD_URL = f"{BASE_URL}/payload.b64"
 VERSION_URL = f"{BASE_URL}/version.txt"
+# 增量更新：manifest 列出每个文件的 sha256，单个文件位于 files/<name>.b64
+MANIFEST_URL = f"{BASE_URL}/manifest.json"
+FILES_URL = f"{BASE_URL}/files"
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 VERSION_FILE = os.path.join(SCRIPT_DIR, 'version.txt')
+# 随程序分发的 payload（可能是旧版整包格式），只读不改
 PAYLOAD_FILE = os.path.join(SCRIPT_DIR, 'payload.b64')
+# 运行时使用的索引容器，由 PAYLOAD_FILE 转换或由更新直接写入
+CONTAINER_FILE = os.path.join(SCRIPT_DIR, 'payload.hypk')
+UPDATE_STATE_FILE = os.path.join(SCRIPT_DIR, 'update_state.json')
 KEY = b"1234567890abcdef"
 
+# 后台检查间隔（秒）
+CHECK_INTERVAL = 1800
+
 
 def decrypt(data: bytes, key: bytes) -> bytes:
     nonce, tag, ciphertext = data[:16], data[16:32], data[32:]
@@ -20,6 +37,10 @@ def decrypt(data: bytes, key: bytes) -> bytes:
     return cipher.decrypt_and_verify(ciphertext, tag)
 
 
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
 def get_local_version():
     if os.path.exists(VERSION_FILE):
         try:
@@ -51,39 +72,178 @@ def fetch_remote_version():
     return None
 
 
-def verify_payload(data: bytes, expected_version: str) -> bool:
+def load_update_state() -> dict:
+    """读取上次检查时记录的 ETag / Last-Modified"""
+    if os.path.exists(UPDATE_STATE_FILE):
+        try:
+            with open(UPDATE_STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"❌ 读取更新状态失败: {e}")
+    return {}
+
+
+def save_update_state(state: dict):
+    try:
+        with open(UPDATE_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        print(f"❌ 写入更新状态失败: {e}")
+
+
+def fetch_remote_version_conditional(state: dict):
+    """Conditional GET on version.txt.
+
+    Returns (version, validators). version is None when the server answered
+    304 or the request failed; validators holds the ETag / Last-Modified of a
+    200 response so the caller can persist them once the update is applied."""
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    try:
+        r = requests.get(VERSION_URL, headers=headers, timeout=10)
+        if r.status_code == 304:
+            return None, {}
+        if r.status_code == 200:
+            validators = {
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+            }
+            return r.text.strip(), validators
+        print(f"❌ 获取远程版本失败: 状态码 {r.status_code}")
+    except Exception as e:
+        print(f"❌ 获取远程版本异常: {e}")
+    return None, {}
+
+
+def verify_payload(path: str, expected_version: str) -> bool:
+    """Authenticate every entry of a downloaded payload and check its version."""
     try:
-        decrypted = decrypt(base64.b64decode(data), KEY)
-        with zipfile.ZipFile(io.BytesIO(decrypted)) as zf:
-            for name in zf.namelist():
-                if name.endswith('version.txt'):
-                    with zf.open(name) as f:
-                        found = f.read().decode('utf-8').strip()
-                    return found == expected_version
+        payload = open_payload(path, KEY)
+        payload.read_all()
+        found = payload.version
+        if found is None and 'version.txt' in payload.entries:
+            found = payload.read('version.txt').decode('utf-8').strip()
+        return found == expected_version
     except Exception as e:
         print(f"❌ 校验更新包失败: {e}")
     return False
 
 
+def install_payload(download_path: str):
+    """Write a verified download into place as the container, converting the legacy blob if needed.
+
+    The new container keeps the source_sha256 of the one it replaces, so startup does not
+    rebuild it from the older shipped payload."""
+    origin = read_source_sha256(CONTAINER_FILE)
+    payload = open_payload(download_path, KEY)
+    if isinstance(payload, PayloadContainer):
+        # 密文块原样复制，无需解密
+        try:
+            write_container(CONTAINER_FILE, dict.fromkeys(payload.entries), payload.version, payload, origin, KEY)
+        finally:
+            payload.close()
+    else:
+        write_container(CONTAINER_FILE, payload.read_all(), payload.version, source_sha256=origin, key=KEY)
+    os.remove(download_path)
+
+
 def download_payload(version: str) -> bool:
     """Download payload.b64 and update local version file."""
+    download_path = CONTAINER_FILE + '.download'
     try:
         r = requests.get(PAYLOAD_URL, timeout=10)
         if r.status_code == 200:
-            if verify_payload(r.content, version):
-                with open(PAYLOAD_FILE, 'wb') as f:
-                    f.write(r.content)
+            with open(download_path, 'wb') as f:
+                f.write(r.content)
+            if verify_payload(download_path, version):
+                install_payload(download_path)
                 write_local_version(version)
-                print('✅ 已完成更新，重启程序后生效')
+                print('✅ 已完成更新')
                 return True
             print('❌ 更新包校验失败')
         else:
             print(f"❌ 下载更新包失败: 状态码 {r.status_code}")
     except Exception as e:
         print(f"❌ 下载更新包异常: {e}")
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
     return False
 
 
+def read_payload_entries(path=CONTAINER_FILE) -> dict:
+    """Decrypt every entry of the local payload into {relative name: bytes}."""
+    return open_payload(path, KEY).read_all()
+
+
+def fetch_remote_manifest():
+    try:
+        r = requests.get(MANIFEST_URL, timeout=10)
+        if r.status_code == 200:
+            return r.json()
+        print(f"ℹ️ 远程清单不可用: 状态码 {r.status_code}")
+    except Exception as e:
+        print(f"❌ 获取远程清单异常: {e}")
+    return None
+
+
+def download_entry(name: str, expected_sha256: str) -> bytes:
+    """Download and verify a single encrypted entry from files/<name>.b64."""
+    r = requests.get(f"{FILES_URL}/{name}.b64", timeout=10)
+    if r.status_code != 200:
+        raise RuntimeError(f"下载 {name} 失败: 状态码 {r.status_code}")
+    content = decrypt(base64.b64decode(r.content), KEY)
+    if sha256_hex(content) != expected_sha256:
+        raise RuntimeError(f"{name} 校验失败")
+    return content
+
+
+def download_delta(version: str) -> bool:
+    """Update the local payload by fetching only entries whose hash changed.
+
+    Returns False when no usable manifest exists so the caller can fall back
+    to the full payload download."""
+    manifest = fetch_remote_manifest()
+    if not manifest or manifest.get('version') != version or not os.path.exists(CONTAINER_FILE):
+        return False
+    try:
+        # 容器索引自带每个条目的 sha256，比较哈希无需解密
+        local = open_payload(CONTAINER_FILE, KEY)
+        remote_files = manifest.get('files', {})
+
+        entries = {}
+        changed = []
+        for name, meta in remote_files.items():
+            if name in local.entries and local.sha256(name) == meta['sha256']:
+                # 未变化的条目直接复制密文块
+                entries[name] = None if isinstance(local, PayloadContainer) else local.read(name)
+            else:
+                changed.append(name)
+        removed = [name for name in local.entries if name not in remote_files and name != 'version.txt']
+        print(f"📦 增量更新: {len(changed)} 个文件变更, {len(removed)} 个文件移除")
+
+        for name in changed:
+            entries[name] = download_entry(name, remote_files[name]['sha256'])
+        entries['version.txt'] = version.encode('utf-8')
+
+        write_container(CONTAINER_FILE, entries, version=version, source=local,
+                        source_sha256=local.source_sha256, key=KEY)
+        write_local_version(version)
+        print('✅ 已完成增量更新')
+        return True
+    except Exception as e:
+        print(f"❌ 增量更新失败: {e}")
+        return False
+
+
+def apply_update(version: str) -> bool:
+    """Prefer the manifest delta, fall back to the full payload.b64 download."""
+    return download_delta(version) or download_payload(version)
+
+
 def auto_update_if_needed() -> bool:
     """Check remote version and update payload if needed.
 
@@ -92,11 +252,54 @@ def auto_update_if_needed() -> bool:
     remote_version = fetch_remote_version()
     print(f"📦 当前本地版本: {local_version}")
     if not remote_version:
-        return os.path.exists(PAYLOAD_FILE)
+        return os.path.exists(CONTAINER_FILE)
     if not local_version or local_version < remote_version:
         print(f"📡 检测到新版本: {remote_version}, 开始下载...")
-        if not download_payload(remote_version):
+        if not apply_update(remote_version):
             print('❌ 更新失败，继续使用本地版本')
     else:
         print('✅ 当前已是最新版本')
-    return os.path.exists(PAYLOAD_FILE)
+    return os.path.exists(CONTAINER_FILE)
+
+
+def check_for_update() -> bool:
+    """One non-blocking-friendly update round.
+
+    Returns True when a new payload was downloaded and written to disk."""
+    state = load_update_state()
+    remote_version, validators = fetch_remote_version_conditional(state)
+    if not remote_version:
+        return False
+
+    local_version = get_local_version()
+    updated = False
+    if not local_version or local_version < remote_version:
+        print(f"📡 检测到新版本: {remote_version}, 开始下载...")
+        updated = apply_update(remote_version)
+        if not updated:
+            # 不保存校验器，下次仍按新版本重新下载
+            print('❌ 更新失败，继续使用本地版本')
+            return False
+
+    state.update({k: v for k, v in validators.items() if v})
+    state['checked_at'] = time.time()
+    save_update_state(state)
+    return updated
+
+
+def start_background_update_check(on_update=None, interval=CHECK_INTERVAL, initial_delay=5):
+    """Poll version.txt in a daemon thread and call on_update() after a new payload lands."""
+
+    def loop():
+        time.sleep(initial_delay)
+        while True:
+            try:
+                if check_for_update() and on_update:
+                    on_update()
+            except Exception as e:
+                print(f"❌ 后台更新检查异常: {e}")
+            time.sleep(interval)
+
+    thread = Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,93 @@
+# workers.py
+"""
+多 worker 监听：POSIX 下 fork 出多个进程，每个进程各跑一个 gevent WSGIServer，
+有 SO_REUSEPORT 时各自绑定同一端口由内核分发连接，否则父进程先绑定再 fork 共享监听套接字。
+Windows 没有 fork，退回单进程。worker 0 是父进程，负责 ComfyUI 监听等只应运行一份的后台任务。
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import atexit
+import logging
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+
+def effective_workers(requested):
+    """Number of workers that can actually run on this platform."""
+    try:
+        requested = int(requested or 1)
+    except (TypeError, ValueError):
+        requested = 1
+    if requested > 1 and not hasattr(os, "fork"):
+        logger.warning("⚠️ 当前系统不支持 fork，多 worker 模式退回单进程")
+        return 1
+    return max(1, requested)
+
+
+def make_listener(host, port, reuse_port=False, backlog=1024):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def _watch_parent(parent_pid, interval=2):
+    # 父进程退出后子进程随之退出，避免遗留孤儿 worker 占用端口
+    while True:
+        time.sleep(interval)
+        if os.getppid() != parent_pid:
+            os._exit(0)
+
+
+def fork_workers(host, port, workers):
+    """Fork workers-1 children; returns (worker_index, listening socket) in every process.
+
+    With a single worker nothing is bound here and (0, None) is returned."""
+    if workers <= 1:
+        return 0, None
+
+    reuse_port = hasattr(socket, "SO_REUSEPORT")
+    shared = None if reuse_port else make_listener(host, port)
+    parent_pid = os.getpid()
+    children = []
+    index = 0
+    for i in range(1, workers):
+        pid = os.fork()
+        if pid == 0:
+            index = i
+            children = []
+            break
+        children.append(pid)
+
+    listener = shared or make_listener(host, port, reuse_port=True)
+
+    if index == 0:
+        def stop_children(*_):
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+        atexit.register(stop_children)
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def on_sigterm(signum, frame):
+            stop_children()
+            if callable(previous):
+                previous(signum, frame)
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, on_sigterm)
+        logger.info(f"🧵 已启动 {workers} 个 worker（{'SO_REUSEPORT' if reuse_port else '共享监听套接字'}）")
+    else:
+        Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+
+    return index, listener
@@ -0,0 +1,87 @@
+# workflow_store.py
+"""
+内存工作流仓库：启动时只读取 payload 索引和 workflow_mappings.json，
+工作流模板在首次被请求时才从容器中解密解析，之后常驻内存，提交请求不再读写磁盘。
+"""
+import json
+import logging
+
+from update import CONTAINER_FILE, KEY
+from payload_container import open_payload
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_PREFIX = "workflows/"
+MAPPINGS_NAME = "workflow_mappings.json"
+
+
+def _workflow_name(workflow_id):
+    return f"{WORKFLOW_PREFIX}{workflow_id}.json"
+
+
+class WorkflowStore:
+    def __init__(self, payload=None, mappings=None, version=None):
+        self.payload = payload
+        self.workflows = {}
+        self.mappings = mappings or {}
+        self.workflow_mappings = self.mappings.get("workflow_mappings", {})
+        self.version = version
+
+    @classmethod
+    def from_payload(cls, path=CONTAINER_FILE):
+        payload = open_payload(path, KEY)
+        mappings = {}
+        if MAPPINGS_NAME in payload.entries:
+            try:
+                mappings = json.loads(payload.read(MAPPINGS_NAME).decode("utf-8"))
+            except json.JSONDecodeError as e:
+                logger.error(f"🔥 映射 JSON 语法错误: {e.msg}，位置：行{e.lineno}列{e.colno}")
+        store = cls(payload, mappings, payload.version)
+        logger.info(f"✅ 内存工作流索引完成，工作流: {len(store.workflow_ids())}，映射: {len(store.workflow_mappings)}")
+        return store
+
+    def workflow_ids(self):
+        if self.payload is None:
+            return []
+        return [
+            name[len(WORKFLOW_PREFIX):-len(".json")]
+            for name in self.payload.names()
+            if name.startswith(WORKFLOW_PREFIX) and name.endswith(".json")
+        ]
+
+    def get_workflow(self, workflow_id):
+        workflow = self.workflows.get(workflow_id)
+        if workflow is not None:
+            return workflow
+        name = _workflow_name(workflow_id)
+        if self.payload is None or name not in self.payload.entries:
+            return None
+        try:
+            workflow = json.loads(self.payload.read(name).decode("utf-8"))
+        except Exception as e:
+            logger.error(f"❌ 工作流解析失败 {workflow_id}: {e}")
+            return None
+        self.workflows[workflow_id] = workflow
+        return workflow
+
+    def __contains__(self, workflow_id):
+        return self.payload is not None and _workflow_name(workflow_id) in self.payload.entries
+
+
+class WorkflowCatalog:
+    """One consistent set of store, mappings and compiled mapping index.
+
+    The proxy swaps the whole catalog on reload; a commit takes a reference at its start and
+    keeps using it even if a newer catalog is installed meanwhile."""
+
+    __slots__ = ("store", "mappings", "mapping_index", "workflow_cache", "sources", "loaded_at")
+
+    def __init__(self, store, mappings, mapping_index, sources=None, loaded_at=None):
+        self.store = store
+        self.mappings = mappings
+        self.mapping_index = mapping_index
+        # workflow_dir 中用户自行放置的工作流，随目录内容变化整体失效
+        self.workflow_cache = {}
+        # 构建时各监视文件的签名，用于判断是否需要重新加载
+        self.sources = sources or {}
+        self.loaded_at = loaded_at
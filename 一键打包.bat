@@ -14,6 +14,26 @@ npx --prefix electron_app electron-packager ./electron_app HueyingDesktop --plat
 xcopy main.py dist\HueyingDesktop-win32-x64 /Y
 xcopy payload.b64 dist\HueyingDesktop-win32-x64 /Y
 xcopy update.py dist\HueyingDesktop-win32-x64 /Y
+xcopy main_payload.py dist\HueyingDesktop-win32-x64 /Y
+xcopy workflow_store.py dist\HueyingDesktop-win32-x64 /Y
+xcopy payload_container.py dist\HueyingDesktop-win32-x64 /Y
+xcopy mapping_index.py dist\HueyingDesktop-win32-x64 /Y
+xcopy object_info_cache.py dist\HueyingDesktop-win32-x64 /Y
+xcopy param_validator.py dist\HueyingDesktop-win32-x64 /Y
+xcopy circuit_breaker.py dist\HueyingDesktop-win32-x64 /Y
+xcopy health_probe.py dist\HueyingDesktop-win32-x64 /Y
+xcopy ttl_cache.py dist\HueyingDesktop-win32-x64 /Y
+xcopy cloud_proxy.py dist\HueyingDesktop-win32-x64 /Y
+xcopy log_pipeline.py dist\HueyingDesktop-win32-x64 /Y
+xcopy log_index.py dist\HueyingDesktop-win32-x64 /Y
+xcopy metrics.py dist\HueyingDesktop-win32-x64 /Y
+xcopy file_watcher.py dist\HueyingDesktop-win32-x64 /Y
+xcopy state_store.py dist\HueyingDesktop-win32-x64 /Y
+xcopy workers.py dist\HueyingDesktop-win32-x64 /Y
+xcopy task_recovery.py dist\HueyingDesktop-win32-x64 /Y
+xcopy scheduler.py dist\HueyingDesktop-win32-x64 /Y
+xcopy batch_coalescer.py dist\HueyingDesktop-win32-x64 /Y
+xcopy eta.py dist\HueyingDesktop-win32-x64 /Y
 
 ECHO 打包完成，文件位于 dist\HueyingDesktop-win32-x64
 pause